@@ -1,23 +1,82 @@
+import argparse
+import os
 import sys
-from typing import Optional
-from replica_api import app
+from typing import Optional, Tuple
+import uvicorn
 
 
-def start(url: Optional[str]=None):
+APPLICATION = 'project.asgi:application'
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+
+def parse_url(url: Optional[str]) -> Tuple[str, int]:
     host, port = '0.0.0.0', 80
 
     if url:
         host, port = url.split(':')
 
-    app.run(host=host, port=int(port), dev=True, fast=False)
+    return host, int(port)
+
+
+def start(url: Optional[str]=None):
+    """Serve the API from a single process reloaded on code changes."""
+    host, port = parse_url(url)
+
+    uvicorn.run(APPLICATION, host=host, port=port, app_dir=APP_DIR,
+        reload=True, lifespan='on')
+
+
+def serve(*options: str):
+    """Serve the API from worker processes tuned for production.
+
+    On SIGTERM the workers answer not ready for READINESS_DRAIN_SECONDS,
+    then stop accepting connections, finish the requests in flight for up
+    to the graceful timeout and run the lifespan shutdown, which flushes
+    the Kafka producers and closes the pooled connections.
+    """
+    parser = argparse.ArgumentParser(prog='app.py serve')
+    parser.add_argument('url', nargs='?', help='host:port')
+    parser.add_argument('--workers', type=int,
+        default=int(os.getenv('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--loop', choices=['auto', 'asyncio', 'uvloop'],
+        default=os.getenv('WEB_LOOP', 'uvloop'))
+    parser.add_argument('--http', choices=['auto', 'h11', 'httptools'],
+        default=os.getenv('WEB_HTTP', 'httptools'))
+    parser.add_argument('--keep-alive', type=int,
+        default=int(os.getenv('WEB_KEEP_ALIVE', '75')),
+        help='seconds an idle connection is kept open, above the idle '
+            'timeout of the load balancer')
+    parser.add_argument('--backlog', type=int,
+        default=int(os.getenv('WEB_BACKLOG', '2048')))
+    parser.add_argument('--limit-concurrency', type=int,
+        default=int(os.getenv('WEB_LIMIT_CONCURRENCY', '0')) or None)
+    parser.add_argument('--graceful-timeout', type=int,
+        default=int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30')))
+    parser.add_argument('--app-dir', default=APP_DIR)
+    args = parser.parse_args(options)
+
+    host, port = parse_url(args.url)
+
+    uvicorn.run(APPLICATION, host=host, port=port, app_dir=args.app_dir,
+        workers=args.workers, loop=args.loop, http=args.http,
+        timeout_keep_alive=args.keep_alive, backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        timeout_graceful_shutdown=args.graceful_timeout, lifespan='on',
+        access_log=False, proxy_headers=True)
 
 
 def main(argv):
     match argv:
+        case ['start']:
+            start()
         case ['start', url]:
             start(url)
+        case ['serve', *options]:
+            serve(*options)
+        case _:
+            sys.exit('usage: app.py start [host:port] | '
+                'serve [host:port] [options]')
 
 
 if __name__ == '__main__':
     main(sys.argv[1:])
-
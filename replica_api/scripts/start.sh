@@ -0,0 +1,14 @@
+#!/bin/bash
+while getopts app: flag
+do
+    case "${flag}" in
+        app) app=${OPTARG};;
+    esac
+done
+
+if [ -z $app ] 
+then
+    app="app"
+fi
+
+python3 /usr/src/bin/app.py serve "0.0.0.0:80" --app-dir "/usr/src/$app"
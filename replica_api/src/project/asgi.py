@@ -14,3 +14,21 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_asgi_application()
+
+from replica_api.connector_status import start_connector_status
+from replica_api.health import Lifespan, readiness
+from replica_api.kafka_consumer import start_consumer
+from replica_api.logical_source import start_source
+from replica_api.outbox import start_relay
+from replica_api.poll_controller import start_poll_controller
+
+start_consumer()
+start_relay()
+start_source()
+start_connector_status()
+start_poll_controller()
+
+# the server drives the warm up and the shutdown through the lifespan
+# events, the drain starts on SIGTERM
+application = Lifespan(application, startup=[readiness.start],
+    shutdown=[readiness.stop])
@@ -9,15 +9,13 @@ https://docs.djangoproject.com/en/4.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
+import json
 import os
 import sys
 from pathlib import Path
 from distutils.util import strtobool
 from st1_sqlalchemy import DatabaseManager, DatabaseServer
-from st1_kafka_api import KafkaAPI
-from st1_kafka_api.ksql import KSQL
-from st1_kafka_api.connect import Connect
-from st1_kafka_api.schema_registry import SchemaRegistry
+from replica_api.kafka_api import KafkaAPI, KSQL, Connect, SchemaRegistry
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'replica_api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -122,13 +121,161 @@ SQLALCHEMY_DATABASES = DatabaseManager(
 
 
 # Kafka
+# Connection pool, timeout, retry and concurrency settings shared by the
+# Connect, ksqlDB and Schema Registry REST clients
+KAFKA_API_TRANSPORT = {
+    'timeout': float(os.getenv('KAFKA_API_TIMEOUT', '10')),
+    'max_connections': int(os.getenv('KAFKA_API_MAX_CONNECTIONS', '20')),
+    'max_keepalive_connections': int(os.getenv('KAFKA_API_MAX_KEEPALIVE',
+        '10')),
+    'http2': bool(strtobool(os.getenv('KAFKA_API_HTTP2', 'true'))),
+    'max_concurrency': int(os.getenv('KAFKA_API_MAX_CONCURRENCY', '20')),
+    'retries': int(os.getenv('KAFKA_API_RETRIES', '3')),
+}
+
 KAFKA_API = KafkaAPI(
     bootstrap_servers=os.getenv('KAFKA_BOOTSTRAP_SERVERS'),
-    connect = Connect(url=os.getenv('CONNECT_URL')),
-    ksql = KSQL(url=os.getenv('KSQL_URL')),
-    schema_registry = SchemaRegistry(url=os.getenv('SCHEMA_REGISTRY_URL')),
+    connect = Connect(url=os.getenv('CONNECT_URL'), **KAFKA_API_TRANSPORT),
+    ksql = KSQL(url=os.getenv('KSQL_URL'), **KAFKA_API_TRANSPORT),
+    schema_registry = SchemaRegistry(url=os.getenv('SCHEMA_REGISTRY_URL'),
+        **KAFKA_API_TRANSPORT),
 )
 
+# Target assignments are produced straight to the topic behind the
+# "replica_trg_tbl" KSQL table
+TARGET_TOPIC = os.getenv('TARGET_TOPIC', 'replica_trg')
+
+KAFKA_PRODUCER = {
+    # the key to partition mapping of the Java clients (source connector,
+    # ksqlDB), the joins need every writer to agree on it
+    'partitioner': 'murmur2_random',
+    'acks': 'all',
+    'enable.idempotence': True,
+    'linger.ms': int(os.getenv('KAFKA_PRODUCER_LINGER_MS', '5')),
+    'batch.num.messages': int(os.getenv('KAFKA_PRODUCER_BATCH_SIZE',
+        '10000')),
+    'compression.type': os.getenv('KAFKA_PRODUCER_COMPRESSION', 'lz4'),
+}
+
+
+# Source
+# Account changes reach the source topic through the JDBC source connector
+# polling the account table ("connector"), through the outbox written in
+# the same transaction as the change and published by a relay ("outbox"),
+# or streamed from the logical replication of the account table ("logical")
+SOURCE_MODE = os.getenv('SOURCE_MODE', 'connector')
+
+# Tables replicated along with the accounts by the source connector, as a
+# JSON list of tables (name, key_column, account_column), they share the
+# last_change_id and last_modified columns of the accounts
+SOURCE_TABLES = json.loads(os.getenv('SOURCE_TABLES', '[]'))
+
+OUTBOX_RELAY = {
+    'batch_size': int(os.getenv('OUTBOX_BATCH_SIZE', '500')),
+    # the relay is woken up by the changes committed in its own process,
+    # this only bounds the delay of changes committed by other processes
+    'idle_interval': float(os.getenv('OUTBOX_IDLE_INTERVAL', '0.5')),
+}
+
+# Adapts poll.interval.ms of the source connector to the change rate
+POLL_CONTROLLER = {
+    'enabled': bool(strtobool(os.getenv('POLL_CONTROLLER', 'false'))),
+    'min_interval_ms': int(os.getenv('POLL_MIN_INTERVAL_MS', '200')),
+    'max_interval_ms': int(os.getenv('POLL_MAX_INTERVAL_MS', '60000')),
+    # the changes let accumulate between two polls
+    'target_changes': float(os.getenv('POLL_TARGET_CHANGES', '1')),
+    'hysteresis': float(os.getenv('POLL_HYSTERESIS', '2')),
+    # every change restarts the connector tasks
+    'cooldown': float(os.getenv('POLL_COOLDOWN', '60')),
+}
+
+# Requires wal_level=logical on the source database and a user with the
+# REPLICATION attribute
+LOGICAL_REPLICATION = {
+    'dsn': {
+        'host': os.getenv('DB_HOST'),
+        'port': int(os.getenv('DB_PORT', '5432')),
+        'dbname': os.getenv('DB_NAME'),
+        'user': os.getenv('DB_USERNAME'),
+        'password': os.getenv('DB_PASSWORD'),
+    },
+    'slot_name': os.getenv('LOGICAL_SLOT_NAME', 'replica_src'),
+    'publication': os.getenv('LOGICAL_PUBLICATION', 'replica_src'),
+    'batch_size': int(os.getenv('LOGICAL_BATCH_SIZE', '1000')),
+    'batch_timeout': float(os.getenv('LOGICAL_BATCH_TIMEOUT', '0.05')),
+}
+
+
+# Topology
+# The source and target topics are joined on the account ID so they always
+# share the same partition count
+TOPOLOGY_PARTITIONS = int(os.getenv('TOPOLOGY_PARTITIONS', '1'))
+
+SINK_TASKS_MAX = int(os.getenv('SINK_TASKS_MAX', '1'))
+
+# Tuning profile of new sink connectors: low-latency, balanced or bulk
+SINK_PROFILE = os.getenv('SINK_PROFILE', 'balanced')
+
+# Consumer groups of the persistent KSQL queries are named after the
+# ksql.service.id of the ksqlDB server
+KSQL_SERVICE_ID = os.getenv('KSQL_SERVICE_ID', 'default_')
+
+# Sink KSQL tables each join the targets with the accounts ("join"), or
+# filter a single join shared by every sink ("shared")
+SINK_ROUTING = os.getenv('SINK_ROUTING', 'join')
+
+
+# Connector status aggregator
+CONNECTOR_STATUS = {
+    # seconds between two polls of the connector and task states
+    'interval': float(os.getenv('CONNECTOR_STATUS_INTERVAL', '5')),
+    'concurrency': int(os.getenv('CONNECTOR_STATUS_CONCURRENCY', '8')),
+    # restart the failed tasks of the connectors
+    'auto_restart': bool(strtobool(os.getenv('CONNECTOR_AUTO_RESTART',
+        'false'))),
+    # a task failing again is restarted with an exponential backoff, then
+    # left failed; every worker process restarts on its own
+    'max_restarts': int(os.getenv('CONNECTOR_MAX_RESTARTS', '5')),
+}
+
+
+# Replica status continuum events
+STATUS_TOPIC = os.getenv('STATUS_TOPIC', 'replica_status')
+
+SOURCE_LABEL = 'replica_src'
+
+
+# Read replicas
+# The sinks account reads may be routed to, as a JSON list of sinks
+# (db_hostname, db_port, db_name, db_table, db_user, db_password), reads
+# stay on the source database when empty
+READ_REPLICAS = json.loads(os.getenv('READ_REPLICAS', '[]'))
+
+READ_REPLICA_POOL_SIZE = int(os.getenv('READ_REPLICA_POOL_SIZE', '4'))
+
+
+# Cache
+ACCOUNT_CACHE = {
+    'max_size': int(os.getenv('ACCOUNT_CACHE_SIZE', '10000')),
+    # the shared tier is optional, e.g. redis://redis:6379/1
+    'redis_url': os.getenv('ACCOUNT_CACHE_REDIS_URL') or None,
+    'ttl': int(os.getenv('ACCOUNT_CACHE_TTL', '300')),
+}
+
+
+# Readiness
+# A process only reports ready once it warmed up its database connections,
+# Kafka producers and REST clients
+READINESS = {
+    'db_connections': int(os.getenv('READINESS_DB_CONNECTIONS', '4')),
+    # seconds given to every warm up check
+    'timeout': float(os.getenv('READINESS_TIMEOUT', '10')),
+    'retry_interval': float(os.getenv('READINESS_RETRY_INTERVAL', '2')),
+    # seconds answering not ready after SIGTERM before the server stops
+    # accepting connections, above the period of the readiness probe
+    'drain_seconds': float(os.getenv('READINESS_DRAIN_SECONDS', '5')),
+}
+
 
 # Logging
 # noinspection SpellCheckingInspection
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class ReplicaApiConfig(AppConfig):
     name = 'replica_api'
+
+    def ready(self):
+        from replica_api.kafka_consumer import add_status_listener
+        from replica_api.lag import lag_index
+        from replica_api.models.accounts import invalidate_on_change
+        from replica_api.poll_controller import poll_controller
+
+        add_status_listener(invalidate_on_change)
+        add_status_listener(lag_index.on_status)
+        add_status_listener(poll_controller.on_status)
@@ -0,0 +1,259 @@
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Callable, NamedTuple, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class AccountRecord(NamedTuple):
+    """A detached copy of an account row."""
+    id: int
+    name: Optional[str]
+    last_change_id: int
+    last_modified: Optional[datetime]
+
+    def dumps(self) -> str:
+        return json.dumps({
+            'id': self.id,
+            'name': self.name,
+            'last_change_id': self.last_change_id,
+            'last_modified': self.last_modified.isoformat()
+                if self.last_modified else None,
+        })
+
+    @classmethod
+    def loads(cls, data: str) -> 'AccountRecord':
+        values = json.loads(data)
+
+        return cls(
+            id=values['id'],
+            name=values['name'],
+            last_change_id=values['last_change_id'],
+            last_modified=datetime.fromisoformat(values['last_modified'])
+                if values['last_modified'] else None)
+
+
+# Entries are hashes of the version ("v") and the record ("d"). An
+# invalidation leaves the version behind without a record so a slow reader
+# can not put back a copy older than the change which invalidated it.
+REDIS_PUT = """
+local cur = redis.call('HGET', KEYS[1], 'v')
+if cur and tonumber(cur) > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'v', ARGV[1], 'd', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+REDIS_INVALIDATE = """
+local cur = redis.call('HGET', KEYS[1], 'v')
+if not cur or tonumber(cur) < tonumber(ARGV[1]) then
+    redis.call('HSET', KEYS[1], 'v', ARGV[1])
+    redis.call('HDEL', KEYS[1], 'd')
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+class AccountCache:
+    """A read-through cache of account records versioned by last change ID.
+
+    The first tier is an in process LRU, the optional second tier is shared
+    by every process through Redis. Both tiers refuse to store a record
+    older than one already seen, or older than the change that last
+    invalidated the account.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        redis_url: Optional[str] = None,
+        ttl: int = 300,
+        key_prefix: str = 'replica_api:acct:',
+    ):
+        """
+        Args:
+            max_size: The number of accounts kept in process.
+            redis_url: The Redis URL of the shared tier, None to disable it.
+            ttl: The seconds an account is kept in the shared tier.
+            key_prefix: The prefix of the shared tier keys.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+        # acct_id -> (version, record or None when invalidated)
+        self._entries: 'OrderedDict[int, Tuple[int, Optional[AccountRecord]]]' \
+            = OrderedDict()
+        self._lock = Lock()
+
+        self.stats = {
+            'local_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'shared_errors': 0,
+        }
+
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url)
+            self._redis_put = self._redis.register_script(REDIS_PUT)
+            self._redis_invalidate = self._redis.register_script(
+                REDIS_INVALIDATE)
+
+    def _key(self, acct_id: int) -> str:
+        return F'{self.key_prefix}{acct_id}'
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _store(self, acct_id: int, version: int,
+        record: Optional[AccountRecord]) -> bool:
+        with self._lock:
+            entry = self._entries.get(acct_id)
+
+            if entry and entry[0] > version:
+                return False
+            if entry and entry[0] == version and record is None:
+                return False
+
+            self._entries[acct_id] = (version, record)
+            self._entries.move_to_end(acct_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+            return True
+
+    def peek(self, acct_id: int) -> Optional[AccountRecord]:
+        """Get an account from the in process tier only."""
+        with self._lock:
+            entry = self._entries.get(acct_id)
+
+            if entry is None or entry[1] is None:
+                return None
+
+            self._entries.move_to_end(acct_id)
+            return entry[1]
+
+    def min_version(self, acct_id: int) -> Optional[int]:
+        """The version of the last change known for an account, if any.
+
+        Invalidations by this process carry the version of their write, a
+        copy read elsewhere must be at least as recent.
+        """
+        with self._lock:
+            entry = self._entries.get(acct_id)
+
+            return entry[0] if entry else None
+
+    def get(self, acct_id: int,
+        load: Callable[[], Optional[AccountRecord]]) -> Optional[AccountRecord]:
+        """Get an account, loading it on a miss.
+
+        Args:
+            acct_id: The account ID.
+            load: Reads the account from the database.
+
+        Returns:
+            The account record or None when the account does not exist.
+        """
+        record = self.peek(acct_id)
+
+        if record is not None:
+            self._count('local_hits')
+            return record
+
+        if self._redis is not None:
+            try:
+                data = self._redis.hget(self._key(acct_id), 'd')
+            except Exception:
+                logger.warning('account cache shared tier unavailable',
+                    exc_info=True)
+                self._count('shared_errors')
+                data = None
+
+            if data is not None:
+                record = AccountRecord.loads(data)
+
+                # the shared copy may predate an invalidation seen here
+                if self._store(acct_id, record.last_change_id, record):
+                    self._count('shared_hits')
+                    return record
+
+        self._count('misses')
+        record = load()
+
+        if record is not None:
+            self.put(record)
+
+        return record
+
+    def put(self, record: AccountRecord):
+        """Store an account unless a newer version is already known."""
+        if not self._store(record.id, record.last_change_id, record):
+            return
+
+        if self._redis is not None:
+            try:
+                self._redis_put(keys=[self._key(record.id)],
+                    args=[record.last_change_id, record.dumps(), self.ttl])
+            except Exception:
+                logger.warning('account cache shared tier unavailable',
+                    exc_info=True)
+                self._count('shared_errors')
+
+    def invalidate(self, acct_id: int, version: Optional[int] = None):
+        """Drop an account from the cache.
+
+        Args:
+            acct_id: The account ID.
+            version: The version of the change, only older copies are
+                dropped. None drops any copy.
+        """
+        self._count('invalidations')
+
+        if version is None:
+            with self._lock:
+                self._entries.pop(acct_id, None)
+        else:
+            self._store(acct_id, version, None)
+
+        if self._redis is not None:
+            try:
+                if version is None:
+                    self._redis.delete(self._key(acct_id))
+                else:
+                    self._redis_invalidate(keys=[self._key(acct_id)],
+                        args=[version, self.ttl])
+            except Exception:
+                logger.warning('account cache shared tier unavailable',
+                    exc_info=True)
+                self._count('shared_errors')
+
+    def metrics(self) -> dict:
+        """Hit, miss and invalidation counters of the cache."""
+        with self._lock:
+            stats = dict(self.stats)
+            size = sum(1 for _, record in self._entries.values()
+                if record is not None)
+
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+
+        return {
+            **stats,
+            'size': size,
+            'max_size': self.max_size,
+            'shared': self._redis is not None,
+            'hit_ratio': (lookups - stats['misses']) / lookups
+                if lookups else None,
+        }
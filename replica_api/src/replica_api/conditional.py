@@ -0,0 +1,75 @@
+import calendar
+import zlib
+from datetime import datetime
+from typing import Iterable, List, Optional
+from django.http import HttpRequest
+from django.http.response import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def has_validators(request: HttpRequest) -> bool:
+    """Whether the request is a conditional GET."""
+    return 'HTTP_IF_NONE_MATCH' in request.META or \
+        'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def timestamp(last_modified: Optional[datetime]) -> Optional[int]:
+    """Convert a naive UTC datetime column into a POSIX timestamp."""
+    if last_modified is None:
+        return None
+
+    return calendar.timegm(last_modified.utctimetuple())
+
+
+def targets_digest(targets: Iterable[str]) -> str:
+    return F'{zlib.crc32(",".join(targets).encode("UTF-8")):08x}'
+
+
+def account_etag(acct_id: int, last_change_id: int,
+    targets: List[str]) -> str:
+    """The entity tag of a single account.
+
+    Targets are not versioned by ``last_change_id`` so a digest of them is
+    part of the tag.
+    """
+    return quote_etag(F'{acct_id}-{last_change_id}-{targets_digest(targets)}')
+
+
+def accounts_etag(count: int, last_change_id: Optional[int],
+    targets: Optional[List[str]] = None) -> str:
+    """The entity tag of a list of accounts.
+
+    ``last_change_id`` is the greatest change ID over the page, it is
+    monotonic so any update moves it forward and the count catches
+    accounts entering or leaving the page.
+    """
+    tag = F'accts-{count}-{last_change_id or 0}'
+
+    if targets is not None:
+        tag += F'-{targets_digest(targets)}'
+
+    return quote_etag(tag)
+
+
+def not_modified(request: HttpRequest, etag: str,
+    last_modified: Optional[datetime]) -> Optional[HttpResponse]:
+    """Evaluate the request preconditions.
+
+    Returns:
+        A ``304 Not Modified`` response when the client copy is current,
+        otherwise None.
+    """
+    return get_conditional_response(request, etag=etag,
+        last_modified=timestamp(last_modified))
+
+
+def set_validators(response: HttpResponse, etag: str,
+    last_modified: Optional[datetime]) -> HttpResponse:
+    """Add the ``ETag`` and ``Last-Modified`` headers to a response."""
+    response.headers['ETag'] = etag
+
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(timestamp(last_modified))
+
+    return response
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+import httpx
+from django.conf import settings
+from replica_api.kafka_api import Connect
+
+
+logger = logging.getLogger(__name__)
+
+
+STATE_FAILED = 'FAILED'
+
+
+class ConnectorStatus:
+    """A cached snapshot of the state of every connector and task.
+
+    Runs its own event loop on a background thread, polling the status of
+    all the connectors concurrently every interval through its own Connect
+    client, at most ``concurrency`` calls at once. Readers are served the
+    last snapshot from memory, so the load on the Connect cluster does not
+    depend on how many are watching.
+    """
+
+    def __init__(self, interval: float = 5.0, concurrency: int = 8,
+        auto_restart: bool = False, max_restarts: int = 5):
+        """
+        Args:
+            interval: The seconds between two polls.
+            concurrency: The maximum number of status calls in flight.
+            auto_restart: Restart the failed tasks found by a poll.
+            max_restarts: The restarts of a task failing again before it is
+                left failed.
+        """
+        self.interval = interval
+        self.concurrency = concurrency
+        self.auto_restart = auto_restart
+        self.max_restarts = max_restarts
+
+        # (connector, task) -> (restarts, first poll it may be restarted
+        # again), only touched by the poll loop
+        self._restarts: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._polls = 0
+
+        self._lock = Lock()
+        self._snapshot: Optional[dict] = None
+        self._updated: Optional[float] = None
+        self._error: Optional[str] = None
+
+        self.stats = {
+            'polls': 0,
+            'errors': 0,
+            'restarts': 0,
+            'last_poll_seconds': None,
+        }
+
+    def snapshot(self) -> dict:
+        """The last snapshot and how old it is."""
+        with self._lock:
+            return {
+                'updatedOn': datetime.utcfromtimestamp(self._updated)
+                    .isoformat() if self._updated else None,
+                'age_seconds': round(time.time() - self._updated, 3)
+                    if self._updated else None,
+                'error': self._error,
+                **(self._snapshot or { 'connectors': {}, 'failed': [] }),
+                'stats': dict(self.stats),
+            }
+
+    async def poll(self, connect: Connect) -> dict:
+        """Get the state of every connector and task.
+
+        Returns:
+            The connectors keyed by name and the failed tasks.
+        """
+        resp = await connect.get_connectors()
+        resp.raise_for_status()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def status(name: str) -> Optional[dict]:
+            async with semaphore:
+                resp = await connect.get_connector_status(name)
+
+            # deleted between both calls
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+
+            return json.loads(resp.content)
+
+        names = json.loads(resp.content)
+        statuses = await asyncio.gather(*[status(name) for name in names])
+
+        connectors, failed = {}, []
+
+        for name, status in zip(names, statuses):
+            if status is None:
+                continue
+
+            tasks = [{
+                'id': task['id'],
+                'state': task['state'],
+                'worker_id': task.get('worker_id'),
+            } for task in status.get('tasks', [])]
+
+            connectors[name] = {
+                'state': status['connector']['state'],
+                'worker_id': status['connector'].get('worker_id'),
+                'type': status.get('type'),
+                'tasks': tasks,
+            }
+
+            for task, raw in zip(tasks, status.get('tasks', [])):
+                if task['state'] == STATE_FAILED:
+                    failed.append({
+                        'connector': name,
+                        'task': task['id'],
+                        # the first line of the stack trace holds the cause
+                        'trace': (raw.get('trace') or '').split('\n', 1)[0],
+                    })
+
+        return {
+            'connectors': connectors,
+            'failed': failed,
+        }
+
+    def due(self, failed: List[dict]) -> List[dict]:
+        """The failed tasks to restart at this poll.
+
+        A task restarted k times is not restarted again for the next 2^k
+        polls, nor at all once restarted ``max_restarts`` times. It is
+        forgotten once it stayed healthy through its backoff.
+        """
+        keys = {(task['connector'], task['task']) for task in failed}
+
+        for key, (_, after) in list(self._restarts.items()):
+            if key not in keys and self._polls >= after:
+                del self._restarts[key]
+
+        due = []
+
+        for task in failed:
+            restarts, after = self._restarts.get(
+                (task['connector'], task['task']), (0, 0))
+            task['restarts'] = restarts
+
+            if restarts < self.max_restarts and self._polls >= after:
+                due.append(task)
+
+        return due
+
+    async def restart(self, connect: Connect, failed: List[dict]) -> int:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def restart_task(name: str, task_id: int) -> bool:
+            async with semaphore:
+                resp = await connect.restart_task(name, task_id)
+
+            if resp.status_code >= 300:
+                logger.warning('failed task restart failed', extra={
+                    'connector': name, 'task': task_id,
+                    'status': resp.status_code })
+                return False
+
+            logger.info('restarted failed task', extra={
+                'connector': name, 'task': task_id })
+            return True
+
+        for task in failed:
+            restarts = task['restarts'] + 1
+            self._restarts[(task['connector'], task['task'])] = (restarts,
+                self._polls + 2 ** restarts)
+
+        return sum(await asyncio.gather(*[restart_task(task['connector'],
+            task['task']) for task in failed]))
+
+    async def run(self):
+        connect = Connect(settings.KAFKA_API.connect.url,
+            **settings.KAFKA_API_TRANSPORT)
+
+        while True:
+            started = time.monotonic()
+
+            try:
+                snapshot = await self.poll(connect)
+                self._polls += 1
+                due = self.due(snapshot['failed']) if self.auto_restart \
+                    else []
+                restarts = await self.restart(connect, due) if due else 0
+
+                with self._lock:
+                    self._snapshot = snapshot
+                    self._updated = time.time()
+                    self._error = None
+                    self.stats['polls'] += 1
+                    self.stats['restarts'] += restarts
+                    self.stats['last_poll_seconds'] = round(
+                        time.monotonic() - started, 3)
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                # keep serving the last snapshot, its age tells it is stale
+                logger.error('connector status poll failed', exc_info=True)
+                with self._lock:
+                    self._error = str(e)
+                    self.stats['errors'] += 1
+
+            await asyncio.sleep(max(0.0,
+                self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        logger.info('Starting connector status aggregator')
+        Thread(target=asyncio.run, args=(self.run(),), daemon=True,
+            name='connector_status').start()
+
+
+connector_status = ConnectorStatus(**settings.CONNECTOR_STATUS)
+_started = False
+_start_lock = Lock()
+
+
+def start_connector_status():
+    """Start polling the connector states, at most once per process."""
+    global _started
+
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    connector_status.start()
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Awaitable, Callable, List, Optional
+import sqlalchemy as orm
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+logger = logging.getLogger(__name__)
+
+
+class Lifespan:
+    """Serve the ASGI lifespan protocol in front of an application.
+
+    The Django ASGI handler only serves HTTP, startup and shutdown hooks
+    are run here when the server sends the lifespan events.
+    """
+
+    def __init__(self, app, startup: List[Callable[[], Awaitable]] = (),
+        shutdown: List[Callable[[], Awaitable]] = ()):
+        self.app = app
+        self.startup = list(startup)
+        self.shutdown = list(shutdown)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                try:
+                    for hook in self.startup:
+                        await hook()
+                except Exception as e:
+                    logger.fatal('startup failed', exc_info=True)
+                    await send({ 'type': 'lifespan.startup.failed',
+                        'message': str(e) })
+                    return
+                await send({ 'type': 'lifespan.startup.complete' })
+            elif message['type'] == 'lifespan.shutdown':
+                for hook in self.shutdown:
+                    try:
+                        await hook()
+                    except Exception:
+                        logger.error('shutdown hook failed', exc_info=True)
+                await send({ 'type': 'lifespan.shutdown.complete' })
+                return
+
+
+class Readiness:
+    """Whether this process is warmed up and not draining.
+
+    Warming up opens the database pool connections, the Kafka producers
+    and the pooled connections to the REST services. It runs in the
+    background and is retried until it succeeds, the process is live but
+    not ready meanwhile.
+
+    Draining starts on SIGTERM. The server stops accepting connections as
+    soon as it handles the signal, so the signal is handed to it only
+    ``drain_seconds`` later, the process answers not ready meanwhile and
+    the load balancer stops routing to it first.
+    """
+
+    def __init__(self, db_connections: int = 4, timeout: float = 10.0,
+        retry_interval: float = 2.0, drain_seconds: float = 5.0):
+        """
+        Args:
+            db_connections: The database connections opened ahead.
+            timeout: The seconds given to every warm up check.
+            retry_interval: The seconds between two warm up attempts.
+            drain_seconds: The seconds answering not ready after SIGTERM,
+                before the server stops accepting connections.
+        """
+        self.db_connections = db_connections
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.drain_seconds = drain_seconds
+
+        self.ready = False
+        self.draining = False
+        self.checks = {}
+        self.started: Optional[float] = None
+        self.warmed_up: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server_handler = None
+
+    def status(self) -> dict:
+        return {
+            'ready': self.ready and not self.draining,
+            'draining': self.draining,
+            'checks': dict(self.checks),
+            'warm_up_seconds': round(self.warmed_up - self.started, 3)
+                if self.warmed_up else None,
+        }
+
+    async def check_db(self):
+        @sync_to_async
+        def ping(db: AsyncSession):
+            db.execute(orm.text('SELECT 1'))
+
+        async def connection():
+            async with settings.SQLALCHEMY_DATABASES.db_context() as db:
+                await ping(db)
+
+        # sessions held at once open as many pool connections
+        await asyncio.gather(*[connection()
+            for _ in range(self.db_connections)])
+
+    async def check_kafka(self):
+        from replica_api.kafka_producer import get_status_producer, \
+            get_target_producer
+
+        kafka = settings.KAFKA_API
+        loop = asyncio.get_running_loop()
+
+        await asyncio.gather(*[loop.run_in_executor(None, producer.ready,
+            self.timeout) for producer in (get_target_producer(kafka),
+            get_status_producer(kafka))])
+
+    async def check_services(self):
+        kafka = settings.KAFKA_API
+
+        for resp in await asyncio.gather(kafka.connect.get_connectors(),
+            kafka.ksql.info(), kafka.schema_registry.get_subjects()):
+            resp.raise_for_status()
+
+    async def warm_up(self):
+        checks = {
+            'db': self.check_db,
+            'kafka': self.check_kafka,
+            'services': self.check_services,
+        }
+
+        while checks:
+            for name, check in list(checks.items()):
+                try:
+                    await asyncio.wait_for(check(), self.timeout)
+                except Exception as e:
+                    logger.warning('warm up check failed', extra={
+                        'check': name, 'error': str(e) })
+                    self.checks[name] = str(e) or type(e).__name__
+                else:
+                    self.checks[name] = 'ok'
+                    del checks[name]
+
+            if checks:
+                await asyncio.sleep(self.retry_interval)
+
+        self.ready = True
+        self.warmed_up = time.monotonic()
+        logger.info('warmed up', extra={
+            'seconds': self.warmed_up - self.started })
+
+    def drain(self, signum: int, frame):
+        """Start draining, installed as the SIGTERM handler.
+
+        A second signal is handed to the server at once.
+        """
+        if self.draining:
+            self.hand_over(signum, frame)
+            return
+
+        self.draining = True
+        logger.info('draining', extra={ 'seconds': self.drain_seconds })
+
+        # signal handlers may only schedule work on the loop
+        self._loop.call_soon_threadsafe(self._loop.call_later,
+            self.drain_seconds, self.hand_over, signum, frame)
+
+    def hand_over(self, signum: int, frame):
+        """Pass the signal to the handler the server installed."""
+        handler = self._server_handler
+
+        if callable(handler):
+            handler(signum, frame)
+        else:
+            signal.signal(signum, handler or signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    async def start(self):
+        """Start warming up, registered as a startup hook."""
+        self.started = time.monotonic()
+        self._task = asyncio.create_task(self.warm_up())
+        self._loop = asyncio.get_running_loop()
+
+        try:
+            self._server_handler = signal.getsignal(signal.SIGTERM)
+            signal.signal(signal.SIGTERM, self.drain)
+        except ValueError:
+            # only the main thread handles signals
+            logger.warning('not draining on SIGTERM, the lifespan does not '
+                'run on the main thread')
+
+    async def stop(self):
+        """Release the clients, a shutdown hook.
+
+        The server already stopped accepting connections and finished the
+        requests in flight.
+        """
+        from replica_api.kafka_producer import close_producers
+
+        self.draining = True
+
+        if self._task is not None:
+            self._task.cancel()
+
+        await asyncio.get_running_loop().run_in_executor(None,
+            close_producers)
+        await settings.KAFKA_API.aclose()
+
+
+readiness = Readiness(**settings.READINESS)
@@ -0,0 +1,340 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from threading import Lock
+from typing import Dict, NamedTuple, Optional
+import httpx
+from httpx import Response
+from replica_api.metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+RETRY_STATUS_CODES = frozenset([502, 503, 504])
+
+
+class Session(NamedTuple):
+    """The client and the call limit of an event loop."""
+    client: httpx.AsyncClient
+    semaphore: asyncio.Semaphore
+    # closes the client when cancelled with the other tasks of the loop
+    closer: asyncio.Task
+
+
+class HttpTransport:
+    """A pooled async HTTP client for a single upstream service.
+
+    Connections are kept alive and reused between calls, HTTP/2 is
+    negotiated when the server supports it and the number of in flight calls
+    is bounded. Failed calls are retried with full jitter exponential
+    backoff; calls which are not idempotent are only retried when the
+    request never reached the server.
+
+    Pools are bound to the event loop they were created on, every loop gets
+    its own client, closed when the loop ends. The pooling and the
+    concurrency limit therefore only hold within a single loop: across the
+    requests of a server running one loop per process, not under the
+    development server, which runs every request on a loop of its own.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        name: str = 'upstream',
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        max_concurrency: int = 20,
+        retries: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+    ):
+        """
+        Args:
+            url: The base URL of the service.
+            name: The name of the service in the metrics.
+            timeout: The default timeout of a call in seconds.
+            max_connections: The connection pool size.
+            max_keepalive_connections: The idle connections kept open.
+            keepalive_expiry: The seconds an idle connection is kept open.
+            http2: Whether to negotiate HTTP/2 with the service.
+            max_concurrency: The maximum number of in flight calls.
+            retries: The default number of retries of a failed call.
+            backoff: The base backoff between retries in seconds.
+            max_backoff: The maximum backoff between retries in seconds.
+        """
+        self.url = url
+        self.name = name
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry)
+        self.http2 = http2
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._sessions: Dict[asyncio.AbstractEventLoop, Session] = {}
+        # the development server runs loops on several threads
+        self._lock = Lock()
+
+    def _session(self) -> Session:
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            session = self._sessions.get(loop)
+
+            if session is None:
+                # the clients of the loops which ended are already closed
+                for ended in [other for other in self._sessions
+                    if other.is_closed()]:
+                    del self._sessions[ended]
+
+                client = httpx.AsyncClient(base_url=self.url,
+                    http2=self.http2, limits=self.limits,
+                    timeout=self.timeout)
+                session = self._sessions[loop] = Session(client,
+                    asyncio.Semaphore(self.max_concurrency),
+                    loop.create_task(self._close_with_loop(client)))
+
+            return session
+
+    @staticmethod
+    async def _close_with_loop(client: httpx.AsyncClient):
+        # the tasks left when a loop ends are cancelled and awaited, by
+        # asyncio.run and by asgiref alike
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await client.aclose()
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0,
+            min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        **kwargs,
+    ) -> Response:
+        """Send a request to the service.
+
+        Args:
+            method: The HTTP method.
+            path: The path relative to the service URL.
+            timeout: Override the default timeout of the call.
+            retries: Override the default number of retries of the call.
+            kwargs: Passed through to ``httpx.AsyncClient.request``.
+
+        Returns:
+            Response from the service.
+        """
+        started = time.perf_counter()
+
+        try:
+            resp = await self._request(method, path, timeout, retries,
+                **kwargs)
+        except httpx.HTTPError as e:
+            UPSTREAM_ERRORS.labels(self.name, type(e).__name__).inc()
+            raise
+        finally:
+            UPSTREAM_SECONDS.labels(self.name, method.upper()).observe(
+                time.perf_counter() - started)
+
+        if resp.status_code >= 500:
+            UPSTREAM_ERRORS.labels(self.name, str(resp.status_code)).inc()
+
+        return resp
+
+    async def _request(self, method: str, path: str,
+        timeout: Optional[float], retries: Optional[int], **kwargs) \
+        -> Response:
+        session = self._session()
+        retries = self.retries if retries is None else retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        attempt = 0
+
+        while True:
+            try:
+                async with session.semaphore:
+                    resp = await session.client.request(method, path,
+                        **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout,
+                httpx.PoolTimeout) as e:
+                # the request never reached the service, always safe to retry
+                if attempt >= retries:
+                    raise
+                logger.warning('upstream connection failed, retrying',
+                    extra={ 'url': self.url, 'path': path, 'error': str(e) })
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= retries:
+                    raise
+                logger.warning('upstream call failed, retrying', extra={
+                    'url': self.url, 'path': path, 'error': str(e) })
+            else:
+                if resp.status_code not in RETRY_STATUS_CODES or \
+                    not idempotent or attempt >= retries:
+                    return resp
+                logger.warning('upstream unavailable, retrying', extra={
+                    'url': self.url, 'path': path,
+                    'status': resp.status_code })
+
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def aclose(self):
+        """Close the pooled connections of the running loop."""
+        with self._lock:
+            session = self._sessions.pop(asyncio.get_running_loop(), None)
+
+        if session is not None:
+            session.closer.cancel()
+            await session.client.aclose()
+
+
+class Connect:
+    """Client for the Kafka Connect REST API."""
+
+    name = 'connect'
+
+    def __init__(self, url: str, **transport):
+        self.url = url
+        self.transport = HttpTransport(url, name=self.name, **transport)
+
+    async def get_connectors(self, **kwargs) -> Response:
+        return await self.transport.request('GET', '/connectors', **kwargs)
+
+    async def create_connector(self, name: str, config: dict, **kwargs) \
+        -> Response:
+        return await self.transport.request('POST', '/connectors', json={
+            'name': name,
+            'config': config,
+        }, **kwargs)
+
+    async def get_connector_config(self, name: str, **kwargs) -> Response:
+        return await self.transport.request('GET',
+            F'/connectors/{name}/config', **kwargs)
+
+    async def put_connector_config(self, name: str, config: dict, **kwargs) \
+        -> Response:
+        """Create the connector, or update its configuration."""
+        return await self.transport.request('PUT',
+            F'/connectors/{name}/config', json=config, **kwargs)
+
+    async def get_connector_status(self, name: str, **kwargs) -> Response:
+        return await self.transport.request('GET',
+            F'/connectors/{name}/status', **kwargs)
+
+    async def delete_connector(self, name: str, **kwargs) -> Response:
+        return await self.transport.request('DELETE', F'/connectors/{name}',
+            **kwargs)
+
+    async def pause_connector(self, name: str, **kwargs) -> Response:
+        return await self.transport.request('PUT',
+            F'/connectors/{name}/pause', **kwargs)
+
+    async def resume_connector(self, name: str, **kwargs) -> Response:
+        return await self.transport.request('PUT',
+            F'/connectors/{name}/resume', **kwargs)
+
+    async def restart_connector(self, name: str, **kwargs) -> Response:
+        return await self.transport.request('POST',
+            F'/connectors/{name}/restart', **kwargs)
+
+    async def restart_task(self, name: str, task_id: int, **kwargs) \
+        -> Response:
+        return await self.transport.request('POST',
+            F'/connectors/{name}/tasks/{task_id}/restart', **kwargs)
+
+
+class KSQL:
+    """Client for the ksqlDB REST API."""
+
+    name = 'ksql'
+
+    headers = {
+        'Accept': 'application/vnd.ksql.v1+json',
+    }
+
+    def __init__(self, url: str, **transport):
+        self.url = url
+        self.transport = HttpTransport(url, name=self.name, **transport)
+
+    async def execute(self, statement: str, **kwargs) -> Response:
+        return await self.transport.request('POST', '/ksql', json={
+            'ksql': statement,
+            'streamsProperties': {},
+        }, headers=self.headers, **kwargs)
+
+    async def query(self, statement: str, **kwargs) -> Response:
+        return await self.transport.request('POST', '/query', json={
+            'ksql': statement,
+            'streamsProperties': {},
+        }, headers=self.headers, **kwargs)
+
+    async def info(self, **kwargs) -> Response:
+        return await self.transport.request('GET', '/info',
+            headers=self.headers, **kwargs)
+
+
+class SchemaRegistry:
+    """Client for the Confluent Schema Registry REST API."""
+
+    name = 'schema_registry'
+
+    headers = {
+        'Content-Type': 'application/vnd.schemaregistry.v1+json',
+    }
+
+    def __init__(self, url: str, **transport):
+        self.url = url
+        self.transport = HttpTransport(url, name=self.name, **transport)
+
+    async def get_subjects(self, **kwargs) -> Response:
+        return await self.transport.request('GET', '/subjects', **kwargs)
+
+    async def create_schema(self, subject: str, schema: dict, **kwargs) \
+        -> Response:
+        return await self.transport.request('POST',
+            F'/subjects/{subject}/versions', headers=self.headers,
+            content=json.dumps({ 'schema': json.dumps(schema) }), **kwargs)
+
+
+class KafkaAPI:
+    """The Kafka cluster and the REST services used to administer it."""
+
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        connect: Connect,
+        ksql: KSQL,
+        schema_registry: SchemaRegistry,
+        client_id: Optional[str] = None,
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.client_id = client_id
+        self.connect = connect
+        self.ksql = ksql
+        self.schema_registry = schema_registry
+
+    async def aclose(self):
+        """Close the pooled connections of every service."""
+        await asyncio.gather(
+            self.connect.transport.aclose(),
+            self.ksql.transport.aclose(),
+            self.schema_registry.transport.aclose())
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import socket
+from threading import Lock, Thread
+from typing import Callable, List
+from confluent_kafka import KafkaError, KafkaException, Message
+from confluent_kafka.deserializing_consumer import DeserializingConsumer
+from confluent_kafka.error import ValueDeserializationError
+from confluent_kafka.schema_registry import SchemaRegistryClient
+from confluent_kafka.schema_registry.avro import AvroDeserializer
+from confluent_kafka.serialization import StringDeserializer
+from django.conf import settings
+from replica_api.models.sources import is_account_label
+
+
+logger = logging.getLogger(__name__)
+
+
+status_schema_str = json.dumps({
+    'type': 'record',
+    'name': 'replica_status_continuum',
+    'namespace': 'io.confluent.connect.jdbc.continuum',
+    'fields': [
+        {
+            'name': 'label',
+            'type': 'string'
+        },
+        {
+            'name': 'outcome',
+            'type': 'int'
+        },
+        {
+            'name': 'version',
+            'type': [
+                'null',
+                'string'
+            ],
+            'default': None
+        },
+        {
+            'name': 'updatedOn',
+            'type': [
+                'null',
+                {
+                    'type': 'long',
+                    'logicalType': 'timestamp-millis'
+                }
+            ],
+            'default': None
+        }
+    ]
+})
+
+
+# Outcome of a continuum status event, as written by the JDBC connectors
+OUTCOME_FAILURE = 0
+OUTCOME_SUCCESS = 1
+
+
+# listener(acct_id, status) called from the consumer thread for every
+# replica_status continuum event about an account
+StatusListener = Callable[[int, dict], None]
+
+_listeners: List[StatusListener] = []
+_started = False
+_start_lock = Lock()
+
+
+def add_status_listener(listener: StatusListener):
+    """Register a callable notified of every replica status event.
+
+    Listeners run on the consumer thread, they must be quick and thread
+    safe.
+    """
+    _listeners.append(listener)
+
+
+def create_consumer() -> DeserializingConsumer:
+    schema_registry_client = SchemaRegistryClient({
+        'url': settings.KAFKA_API.schema_registry.url,
+    })
+
+    # every process keeps its own view of the status stream so each one
+    # joins its own group and only follows new events
+    return DeserializingConsumer({
+        'bootstrap.servers': settings.KAFKA_API.bootstrap_servers,
+        'group.id': F'replica_api_{socket.gethostname()}_{os.getpid()}',
+        'auto.offset.reset': 'latest',
+        'enable.auto.commit': False,
+        'key.deserializer': StringDeserializer('utf_8'),
+        'value.deserializer': AvroDeserializer(schema_registry_client,
+            status_schema_str),
+    })
+
+
+def dispatch(msg: Message):
+    status = msg.value()
+
+    # the events of the other registered tables are keyed by their own rows
+    if not is_account_label(status['label']):
+        return
+
+    try:
+        acct_id = int(msg.key())
+    except (TypeError, ValueError):
+        logger.warning('status event without an account key', extra={
+            'kafka_key': msg.key() })
+        return
+
+    for listener in _listeners:
+        try:
+            listener(acct_id, status)
+        except Exception:
+            logger.error('status listener failed', exc_info=True, extra={
+                'acct_id': acct_id })
+
+
+def consume_loop(consumer: DeserializingConsumer, topics: List[str]):
+    try:
+        consumer.subscribe(topics)
+
+        while True:
+            try:
+                msg: Message = consumer.poll(timeout=1.0)
+            except ValueDeserializationError:
+                logger.warning("Message deserialization failed")
+                continue
+
+            if msg is None:
+                continue
+
+            if msg.error():
+                if msg.error().code() == KafkaError._PARTITION_EOF:
+                    continue
+                raise KafkaException(msg.error())
+
+            dispatch(msg)
+    except Exception:
+        logger.fatal('Kafka status consumer loop exiting unexpectedly!!',
+            exc_info=True)
+    finally:
+        consumer.close()
+
+
+def start_consumer():
+    """Start following the replica status stream, at most once per process."""
+    global _started
+
+    with _start_lock:
+        if _started or not _listeners:
+            return
+        _started = True
+
+    logger.info('Starting status consumer')
+    Thread(target=consume_loop, args=(create_consumer(),
+        [settings.STATUS_TOPIC]), daemon=True, name='status_consumer').start()
@@ -0,0 +1,82 @@
+from typing import Dict
+from asgiref.sync import sync_to_async
+from confluent_kafka import Consumer, KafkaException, TopicPartition
+from replica_api.kafka_api import KafkaAPI
+
+
+def group_consumer(kafka: KafkaAPI, group: str) -> Consumer:
+    """A consumer reading or setting the offsets of a group.
+
+    It never subscribes, so it does not join the group.
+    """
+    return Consumer({
+        'bootstrap.servers': kafka.bootstrap_servers,
+        'group.id': group,
+        'enable.auto.commit': False,
+    })
+
+
+def partitions(consumer: Consumer, topic: str, timeout: float = 10.0) \
+    -> Dict[int, TopicPartition]:
+    metadata = consumer.list_topics(topic, timeout=timeout)
+
+    if metadata.topics[topic].error is not None:
+        raise KafkaException(metadata.topics[topic].error)
+
+    return {
+        partition: TopicPartition(topic, partition)
+        for partition in metadata.topics[topic].partitions
+    }
+
+
+@sync_to_async
+def end_offsets(kafka: KafkaAPI, topic: str, timeout: float = 10.0) \
+    -> Dict[int, int]:
+    """Get the offset the next record of every partition of a topic gets."""
+    consumer = group_consumer(kafka, 'replica_api_offsets')
+
+    try:
+        return {
+            partition: consumer.get_watermark_offsets(tp, timeout=timeout)[1]
+            for partition, tp in partitions(consumer, topic, timeout).items()
+        }
+    finally:
+        consumer.close()
+
+
+@sync_to_async
+def committed_offsets(kafka: KafkaAPI, group: str, topic: str,
+    timeout: float = 10.0) -> Dict[int, int]:
+    """Get the offsets a consumer group committed for a topic.
+
+    Returns:
+        The offset of every partition, negative when the group committed
+        none.
+    """
+    consumer = group_consumer(kafka, group)
+
+    try:
+        return {
+            tp.partition: tp.offset for tp in consumer.committed(
+                list(partitions(consumer, topic, timeout).values()),
+                timeout=timeout)
+        }
+    finally:
+        consumer.close()
+
+
+@sync_to_async
+def commit_offsets(kafka: KafkaAPI, group: str, topic: str,
+    offsets: Dict[int, int]):
+    """Set the offsets of a consumer group which has no active member.
+
+    Args:
+        offsets: The offset to resume from, by partition.
+    """
+    consumer = group_consumer(kafka, group)
+
+    try:
+        consumer.commit(offsets=[TopicPartition(topic, partition, offset)
+            for partition, offset in offsets.items()], asynchronous=False)
+    finally:
+        consumer.close()
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+from threading import Event, Lock, Thread
+from typing import Dict, Optional
+from confluent_kafka import KafkaException, Message
+from confluent_kafka.schema_registry import SchemaRegistryClient
+from confluent_kafka.schema_registry.avro import AvroSerializer
+from confluent_kafka.serialization import IntegerSerializer, StringSerializer
+from confluent_kafka.serializing_producer import SerializingProducer
+from django.conf import settings
+from replica_api.kafka_api import KafkaAPI
+from replica_api.kafka_consumer import status_schema_str
+
+
+logger = logging.getLogger(__name__)
+
+
+# Value schema ksqlDB registers for the "replica_trg_tbl" table, the key
+# (acct_id) is a KAFKA formatted INT which is what IntegerSerializer writes.
+target_schema_str = json.dumps({
+    'type': 'record',
+    'name': 'KsqlDataSourceSchema',
+    'namespace': 'io.confluent.ksql.avro_schemas',
+    'fields': [
+        {
+            'name': 'targets',
+            'type': [
+                'null',
+                {
+                    'type': 'array',
+                    'items': [
+                        'null',
+                        'string'
+                    ]
+                }
+            ],
+            'default': None
+        }
+    ],
+    'connect.name': 'io.confluent.ksql.avro_schemas.KsqlDataSourceSchema',
+})
+
+
+class AvroProducer:
+    """Produce Avro records keyed by account ID to a topic.
+
+    A background thread serves the librdkafka delivery reports so callers
+    only await ``produce``.
+    """
+
+    def __init__(self, kafka: KafkaAPI, topic: str, schema_str: str,
+        config: dict, name: str = 'producer', string_keys: bool = False):
+        """
+        Args:
+            kafka: The Kafka API settings.
+            topic: The topic to produce to.
+            schema_str: The value schema, it must already be registered.
+            config: librdkafka producer overrides (batching, linger,
+                compression...).
+            name: The name of the poll thread.
+            string_keys: Write the account ID keys as strings, the way the
+                continuum status events are keyed, instead of KAFKA INTs.
+        """
+        self.topic = topic
+        self.string_keys = string_keys
+
+        schema_registry_client = SchemaRegistryClient({
+            'url': kafka.schema_registry.url,
+        })
+        avro_serializer = AvroSerializer(schema_registry_client,
+            schema_str, conf={
+                # the schema is owned by ksqlDB or the source connector,
+                # never register our own
+                'auto.register.schemas': False,
+                'use.latest.version': True,
+            })
+
+        self._producer = SerializingProducer({
+            **config,
+            'bootstrap.servers': kafka.bootstrap_servers,
+            'key.serializer': StringSerializer('utf_8') if string_keys \
+                else IntegerSerializer(),
+            'value.serializer': avro_serializer,
+        })
+        self._stopping = Event()
+        self._thread = Thread(target=self._poll_loop, daemon=True, name=name)
+        self._thread.start()
+
+    def _poll_loop(self):
+        while not self._stopping.is_set():
+            self._producer.poll(0.1)
+
+    async def produce(self, acct_id: int, value: Optional[dict]) -> dict:
+        """Produce a record for an account.
+
+        Args:
+            acct_id: The account ID, used as the record key.
+            value: The record value, None produces a tombstone.
+
+        Returns:
+            The delivery report, once the broker has acknowledged the record.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(err, msg: Message):
+            if future.done():
+                return
+            if err:
+                future.set_exception(KafkaException(err))
+            else:
+                future.set_result({
+                    'acct_id': acct_id,
+                    'partition': msg.partition(),
+                    'offset': msg.offset(),
+                })
+
+        def on_delivery(err, msg: Message):
+            if err:
+                logger.error('record delivery failed', extra={
+                    'topic': self.topic,
+                    'account_id': acct_id,
+                    'error': str(err) })
+            loop.call_soon_threadsafe(resolve, err, msg)
+
+        while True:
+            try:
+                self._producer.produce(self.topic,
+                    key=str(acct_id) if self.string_keys else acct_id,
+                    value=value, on_delivery=on_delivery)
+                break
+            except BufferError:
+                # local queue is full, let the poll thread drain it without
+                # blocking the event loop
+                await asyncio.sleep(0.01)
+
+        return await future
+
+    def flush(self, timeout: float = 10.0) -> int:
+        """Wait for outstanding records to be delivered.
+
+        Returns:
+            The number of records still in the queue.
+        """
+        return self._producer.flush(timeout)
+
+    def ready(self, timeout: float = 10.0):
+        """Wait for the broker connection and the topic metadata.
+
+        Raises:
+            KafkaException: The topic metadata could not be fetched in time.
+        """
+        topic = self._producer.list_topics(self.topic, timeout=timeout) \
+            .topics[self.topic]
+
+        if topic.error is not None:
+            raise KafkaException(topic.error)
+
+    def close(self):
+        """Deliver outstanding records and stop the poll thread."""
+        self.flush()
+        self._stopping.set()
+        self._thread.join()
+
+
+_producers: Dict[str, AvroProducer] = {}
+_producers_lock = Lock()
+
+
+def get_producer(kafka: KafkaAPI, topic: str, schema_str: str,
+    string_keys: bool = False) -> AvroProducer:
+    """Get the process wide producer of a topic, creating it on first use."""
+    producer = _producers.get(topic)
+
+    if producer is None:
+        with _producers_lock:
+            producer = _producers.get(topic)
+
+            if producer is None:
+                logger.info('Starting producer', extra={ 'topic': topic })
+                producer = _producers[topic] = AvroProducer(kafka,
+                    topic=topic, schema_str=schema_str,
+                    config=settings.KAFKA_PRODUCER,
+                    name=F'{topic}_producer', string_keys=string_keys)
+
+    return producer
+
+
+def get_target_producer(kafka: KafkaAPI) -> AvroProducer:
+    """Get the producer of the database target assignments topic."""
+    return get_producer(kafka, settings.TARGET_TOPIC, target_schema_str)
+
+
+def get_account_producer(kafka: KafkaAPI) -> AvroProducer:
+    """Get the producer of the source account topic."""
+    from replica_api.models import sources
+
+    return get_producer(kafka, sources.TOPIC,
+        json.dumps(sources.account_schema))
+
+
+def get_status_producer(kafka: KafkaAPI) -> AvroProducer:
+    """Get the producer of the replica status continuum events."""
+    return get_producer(kafka, settings.STATUS_TOPIC, status_schema_str,
+        string_keys=True)
+
+
+def close_producers():
+    """Deliver outstanding records and stop every producer."""
+    with _producers_lock:
+        producers = list(_producers.values())
+        _producers.clear()
+
+    for producer in producers:
+        producer.close()
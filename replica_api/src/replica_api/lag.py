@@ -0,0 +1,214 @@
+import heapq
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from replica_api.kafka_consumer import OUTCOME_SUCCESS
+
+
+def epoch(value: Optional[datetime]) -> float:
+    return value.timestamp() if value is not None else time.time()
+
+
+class LagIndex:
+    """The replication progress of every account on every target.
+
+    Follows the replica status continuum: the source events carry the
+    latest version of an account, the sink events the version each target
+    applied. A target is behind an account from the first source version it
+    has not applied until it reports a version at least as recent.
+
+    Lookups of an account are O(1). The behind pairs are also kept in a
+    heap ordered by the time they fell behind, so the N most lagging pairs
+    are found in O(N log N) without scanning every account. Heap entries
+    are invalidated lazily and compacted once most of them are stale.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+
+        # labels are interned, accounts only keep small integers
+        self._labels: List[str] = []
+        self._label_ids: Dict[str, int] = {}
+
+        # acct_id -> (version, updated on)
+        self._source: Dict[int, Tuple[int, float]] = {}
+        # acct_id -> label id -> applied version, 0 when none yet
+        self._applied: Dict[int, Dict[int, int]] = {}
+        # (acct_id, label id) -> time the target fell behind
+        self._behind: Dict[Tuple[int, int], float] = {}
+        # (acct_id, label id) of the last outcome which failed
+        self._failed: Set[Tuple[int, int]] = set()
+        self._heap: List[Tuple[float, int, int]] = []
+
+    def _label_id(self, label: str) -> int:
+        label_id = self._label_ids.get(label)
+
+        if label_id is None:
+            label_id = self._label_ids[label] = len(self._labels)
+            self._labels.append(label)
+
+        return label_id
+
+    def _mark(self, acct_id: int, label_id: int):
+        """Update whether a target is behind an account."""
+        key = (acct_id, label_id)
+        source = self._source.get(acct_id)
+        applied = self._applied.get(acct_id, {}).get(label_id, 0)
+
+        if source is None or applied >= source[0]:
+            self._behind.pop(key, None)
+            return
+
+        if key not in self._behind:
+            self._behind[key] = source[1]
+            heapq.heappush(self._heap, (source[1], acct_id, label_id))
+
+            if len(self._heap) > 2 * len(self._behind) + 1024:
+                self._heap = [(since, *key)
+                    for key, since in self._behind.items()]
+                heapq.heapify(self._heap)
+
+    def on_status(self, acct_id: int, status: dict):
+        """Record a replica status event, registered as a status listener."""
+        if not status['version']:
+            return
+
+        version = int(status['version'])
+        updated_on = epoch(status['updatedOn'])
+
+        with self._lock:
+            if status['label'] == settings.SOURCE_LABEL:
+                current = self._source.get(acct_id)
+
+                if current is None or version > current[0]:
+                    self._source[acct_id] = (version, updated_on)
+
+                for label_id in self._applied.get(acct_id, ()):
+                    self._mark(acct_id, label_id)
+                return
+
+            label_id = self._label_id(status['label'])
+            key = (acct_id, label_id)
+
+            if status['outcome'] != OUTCOME_SUCCESS:
+                self._failed.add(key)
+                return
+
+            self._failed.discard(key)
+            targets = self._applied.setdefault(acct_id, {})
+            targets[label_id] = max(targets.get(label_id, 0), version)
+            self._mark(acct_id, label_id)
+
+    def set_targets(self, acct_id: int, labels: Iterable[str]):
+        """Record the targets assigned to an account.
+
+        Targets which never reported a version are behind as soon as the
+        account has a version.
+        """
+        with self._lock:
+            label_ids = {self._label_id(label) for label in labels}
+            targets = self._applied.setdefault(acct_id, {})
+
+            for label_id in list(targets):
+                if label_id not in label_ids:
+                    del targets[label_id]
+                    self._behind.pop((acct_id, label_id), None)
+                    self._failed.discard((acct_id, label_id))
+
+            for label_id in label_ids:
+                targets.setdefault(label_id, 0)
+                self._mark(acct_id, label_id)
+
+    def fresh_targets(self, acct_id: int, min_version: Optional[int] = None) \
+        -> List[str]:
+        """The targets of an account which applied at least a version.
+
+        The latest version of the account seen on the source is required
+        too, without a version no target is fresh when it was not seen yet.
+        """
+        with self._lock:
+            source = self._source.get(acct_id)
+
+            if source is not None:
+                min_version = max(min_version or 0, source[0])
+            elif min_version is None:
+                return []
+
+            return [self._labels[label_id] for label_id, version
+                in self._applied.get(acct_id, {}).items()
+                if version >= min_version]
+
+    def _target(self, acct_id: int, label_id: int, now: float) -> dict:
+        source = self._source.get(acct_id)
+        applied = self._applied.get(acct_id, {}).get(label_id, 0)
+        since = self._behind.get((acct_id, label_id))
+
+        return {
+            'label': self._labels[label_id],
+            'applied_version': applied or None,
+            'versions_behind': source[0] - applied
+                if since is not None else 0,
+            'lag_seconds': round(now - since, 3) if since is not None else 0,
+            'failed': (acct_id, label_id) in self._failed,
+        }
+
+    def account(self, acct_id: int) -> Optional[dict]:
+        """The progress of every target of an account, None when unknown."""
+        now = time.time()
+
+        with self._lock:
+            source = self._source.get(acct_id)
+            targets = self._applied.get(acct_id)
+
+            if source is None and targets is None:
+                return None
+
+            return {
+                'acct_id': acct_id,
+                'version': source[0] if source else None,
+                'updatedOn': datetime.utcfromtimestamp(source[1]).isoformat()
+                    if source else None,
+                'targets': [self._target(acct_id, label_id, now)
+                    for label_id in targets or ()],
+            }
+
+    def most_lagging(self, limit: int = 10) -> List[dict]:
+        """The targets behind for the longest time, with their account."""
+        now = time.time()
+        found, seen = [], set()
+
+        with self._lock:
+            heap = self._heap
+            # walk the heap in order through a frontier of its indices
+            frontier = [(heap[0], 0)] if heap else []
+
+            while frontier and len(found) < limit:
+                (since, acct_id, label_id), i = heapq.heappop(frontier)
+
+                if self._behind.get((acct_id, label_id)) == since and \
+                    (acct_id, label_id) not in seen:
+                    seen.add((acct_id, label_id))
+                    found.append({
+                        'acct_id': acct_id,
+                        **self._target(acct_id, label_id, now),
+                    })
+
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+
+        return found
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'accounts': len(self._source),
+                'targets': len(self._labels),
+                'behind': len(self._behind),
+                'failed': len(self._failed),
+            }
+
+
+lag_index = LagIndex()
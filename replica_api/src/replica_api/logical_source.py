@@ -0,0 +1,417 @@
+import asyncio
+import logging
+import struct
+import time
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import psycopg2
+from psycopg2 import errors
+from psycopg2.extras import LogicalReplicationConnection, ReplicationMessage
+from django.conf import settings
+from replica_api.kafka_consumer import OUTCOME_SUCCESS
+from replica_api.models import sources
+
+
+logger = logging.getLogger(__name__)
+
+
+# pgoutput timestamps are microseconds since the Postgres epoch
+PG_EPOCH = datetime(2000, 1, 1)
+
+
+# pgoutput decoding (protocol version 1)
+class Relation(NamedTuple):
+    namespace: str
+    name: str
+    columns: List[str]
+
+
+class Change(NamedTuple):
+    """A row change of a replicated table."""
+    relation: Relation
+    # 'I'nsert, 'U'pdate or 'D'elete
+    kind: str
+    # column -> text value, the key columns only for deletes
+    row: Dict[str, Optional[str]]
+
+
+class Reader:
+    """Read the fields of a pgoutput message."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def byte(self) -> str:
+        return chr(self.unpack('!B')[0])
+
+    def int16(self) -> int:
+        return self.unpack('!h')[0]
+
+    def int32(self) -> int:
+        return self.unpack('!i')[0]
+
+    def int64(self) -> int:
+        return self.unpack('!q')[0]
+
+    def string(self) -> str:
+        end = self.data.index(b'\0', self.pos)
+        value = self.data[self.pos:end].decode('utf-8')
+        self.pos = end + 1
+        return value
+
+    def timestamp(self) -> datetime:
+        return PG_EPOCH + timedelta(microseconds=self.int64())
+
+    def tuple(self, columns: List[str]) -> Dict[str, Optional[str]]:
+        row = {}
+
+        for column in columns[:self.int16()]:
+            kind = self.byte()
+
+            if kind == 'n':
+                row[column] = None
+            elif kind == 't':
+                size = self.int32()
+                row[column] = self.data[self.pos:self.pos + size] \
+                    .decode('utf-8')
+                self.pos += size
+            # 'u' unchanged TOAST value, not sent by the server
+
+        return row
+
+
+class Decoder:
+    """Decode a pgoutput stream, tracking the relations it describes."""
+
+    def __init__(self):
+        self.relations: Dict[int, Relation] = {}
+
+    def decode(self, data: bytes) -> Tuple[str, Optional[object]]:
+        """Decode a single message.
+
+        Returns:
+            The message type and, for row changes a ``Change``, for commits
+            the commit LSN and time, otherwise None.
+        """
+        reader = Reader(data)
+        kind = reader.byte()
+
+        if kind == 'R':
+            rel_id = reader.int32()
+            namespace = reader.string()
+            name = reader.string()
+            reader.byte()  # replica identity
+            columns = []
+
+            for _ in range(reader.int16()):
+                reader.byte()  # flags
+                columns.append(reader.string())
+                reader.int32()  # type
+                reader.int32()  # type modifier
+
+            self.relations[rel_id] = Relation(namespace, name, columns)
+            return kind, None
+
+        if kind in ('I', 'U', 'D'):
+            relation = self.relations[reader.int32()]
+            tuple_kind = reader.byte()
+
+            if kind == 'U' and tuple_kind in ('K', 'O'):
+                # old key or row, followed by the new row
+                reader.tuple(relation.columns)
+                tuple_kind = reader.byte()
+
+            return kind, Change(relation, kind,
+                reader.tuple(relation.columns))
+
+        if kind == 'C':
+            reader.byte()  # flags
+            reader.int64()  # commit LSN
+            end_lsn = reader.int64()
+            return kind, (end_lsn, reader.timestamp())
+
+        # begin, origin, type and truncate messages
+        return kind, None
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse a timestamp in the Postgres text output format."""
+    return datetime.strptime(value,
+        '%Y-%m-%d %H:%M:%S.%f' if '.' in value else '%Y-%m-%d %H:%M:%S')
+
+
+# Driver
+class LogicalSource:
+    """Publish the account table changes from Postgres logical replication.
+
+    Streams the publication of the account table through a pgoutput
+    replication slot and writes the same source records and replica status
+    events as the JDBC source connector, deletes included. Changes are
+    published in batches of whole transactions; once a batch is
+    acknowledged by Kafka its commit LSN is confirmed to the slot, which is
+    where streaming resumes after a restart.
+
+    A slot is streamed by a single connection, processes which can not
+    acquire it keep retrying and take over when the active one stops.
+    """
+
+    def __init__(
+        self,
+        dsn: dict,
+        slot_name: str = 'replica_src',
+        publication: str = 'replica_src',
+        table: str = 'account',
+        batch_size: int = 1000,
+        batch_timeout: float = 0.05,
+        status_interval: float = 10.0,
+        retry_interval: float = 5.0,
+    ):
+        """
+        Args:
+            dsn: The connection parameters of the source database.
+            slot_name: The replication slot, created when missing.
+            publication: The publication of the account table, created
+                when missing.
+            table: The account table.
+            batch_size: The number of row changes published at once.
+            batch_timeout: The seconds a change waits for its batch to fill.
+            status_interval: The seconds between two standby status
+                updates sent to the server.
+            retry_interval: The seconds between two attempts to stream the
+                slot.
+        """
+        self.dsn = dsn
+        self.slot_name = slot_name
+        self.publication = publication
+        self.table = table
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.status_interval = status_interval
+        self.retry_interval = retry_interval
+
+        self._lock = Lock()
+
+        self.stats = {
+            'streaming': False,
+            'transactions': 0,
+            'records': 0,
+            'deletes': 0,
+            'batches': 0,
+            'errors': 0,
+            'flushed_lsn': None,
+            # seconds between the last commit published and its delivery
+            'last_lag_seconds': None,
+            'last_batch_size': 0,
+            'last_batch_seconds': None,
+        }
+
+    def metrics(self) -> dict:
+        """Throughput, lag and checkpoint of the driver."""
+        with self._lock:
+            return dict(self.stats)
+
+    def setup(self):
+        """Create the publication and the replication slot when missing."""
+        conn = psycopg2.connect(**self.dsn)
+        conn.autocommit = True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1 FROM pg_publication WHERE pubname = %s',
+                    (self.publication,))
+
+                if cur.fetchone() is None:
+                    cur.execute(F'CREATE PUBLICATION "{self.publication}" '
+                        F'FOR TABLE "{self.table}"')
+
+                cur.execute('SELECT 1 FROM pg_replication_slots '
+                    'WHERE slot_name = %s', (self.slot_name,))
+
+                if cur.fetchone() is None:
+                    cur.execute('SELECT pg_create_logical_replication_slot('
+                        '%s, \'pgoutput\')', (self.slot_name,))
+        finally:
+            conn.close()
+
+    def record(self, change: Change) -> Tuple[int, Optional[dict]]:
+        """The source record of a row change, None for deletes."""
+        acct_id = int(change.row['acct_id'])
+
+        if change.kind == 'D':
+            return acct_id, None
+
+        name = change.row.get('name')
+        last_modified = change.row.get('last_modified')
+
+        return acct_id, {
+            'acct_id': acct_id,
+            'name': name,
+            'last_change_id': int(change.row['last_change_id']),
+            'last_modified': parse_timestamp(last_modified)
+                if last_modified else None,
+        }
+
+    async def publish(self, records: Dict[int, Optional[dict]],
+        committed_on: datetime):
+        """Publish the latest record of every account of a batch."""
+        from replica_api.kafka_producer import get_account_producer, \
+            get_status_producer
+
+        kafka = settings.KAFKA_API
+
+        account_producer = get_account_producer(kafka)
+        await asyncio.gather(*[account_producer.produce(acct_id, value)
+            for acct_id, value in records.items()])
+
+        status_producer = get_status_producer(kafka)
+        await asyncio.gather(*[status_producer.produce(acct_id, {
+            'label': settings.SOURCE_LABEL,
+            'outcome': OUTCOME_SUCCESS,
+            'version': str(value['last_change_id']) if value else None,
+            'updatedOn': value['last_modified'] if value else committed_on,
+        }) for acct_id, value in records.items()])
+
+    async def stream(self):
+        """Stream the slot until the connection fails."""
+        conn = psycopg2.connect(**self.dsn,
+            connection_factory=LogicalReplicationConnection)
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(conn.fileno(), readable.set)
+
+        try:
+            cur = conn.cursor()
+            cur.start_replication(slot_name=self.slot_name, decode=False,
+                options={
+                    'proto_version': '1',
+                    'publication_names': self.publication,
+                })
+
+            with self._lock:
+                self.stats['streaming'] = True
+            logger.info('Streaming logical replication slot', extra={
+                'slot': self.slot_name })
+
+            decoder = Decoder()
+            # account -> latest record of the committed transactions
+            batch: Dict[int, Optional[dict]] = {}
+            # changes of the transaction being received
+            pending: Dict[int, Optional[dict]] = {}
+            batch_lsn, batch_committed_on, batch_started = None, None, None
+            changes, transactions = 0, 0
+            last_status = time.monotonic()
+
+            while True:
+                msg: Optional[ReplicationMessage] = cur.read_message()
+
+                if msg is not None:
+                    kind, value = decoder.decode(msg.payload)
+
+                    if kind in ('I', 'U', 'D') and \
+                        value.relation.name == self.table:
+                        acct_id, record = self.record(value)
+                        pending[acct_id] = record
+                        changes += 1
+                    elif kind == 'C':
+                        # only whole transactions are published
+                        batch.update(pending)
+                        pending.clear()
+                        batch_lsn, batch_committed_on = value
+                        batch_started = batch_started or time.monotonic()
+                        transactions += 1
+
+                    if changes < self.batch_size:
+                        continue
+
+                now = time.monotonic()
+
+                if batch_lsn is not None and (changes >= self.batch_size
+                    or now - batch_started >= self.batch_timeout):
+                    await self.publish(batch, batch_committed_on)
+                    # the checkpoint, streaming resumes after it
+                    cur.send_feedback(flush_lsn=batch_lsn)
+                    last_status = time.monotonic()
+
+                    with self._lock:
+                        self.stats['transactions'] += transactions
+                        self.stats['records'] += len(batch)
+                        self.stats['deletes'] += sum(1 for record
+                            in batch.values() if record is None)
+                        self.stats['batches'] += 1
+                        self.stats['flushed_lsn'] = \
+                            F'{batch_lsn >> 32:X}/{batch_lsn & 0xFFFFFFFF:X}'
+                        self.stats['last_lag_seconds'] = \
+                            (datetime.utcnow() - batch_committed_on) \
+                            .total_seconds()
+                        self.stats['last_batch_size'] = len(batch)
+                        self.stats['last_batch_seconds'] = \
+                            last_status - batch_started
+
+                    batch.clear()
+                    batch_lsn, batch_committed_on, batch_started = \
+                        None, None, None
+                    changes, transactions = len(pending), 0
+
+                if now - last_status >= self.status_interval:
+                    cur.send_feedback()
+                    last_status = now
+
+                if msg is None:
+                    readable.clear()
+                    timeout = self.batch_timeout if batch_lsn is not None \
+                        else self.status_interval
+                    try:
+                        await asyncio.wait_for(readable.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+
+            with self._lock:
+                self.stats['streaming'] = False
+
+    async def run(self):
+        while True:
+            try:
+                self.setup()
+                await self.stream()
+            except errors.ObjectInUse:
+                logger.info('Replication slot is streamed by another process',
+                    extra={ 'slot': self.slot_name })
+            except Exception:
+                logger.error('logical replication source failed',
+                    exc_info=True)
+                with self._lock:
+                    self.stats['errors'] += 1
+
+            await asyncio.sleep(self.retry_interval)
+
+    def start(self):
+        logger.info('Starting logical replication source')
+        Thread(target=asyncio.run, args=(self.run(),), daemon=True,
+            name='logical_source').start()
+
+
+source = LogicalSource(**settings.LOGICAL_REPLICATION)
+_started = False
+_start_lock = Lock()
+
+
+def start_source():
+    """Start streaming the source database, at most once per process."""
+    global _started
+
+    with _start_lock:
+        if _started or settings.SOURCE_MODE != sources.MODE_LOGICAL:
+            return
+        _started = True
+
+    source.start()
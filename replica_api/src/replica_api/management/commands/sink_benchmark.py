@@ -0,0 +1,87 @@
+import time
+from datetime import datetime
+from typing import Callable, List
+from psycopg2.extras import execute_batch
+from django.core.management.base import BaseCommand
+from replica_api.sink_writer import COLUMNS, SinkTable
+
+
+class Command(BaseCommand):
+    help = 'Compare per record upserts, as the JDBC sink connector writes ' \
+        'them, with COPY batch upserts on a sink database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-hostname', required=True)
+        parser.add_argument('--db-port', type=int, default=5432)
+        parser.add_argument('--db-name', required=True)
+        parser.add_argument('--db-user', required=True)
+        parser.add_argument('--db-password', default='')
+        parser.add_argument('--records', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        # batch.size default of the JDBC sink connector
+        parser.add_argument('--jdbc-batch-size', type=int, default=3000)
+
+    def handle(self, *args, **options):
+        dsn = {
+            'host': options['db_hostname'],
+            'port': options['db_port'],
+            'dbname': options['db_name'],
+            'user': options['db_user'],
+            'password': options['db_password'],
+        }
+        now = datetime.utcnow()
+
+        def records(change_id: int) -> List[dict]:
+            return [{
+                'acct_id': acct_id,
+                'name': F'account {acct_id}',
+                'last_change_id': change_id,
+                'last_modified': now,
+            } for acct_id in range(1, options['records'] + 1)]
+
+        jdbc_table = SinkTable(dsn, 'replica_benchmark_jdbc')
+        copy_table = SinkTable(dsn, 'replica_benchmark_copy')
+
+        def write_jdbc(batch: List[dict]):
+            # one prepared upsert per record, sent in pages and committed
+            # per batch like the connector
+            with jdbc_table.conn, jdbc_table.conn.cursor() as cur:
+                execute_batch(cur,
+                    'INSERT INTO "replica_benchmark_jdbc" '
+                    '("acct_id","name","last_change_id","last_modified") '
+                    'VALUES (%s,%s,%s,%s) '
+                    'ON CONFLICT ("acct_id") DO UPDATE SET '
+                    '"name" = EXCLUDED."name",'
+                    '"last_change_id" = EXCLUDED."last_change_id",'
+                    '"last_modified" = EXCLUDED."last_modified"',
+                    [tuple(record[column] for column in COLUMNS)
+                        for record in batch])
+
+        def write_copy(batch: List[dict]):
+            copy_table.write(batch, [])
+
+        def run(name: str, write: Callable[[List[dict]], None],
+            batch_size: int):
+            for phase, change_id in (('insert', 1), ('update', 2)):
+                rows = records(change_id)
+                started = time.monotonic()
+
+                for i in range(0, len(rows), batch_size):
+                    write(rows[i:i + batch_size])
+
+                seconds = time.monotonic() - started
+                self.stdout.write(F'{name:<5} {phase:<7} {len(rows)} records '
+                    F'in {seconds:.2f}s, {len(rows) / seconds:.0f} records/s')
+
+        try:
+            for table in (jdbc_table, copy_table):
+                table.connect()
+
+            run('jdbc', write_jdbc, options['jdbc_batch_size'])
+            run('copy', write_copy, options['batch_size'])
+        finally:
+            for table in (jdbc_table, copy_table):
+                if table.conn is not None:
+                    with table.conn, table.conn.cursor() as cur:
+                        cur.execute(F'DROP TABLE IF EXISTS "{table.table}"')
+                table.close()
@@ -0,0 +1,39 @@
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from replica_api.sink_writer import SinkWriter
+
+
+class Command(BaseCommand):
+    help = 'Write a sink topic to its sink database with COPY batch upserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-hostname', required=True)
+        parser.add_argument('--db-port', type=int, default=5432)
+        parser.add_argument('--db-name', required=True)
+        parser.add_argument('--db-table', required=True)
+        parser.add_argument('--db-user', required=True)
+        parser.add_argument('--db-password', default='')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--batch-timeout', type=float, default=1.0)
+        parser.add_argument('--idle-exit', type=float, default=None,
+            help='stop once no record was received for this many seconds')
+
+    def handle(self, *args, **options):
+        writer = SinkWriter(settings.KAFKA_API,
+            db_hostname=options['db_hostname'],
+            db_port=options['db_port'],
+            db_name=options['db_name'],
+            db_table=options['db_table'],
+            db_user=options['db_user'],
+            db_password=options['db_password'],
+            batch_size=options['batch_size'],
+            batch_timeout=options['batch_timeout'])
+
+        asyncio.run(writer.run(idle_exit=options['idle_exit']))
+
+        stats = writer.stats
+        rate = stats['records'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(F"{stats['records']} records in {stats['batches']} "
+            F"batches, {stats['upserts']} upserts, {stats['deletes']} "
+            F"deletes, {rate:.0f} records/s")
@@ -0,0 +1,27 @@
+import asyncio
+import json
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from replica_api.models import verify
+
+
+class Command(BaseCommand):
+    help = 'Compare the source accounts with sink tables by range ' \
+        'checksums, the sinks are read as JSON from standard input the ' \
+        'way v1/cluster/snk/verify/ takes them.'
+
+    def handle(self, *args, **options):
+        data = verify.verify_schema(json.load(sys.stdin))
+
+        async def run():
+            async with settings.SQLALCHEMY_DATABASES.db_context() as db:
+                return await verify.verify(settings.KAFKA_API, db,
+                    data['sinks'], repair=data['repair'],
+                    fanout=data['fanout'], leaf_size=data['leaf_size'])
+
+        results = asyncio.run(run())
+        self.stdout.write(json.dumps(results, indent=4))
+
+        if not all(result.get('in_sync') for result in results):
+            sys.exit(1)
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import time
+from typing import Iterator, Set
+from weakref import WeakSet
+from asgiref.sync import SyncToAsync, markcoroutinefunction
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, \
+    REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+# Requests
+REQUEST_SECONDS = Histogram('replica_api_request_seconds',
+    'Time spent serving a request.', ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge('replica_api_requests_in_flight',
+    'Requests being served.', ['route'], multiprocess_mode='livesum')
+
+
+# Database pool
+DB_CHECKOUT_SECONDS = Histogram('replica_api_db_checkout_seconds',
+    'Time waited for a database pool connection.',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+        5, 10, 30))
+
+
+# Upstream services
+UPSTREAM_SECONDS = Histogram('replica_api_upstream_seconds',
+    'Time spent calling an upstream service, retries included.',
+    ['upstream', 'method'])
+UPSTREAM_ERRORS = Counter('replica_api_upstream_errors',
+    'Upstream calls which failed or answered a server error.',
+    ['upstream', 'reason'])
+
+
+class ThreadPoolCollector:
+    """Report the threads serving the blocking calls, read on scrape.
+
+    ``sync_to_async`` runs every request on its own single thread executor
+    and ``run_in_executor(None, ...)`` calls share the default executor of
+    the event loop. Nothing is measured between two scrapes.
+    """
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        threads = GaugeMetricFamily('replica_api_thread_pool_threads',
+            'Threads started by the executors.', labels=['executor'])
+        queued = GaugeMetricFamily('replica_api_thread_pool_queued',
+            'Calls waiting for an executor thread.', labels=['executor'])
+        capacity = GaugeMetricFamily('replica_api_thread_pool_max_threads',
+            'Threads the executors may start.', labels=['executor'])
+
+        threads.add_metric(['sync_to_async'],
+            len(SyncToAsync.context_to_thread_executor))
+
+        try:
+            executor = getattr(asyncio.get_running_loop(),
+                '_default_executor', None)
+        except RuntimeError:
+            executor = None
+
+        if executor is not None:
+            threads.add_metric(['default'], len(executor._threads))
+            queued.add_metric(['default'], executor._work_queue.qsize())
+            capacity.add_metric(['default'], executor._max_workers)
+
+        yield threads
+        yield queued
+        yield capacity
+
+
+class PoolCollector:
+    """Report the connections of the instrumented pools, read on scrape."""
+
+    def __init__(self):
+        self.pools: Set[QueuePool] = WeakSet()
+
+    def timed(self, connect):
+        def connect_timed():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+        return connect_timed
+
+    def instrument(self, pool):
+        """Time the checkouts of a pool from now on."""
+        if not isinstance(pool, QueuePool) or pool in self.pools:
+            return
+
+        # pools have no event before a checkout, their connect is timed
+        pool.connect = self.timed(pool.connect)
+        self.pools.add(pool)
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        connections = GaugeMetricFamily('replica_api_db_pool_connections',
+            'Database pool connections by state.', labels=['state'])
+        size = GaugeMetricFamily('replica_api_db_pool_size',
+            'Connections the database pools keep open.')
+
+        pools = list(self.pools)
+
+        connections.add_metric(['checked_out'],
+            sum(pool.checkedout() for pool in pools))
+        connections.add_metric(['idle'],
+            sum(pool.checkedin() for pool in pools))
+        connections.add_metric(['overflow'],
+            sum(max(0, pool.overflow()) for pool in pools))
+        size.add_metric([], sum(pool.size() for pool in pools))
+
+        yield connections
+        yield size
+
+
+pool_collector = PoolCollector()
+
+
+@event.listens_for(Engine, 'engine_connect')
+def on_engine_connect(connection, *args):
+    pool_collector.instrument(connection.engine.pool)
+
+
+def latest() -> bytes:
+    """The metrics of the process, or of every worker in multiprocess mode.
+
+    The pool and thread pool collectors are read from the serving process
+    only.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(pool_collector)
+    registry.register(ThreadPoolCollector())
+
+    return generate_latest(registry)
+
+
+class MetricsMiddleware:
+    """Time the requests by route and count those in flight."""
+
+    sync_capable = False
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        markcoroutinefunction(self)
+
+    async def process_view(self, request, view_func, view_args,
+        view_kwargs):
+        request.metrics_route = request.resolver_match.route
+        REQUESTS_IN_FLIGHT.labels(request.metrics_route).inc()
+
+    async def __call__(self, request):
+        started = time.perf_counter()
+        status = 500
+
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            # unresolved URLs are not labelled by path, it is unbounded
+            route = getattr(request, 'metrics_route', None)
+
+            if route is not None:
+                REQUESTS_IN_FLIGHT.labels(route).dec()
+
+            REQUEST_SECONDS.labels(request.method, route or 'unmatched',
+                status).observe(time.perf_counter() - started)
+
+
+REGISTRY.register(pool_collector)
+REGISTRY.register(ThreadPoolCollector())
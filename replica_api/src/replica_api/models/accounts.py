@@ -1,16 +1,25 @@
 from asyncio.log import logger
 from asgiref.sync import sync_to_async
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
 import logging
 import json
-from typing import List
-from requests import Response
+from typing import Dict, List, Optional, Tuple, Union
 import sqlalchemy as orm
 from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.ext.asyncio import AsyncSession
-from voluptuous import Schema, Required, All, Length, ALLOW_EXTRA
-from st1_kafka_api import KafkaAPI
+from voluptuous import Schema, Required, All, Length, Range, ALLOW_EXTRA
+from django.conf import settings
+from replica_api.cache import AccountCache, AccountRecord
+from replica_api.kafka_api import KafkaAPI
+from replica_api.kafka_producer import get_target_producer
+from replica_api.lag import lag_index
+from replica_api.models import sources
+from replica_api.outbox import notify_relay
+from replica_api.read_router import ReadRouter
 
 
 logger = logging.getLogger(__name__)
@@ -41,8 +50,70 @@ class Account(Base):
         server_onupdate=orm.func.now())
 
 
+class AccountOutbox(Base):
+    """A database table of account changes waiting to be published."""
+    __tablename__ = "account_outbox"
+
+    id = orm.Column('outbox_id', orm.BigInteger, primary_key=True)
+    account_id = orm.Column(orm.Integer)
+    change_id = orm.Column(orm.Integer)
+    created_on = orm.Column(orm.DateTime, server_default=orm.func.now())
+
+
+# Cache
+account_cache = AccountCache(**settings.ACCOUNT_CACHE)
+
+read_router = ReadRouter(settings.READ_REPLICAS,
+    settings.READ_REPLICA_POOL_SIZE)
+
+
+def to_record(acct: Account) -> AccountRecord:
+    return AccountRecord(
+        id=acct.id,
+        name=acct.name,
+        last_change_id=acct.last_change_id,
+        last_modified=acct.last_modified)
+
+
+# Serializers
+# the columns rows are read as when only serialized, which skips building
+# the ORM objects
+ACCOUNT_COLUMNS = (Account.id, Account.name, Account.last_change_id,
+    Account.last_modified)
+
+
+def account_json(row: Tuple[int, Optional[str], int, Optional[datetime]]) \
+    -> dict:
+    """Serialize an account from its columns.
+
+    Args:
+        row: The ``ACCOUNT_COLUMNS`` of an account, e.g. a row or an account
+            record.
+    """
+    acct_id, name, last_change_id, last_modified = row
+
+    return {
+        'id': acct_id,
+        'name': name,
+        'lastChange': {
+            'id': last_change_id,
+            'on': last_modified,
+        },
+    }
+
+
+def invalidate_on_change(acct_id: int, status: dict):
+    """Drop cached copies older than a change seen on the status stream.
+
+    Catches changes made by writers other than this API.
+    """
+    if status['label'] == settings.SOURCE_LABEL and status['version']:
+        account_cache.invalidate(acct_id, int(status['version']))
+
+
 # Validators
 account_name_field = All(str, Length(min=1, max=255))
+targets_field = [All(str, Length(min=1,max=255))]
 
 
 create_account_schema = Schema({
@@ -55,12 +126,48 @@ update_account_schema = Schema({
 }, extra=ALLOW_EXTRA)
 
 
+MAX_BATCH_ACCOUNTS = 500
+
+
+get_accounts_schema = Schema(All(
+    [All(int, Range(min=1))],
+    Length(min=1, max=MAX_BATCH_ACCOUNTS),
+))
+
+
+MAX_LAG_LIMIT = 1000
+
+
+lag_limit_schema = Schema(All(int, Range(min=1, max=MAX_LAG_LIMIT)))
+
+
+min_change_id_schema = Schema(All(int, Range(min=1)))
+
+
 set_targets_schema = Schema({
-    Required('targets'): [All(str, Length(min=1,max=255))]
+    Required('targets'): targets_field,
+}, extra=ALLOW_EXTRA)
+
+
+set_many_targets_schema = Schema({
+    Required('accounts'): [{
+        Required('id'): int,
+        Required('targets'): targets_field,
+    }],
 }, extra=ALLOW_EXTRA)
 
 
 # Logic
+def add_outbox(db: AsyncSession, acct_id: int, change_id: int):
+    """Record an account change in the outbox when it is enabled.
+
+    Must be called within the transaction of the change so the change is
+    published if, and only if, it is committed.
+    """
+    if settings.SOURCE_MODE == sources.MODE_OUTBOX:
+        db.add(AccountOutbox(account_id=acct_id, change_id=change_id))
+
+
 @sync_to_async
 def create_account(db: AsyncSession, name: str = "") -> Account:
     """Create a new account.
@@ -78,8 +185,13 @@ def create_account(db: AsyncSession, name: str = "") -> Account:
         db.flush()
         
         acct.last_change_id = acct_change.id
+        acct_id, version = acct.id, acct_change.id
+        add_outbox(db, acct_id, version)
         db.commit()
 
+    account_cache.invalidate(acct_id, version)
+    notify_relay()
+
     return acct
 
 
@@ -110,20 +222,52 @@ def update_account(db: AsyncSession, acct_id: int, **acct_data: dict) \
         
         acct.last_change_id = account_change.id
         acct.last_modified = datetime.utcnow()
+        version = account_change.id
+        add_outbox(db, acct_id, version)
         db.commit()
 
+    account_cache.invalidate(acct_id, version)
+    notify_relay()
+
     return acct
 
 
 @sync_to_async
-def list_accounts(db: AsyncSession) -> List[Account]:
-    """List all accounts."""
-    return [acct for acct in db.scalars(select(Account).order_by(orm.asc(Account.id)))]
+def list_accounts(db: AsyncSession) -> List[orm.engine.Row]:
+    """List all accounts.
+
+    Returns:
+        The ``ACCOUNT_COLUMNS`` rows of the accounts.
+    """
+    return db.execute(
+        select(*ACCOUNT_COLUMNS)
+        .order_by(orm.asc(Account.id))) \
+        .all()
+
+
+@sync_to_async
+def list_accounts_after(db: AsyncSession, after_id: int, limit: int) \
+    -> List[AccountRecord]:
+    """List a chunk of accounts in account ID order.
+
+    Args:
+        after_id: Only accounts with a greater ID are listed.
+        limit: The chunk size.
+
+    Returns:
+        Detached account records, fewer than ``limit`` once the last chunk
+        is reached.
+    """
+    return [to_record(acct) for acct in db.scalars(
+        select(Account)
+        .where(Account.id > after_id)
+        .order_by(orm.asc(Account.id))
+        .limit(limit))]
 
 
 @sync_to_async
-def get_account(db: AsyncSession, acct_id: int) -> Account:
-    """Get a single account.
+def get_account(db: AsyncSession, acct_id: int) -> Optional[AccountRecord]:
+    """Get a single account, through the account cache.
 
     Args:
         account_id: The account ID.
@@ -131,11 +275,237 @@ def get_account(db: AsyncSession, acct_id: int) -> Account:
     Returns:
         An account record.
     """
-    qry = db.scalars(
-        select(Account)
-        .where(Account.id == acct_id))
+    def load() -> Optional[AccountRecord]:
+        acct = db.scalars(
+            select(Account)
+            .where(Account.id == acct_id)) \
+            .first()
+
+        return to_record(acct) if acct else None
+
+    return account_cache.get(acct_id, load)
+
+
+@sync_to_async
+def get_replica_account(acct_id: int, min_change_id: Optional[int] = None) \
+    -> Optional[AccountRecord]:
+    """Get a single account without the source database.
+
+    Served by the account cache, or by a sink replica which applied at least
+    the requested version when read routing is enabled.
+
+    Args:
+        account_id: The account ID.
+        min_change_id: The last change ID the caller needs.
+
+    Returns:
+        An account record, None when the source database must be read.
+    """
+    record = account_cache.peek(acct_id)
+
+    if record is not None and (min_change_id is None or
+        record.last_change_id >= min_change_id):
+        return record
+
+    if not read_router.enabled:
+        return None
+
+    # a write of this process is known before its source status event,
+    # replicas must have applied it too
+    known = account_cache.min_version(acct_id)
 
-    return qry.first()
+    if known is not None:
+        min_change_id = max(min_change_id or 0, known)
+
+    return read_router.get_account(acct_id, min_change_id)
+
+
+@sync_to_async
+def get_account_version(db: AsyncSession, acct_id: int) \
+    -> Optional[Tuple[int, datetime]]:
+    """Get the version of a single account without loading it.
+
+    Args:
+        account_id: The account ID.
+
+    Returns:
+        The last change ID and last modified time of the account, or None
+        when the account does not exist.
+    """
+    record = account_cache.peek(acct_id)
+
+    if record is not None:
+        return record.last_change_id, record.last_modified
+
+    return db.execute(
+        select(Account.last_change_id, Account.last_modified)
+        .where(Account.id == acct_id)) \
+        .first()
+
+
+@sync_to_async
+def get_accounts_version(db: AsyncSession) \
+    -> Tuple[int, Optional[int], Optional[datetime]]:
+    """Get the version of the account list without loading it.
+
+    Returns:
+        The number of accounts, the greatest last change ID and the greatest
+        last modified time over all accounts.
+    """
+    return db.execute(
+        select(
+            orm.func.count(Account.id),
+            orm.func.max(Account.last_change_id),
+            orm.func.max(Account.last_modified))) \
+        .one()
+
+
+@sync_to_async
+def get_accounts(db: AsyncSession, acct_ids: List[int]) \
+    -> List[orm.engine.Row]:
+    """Get many accounts in a single query.
+
+    Args:
+        acct_ids: The account IDs.
+
+    Returns:
+        The ``ACCOUNT_COLUMNS`` rows of the accounts found, accounts which do
+        not exist are omitted.
+    """
+    ids = orm.bindparam('acct_ids', acct_ids, type_=ARRAY(orm.Integer))
+
+    return db.execute(
+        select(*ACCOUNT_COLUMNS)
+        .where(Account.id == orm.any_(ids))) \
+        .all()
+
+
+# Outbox
+# any key shared by the relays of every process, held for one batch
+OUTBOX_LOCK_ID = 0x7265706c
+
+
+@sync_to_async
+def claim_outbox(db: AsyncSession, limit: int) \
+    -> Optional[List[Tuple[int, datetime, Optional[AccountRecord]]]]:
+    """Begin publishing the oldest changes of the outbox.
+
+    Opens a transaction holding the outbox lock, the transaction is ended by
+    ``release_outbox`` once the changes are published. A single relay
+    publishes at a time so the changes of an account are never reordered.
+
+    Args:
+        limit: The maximum number of changes claimed.
+
+    Returns:
+        The outbox ID, the time of the change and the current state of the
+        account of each change in outbox order, or None when another relay
+        holds the lock. The account is None when it no longer exists.
+    """
+    db.begin()
+
+    if not db.execute(
+        select(orm.func.pg_try_advisory_xact_lock(OUTBOX_LOCK_ID))).scalar():
+        db.rollback()
+        return None
+
+    return [(outbox_id, created_on, to_record(acct) if acct else None)
+        for outbox_id, created_on, acct in db.execute(
+            select(AccountOutbox.id, AccountOutbox.created_on, Account)
+            .outerjoin(Account, Account.id == AccountOutbox.account_id)
+            .order_by(orm.asc(AccountOutbox.id))
+            .limit(limit))]
+
+
+@sync_to_async
+def release_outbox(db: AsyncSession, outbox_ids: Optional[List[int]]):
+    """End the transaction opened by ``claim_outbox``.
+
+    Args:
+        outbox_ids: The published changes to delete from the outbox, None
+            leaves the outbox untouched so the changes are claimed again.
+    """
+    if outbox_ids is None:
+        db.rollback()
+        return
+
+    ids = orm.bindparam('outbox_ids', outbox_ids, type_=ARRAY(orm.BigInteger))
+
+    db.execute(orm.delete(AccountOutbox)
+        .where(AccountOutbox.id == orm.any_(ids)))
+    db.commit()
+
+
+@sync_to_async
+def count_outbox(db: AsyncSession) -> Tuple[int, Optional[datetime]]:
+    """Get the number of changes waiting in the outbox and the oldest one."""
+    return db.execute(
+        select(
+            orm.func.count(AccountOutbox.id),
+            orm.func.min(AccountOutbox.created_on))) \
+        .one()
+
+
+# Targets
+# any key shared by every process, target writes share it while the
+# partition migration holds it alone
+TARGETS_LOCK_ID = 0x74726773
+
+
+class TargetsLocked(Exception):
+    """The target topic is being migrated, targets can not be written."""
+
+
+@sync_to_async
+def lock_targets(db: AsyncSession, exclusive: bool = False) -> bool:
+    """Open a transaction holding the targets lock.
+
+    The transaction is ended by ``unlock_targets``. Writers share the lock
+    and never wait, the partition migration waits for the writes in flight
+    and then holds it alone.
+
+    Args:
+        exclusive: Whether to hold the lock alone.
+
+    Returns:
+        Whether the lock is held, a shared lock is refused while the
+        migration holds or waits for it.
+    """
+    db.begin()
+
+    if exclusive:
+        db.execute(select(orm.func.pg_advisory_xact_lock(TARGETS_LOCK_ID)))
+        return True
+
+    if not db.execute(select(
+        orm.func.pg_try_advisory_xact_lock_shared(TARGETS_LOCK_ID))).scalar():
+        db.rollback()
+        return False
+
+    return True
+
+
+@sync_to_async
+def unlock_targets(db: AsyncSession):
+    """End the transaction opened by ``lock_targets``."""
+    db.rollback()
+
+
+@asynccontextmanager
+async def writing_targets(db: AsyncSession):
+    """Hold the shared targets lock while target records are produced.
+
+    Raises:
+        TargetsLocked: A partition migration is running.
+    """
+    if not await lock_targets(db):
+        raise TargetsLocked('a partition migration is running, try again '
+            'once it completed')
+
+    try:
+        yield
+    finally:
+        await unlock_targets(db)
 
 
 async def get_trg(
@@ -166,30 +536,118 @@ async def get_trg(
         return []
 
 
+async def get_trgs(
+    kafka: KafkaAPI,
+    acct_ids: Optional[List[int]] = None,
+    strict: bool = False,
+) -> Dict[int, List[str]]:
+    """Get the database targets of many accounts in a single pull query.
+
+    Args:
+        acct_ids: The account IDs, None scans the targets of every account.
+        strict: Raise when the query fails instead of returning no targets.
+
+    Returns:
+        The database targets keyed by account ID, accounts without targets
+        are omitted.
+    """
+    where = ''
+
+    if acct_ids is not None:
+        ids_str = ','.join(str(int(acct_id)) for acct_id in acct_ids)
+        where = F' WHERE "acct_id" IN ({ids_str})'
+
+    resp = await kafka.ksql.query(
+        'SELECT '
+            '"acct_id",'
+            '"targets" '
+        'FROM "replica_trg_qtbl"'
+        F'{where};')
+
+    if strict:
+        resp.raise_for_status()
+    if resp.status_code != 200:
+        return {}
+    try:
+        data = json.loads(resp.content)
+
+        return {
+            entry['row']['columns'][0]: entry['row']['columns'][1] or []
+            for entry in data[1:] if 'row' in entry
+        }
+    except (TypeError, KeyError, IndexError):
+        if strict:
+            raise
+        logger.warn('unable to deserialize KSQL response', {
+            'account_ids': acct_ids
+        })
+        return {}
+
+
+def target_value(targets: Optional[List[str]]) -> dict:
+    """The "replica_trg_tbl" record value of database targets."""
+    return {'targets': list(targets) if targets else None}
+
+
 async def set_trg(
     kafka: KafkaAPI,
+    db: AsyncSession,
     acct_id: int,
     targets: list,
-) -> Response:
-    """Insert a database target record into the database target KSQL table.
+) -> dict:
+    """Produce a database target record to the database target topic.
+
+    Args:
+        db: A database session, holding the targets lock during the write.
+        acct_id: The account ID.
+        targets: The database targets, an empty list clears them.
 
     Returns:
-        Response from the KSQL API.
-    """
-    if targets:
-        targets_str = "'" + "','".join(targets) + "'"
-
-        return await kafka.ksql.execute(
-            F'INSERT INTO "replica_trg_tbl" ('
-                '"acct_id","targets"'
-            ') VALUES ('
-                F'{acct_id},ARRAY[{targets_str}]'
-            ');')
-
-    return await kafka.ksql.execute(
-        F'INSERT INTO "replica_trg_tbl" ('
-            '"acct_id","targets"'
-        ') VALUES ('
-            F'{acct_id},NULL'
-        ');')
+        The delivery report of the record.
+
+    Raises:
+        TargetsLocked: A partition migration is running.
+    """
+    async with writing_targets(db):
+        report = await get_target_producer(kafka).produce(acct_id,
+            target_value(targets))
+    lag_index.set_targets(acct_id, targets)
+
+    return report
+
+
+async def set_trgs(
+    kafka: KafkaAPI,
+    db: AsyncSession,
+    assignments: Dict[int, list],
+) -> List[Union[dict, Exception]]:
+    """Produce database target records for many accounts at once.
+
+    The records are queued together so the producer batches them, then all
+    delivery reports are awaited.
+
+    Args:
+        db: A database session, holding the targets lock during the writes.
+        assignments: The database targets keyed by account ID.
+
+    Returns:
+        The delivery report, or the delivery error, of each record in the
+        order of the assignments.
+
+    Raises:
+        TargetsLocked: A partition migration is running.
+    """
+    producer = get_target_producer(kafka)
+
+    async with writing_targets(db):
+        reports = await asyncio.gather(*[producer.produce(acct_id,
+            target_value(targets))
+            for acct_id, targets in assignments.items()],
+            return_exceptions=True)
+
+    for (acct_id, targets), report in zip(assignments.items(), reports):
+        if not isinstance(report, Exception):
+            lag_index.set_targets(acct_id, targets)
+
+    return reports
 
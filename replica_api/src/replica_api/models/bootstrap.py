@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+import psycopg2
+from confluent_kafka import KafkaException
+from sqlalchemy.ext.asyncio import AsyncSession
+from voluptuous import Required, All, Any, Range, ALLOW_EXTRA
+from django.conf import settings
+from replica_api.kafka_api import KafkaAPI
+from replica_api.kafka_offsets import commit_offsets, committed_offsets, \
+    end_offsets
+from replica_api.models import accounts, sinks, sources, topology
+from replica_api.sink_writer import SinkTable
+
+
+logger = logging.getLogger(__name__)
+
+
+# Validators
+bootstrap_schema = topology.sink_schema.extend({
+    'routing': Any(*sinks.ROUTING_MODES),
+    Required('chunk_size', default=5000): All(int, Range(min=1)),
+    Required('catch_up_timeout', default=300): All(int, Range(min=1)),
+}, extra=ALLOW_EXTRA)
+
+
+class BootstrapFailed(Exception):
+    """A bootstrap step failed, the following steps were not run."""
+
+
+# Logic
+async def query_id(kafka: KafkaAPI, ktable: str) -> Optional[str]:
+    """Get the ID of the persistent query writing a KSQL table."""
+    resp = await kafka.ksql.execute('SHOW QUERIES;')
+    resp.raise_for_status()
+
+    for entry in json.loads(resp.content):
+        for query in entry.get('queries', []):
+            if ktable in query.get('sinks', []):
+                return query['id']
+
+    return None
+
+
+async def wait_caught_up(kafka: KafkaAPI, query: str,
+    targets: Dict[str, Dict[int, int]], timeout: float) -> bool:
+    """Wait until a KSQL query consumed its input topics up to offsets.
+
+    Args:
+        query: The persistent query ID.
+        targets: The offsets to reach, by topic and partition.
+
+    Returns:
+        Whether the offsets were reached before the timeout elapsed.
+    """
+    group = F'_confluent-ksql-{settings.KSQL_SERVICE_ID}query_{query}'
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        committed = await asyncio.gather(*[committed_offsets(kafka, group,
+            topic) for topic in targets])
+
+        if all(offset == 0 or current.get(partition, -1) >= offset
+            for current, offsets in zip(committed, targets.values())
+            for partition, offset in offsets.items()):
+            return True
+
+        await asyncio.sleep(1)
+
+    return False
+
+
+async def bootstrap(
+    kafka: KafkaAPI,
+    db: AsyncSession,
+    db_hostname: str,
+    db_port: int,
+    db_name: str,
+    db_table: str,
+    db_user: str,
+    db_password: str,
+    tasks_max: Optional[int] = None,
+    profile: Optional[str] = None,
+    routing: Optional[str] = None,
+    chunk_size: int = 5000,
+    catch_up_timeout: float = 300,
+) -> Tuple[List[dict], bool]:
+    """Provision a new sink by bulk loading a snapshot, then streaming.
+
+    The sink KSQL table is created and its query is left to catch up with
+    the accounts and targets which already exist. The end offsets of the
+    sink topic are recorded, then the accounts targeting the sink are read
+    from the source database in chunks and copied into the sink table.
+    Every record written to the sink topic before the recorded offsets is
+    older than the snapshot, so the sink connector is created with its
+    consumer group starting at those offsets: it only streams the changes
+    the snapshot may have missed.
+
+    Args:
+        db: The source database session.
+        tasks_max: The number of tasks of the sink connector.
+        profile: The tuning profile of the sink connector.
+        routing: The sink routing mode.
+        chunk_size: The number of accounts read and copied at once.
+        catch_up_timeout: The seconds the sink KSQL query is given to catch
+            up.
+
+    Returns:
+        The outcome of every step and whether the bootstrap completed.
+    """
+    results = []
+    name = sinks.sink_name(db_hostname, db_name, db_table)
+    label = sinks.sink_label(db_hostname, db_name)
+    routing = routing or settings.SINK_ROUTING
+
+    def applied(step: str, **details):
+        results.append({ 'step': step, 'outcome': 'applied', **details })
+
+    def failed(step: str, reason: str):
+        results.append({ 'step': step, 'outcome': 'failed',
+            'reason': reason })
+        raise BootstrapFailed(step)
+
+    try:
+        state = await topology.get_state(kafka)
+
+        if name in state.connectors:
+            failed('snk/connector', 'the sink connector already exists, '
+                'the sink is already streaming')
+
+        inputs = [sinks.ROUTING_KTABLE_NAME] \
+            if routing == sinks.ROUTING_SHARED \
+            else [settings.TARGET_TOPIC, sources.TOPIC]
+        input_offsets = dict(zip(inputs, await asyncio.gather(*[
+            end_offsets(kafka, topic) for topic in inputs])))
+
+        if name not in state.ktables:
+            resp = await sinks.create_ktable(kafka, db_hostname, db_name,
+                db_table, routing=routing)
+            if resp.status_code >= 300:
+                failed('snk/ktable', resp.text)
+            applied('snk/ktable', status=resp.status_code)
+
+        query = await query_id(kafka, name)
+        if query is None:
+            failed('snk/ktable', 'the sink KSQL query is not running')
+
+        if not await wait_caught_up(kafka, query, input_offsets,
+            catch_up_timeout):
+            failed('snk/catch-up', 'the sink KSQL query did not catch up '
+                F'within {catch_up_timeout}s')
+        applied('snk/catch-up', query=query)
+
+        # everything written before is older than the snapshot
+        handoff = await end_offsets(kafka, name)
+        applied('snk/offsets', offsets=handoff)
+
+        trgs = await accounts.get_trgs(kafka, strict=True)
+        acct_ids = sorted(acct_id for acct_id, targets in trgs.items()
+            if label in targets)
+
+        table = SinkTable({
+            'host': db_hostname,
+            'port': db_port,
+            'dbname': db_name,
+            'user': db_user,
+            'password': db_password,
+        }, db_table)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        count = 0
+
+        try:
+            for i in range(0, len(acct_ids), chunk_size):
+                chunk = await accounts.get_accounts(db,
+                    acct_ids[i:i + chunk_size])
+
+                await loop.run_in_executor(None, table.write, [{
+                    'acct_id': acct.id,
+                    'name': acct.name,
+                    'last_change_id': acct.last_change_id,
+                    'last_modified': acct.last_modified,
+                } for acct in chunk], [])
+                count += len(chunk)
+        finally:
+            table.close()
+
+        applied('snk/snapshot', count=count,
+            seconds=round(time.monotonic() - started, 3))
+
+        await commit_offsets(kafka, F'connect-{name}', name, handoff)
+
+        config = sinks.connector_config(kafka, db_hostname, db_port, db_name,
+            db_table, db_user, db_password, tasks_max, profile)
+        resp = await kafka.connect.put_connector_config(name, config)
+        if resp.status_code >= 300:
+            failed('snk/connector', resp.text)
+        applied('snk/connector', status=resp.status_code)
+    except BootstrapFailed as e:
+        logger.error('sink bootstrap failed', extra={ 'step': str(e),
+            'sink': name })
+        return results, False
+    except (KafkaException, psycopg2.Error) as e:
+        logger.error('sink bootstrap failed', exc_info=True, extra={
+            'sink': name })
+        results.append({ 'step': 'snk/bootstrap', 'outcome': 'failed',
+            'reason': str(e) })
+        return results, False
+
+    return results, True
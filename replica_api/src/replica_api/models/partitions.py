@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Dict, List, Optional, Tuple
+from confluent_kafka import KafkaException
+from httpx import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from voluptuous import Schema, Required, All, Any, Range, ALLOW_EXTRA
+from django.conf import settings
+from replica_api.kafka_api import KafkaAPI
+from replica_api.kafka_producer import close_producers, \
+    get_account_producer, get_target_producer
+from replica_api.models import accounts, sources, sinks, targets, topology
+
+
+logger = logging.getLogger(__name__)
+
+
+# Validators
+migrate_partitions_schema = Schema({
+    Required('partitions'): All(int, Range(min=1)),
+    'tasks_max': All(int, Range(min=1)),
+    'routing': Any(*sinks.ROUTING_MODES),
+}, extra=ALLOW_EXTRA)
+
+
+class MigrationFailed(Exception):
+    """A migration phase failed, the following phases were not run."""
+
+
+# Logic
+def sink_dbs(state: topology.ClusterState) -> List[dict]:
+    """The sinks of the cluster, read back from their connectors.
+
+    The sinks of the registered tables other than the accounts name their
+    table, None when it is no longer registered.
+    """
+    tables = { table.name: table for table in sources.get_tables() }
+    dbs = []
+
+    for name, config in state.connectors.items():
+        if not name.startswith(sinks.NAME_PREFIX):
+            continue
+
+        label, _, table = config['continuum.label'].partition(
+            sources.LABEL_SEPARATOR)
+        db_hostname, db_name = label.split('/', 1)
+        dbs.append({
+            'name': name,
+            'db_hostname': db_hostname,
+            'db_name': db_name,
+            'db_table': config['table.name.format'],
+            'config': config,
+            'table': tables.get(table) if table else sources.ACCOUNT_TABLE,
+        })
+
+    return dbs
+
+
+async def run_phase(results: List[dict], phase: str,
+    calls: Dict[str, Awaitable[Response]]):
+    """Run the calls of a phase concurrently.
+
+    Raises:
+        MigrationFailed: One of the calls failed.
+    """
+    names = list(calls)
+    resps = await asyncio.gather(*calls.values(), return_exceptions=True)
+    failed = False
+
+    for name, resp in zip(names, resps):
+        if isinstance(resp, Exception):
+            failed = True
+            results.append({ 'step': F'{phase}/{name}', 'outcome': 'failed',
+                'reason': str(resp) })
+        elif resp.status_code >= 300:
+            failed = True
+            results.append({ 'step': F'{phase}/{name}', 'outcome': 'failed',
+                'status': resp.status_code, 'reason': resp.text })
+        else:
+            results.append({ 'step': F'{phase}/{name}', 'outcome': 'applied',
+                'status': resp.status_code })
+
+    if failed:
+        raise MigrationFailed(phase)
+
+
+async def wait_topics_deleted(kafka: KafkaAPI, topics: List[str],
+    timeout: float = 60.0):
+    """Wait until the brokers finished deleting topics.
+
+    Raises:
+        MigrationFailed: The topics still exist once the timeout elapsed.
+    """
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        resp = await kafka.ksql.execute('SHOW TOPICS;')
+        resp.raise_for_status()
+
+        existing = set()
+        for entry in json.loads(resp.content):
+            existing.update(topic['name'] for topic in entry.get('topics', []))
+
+        if not existing.intersection(topics):
+            return
+
+        await asyncio.sleep(1)
+
+    raise MigrationFailed('wait-topics-deleted')
+
+
+async def migrate(
+    kafka: KafkaAPI,
+    db: AsyncSession,
+    partitions: int,
+    tasks_max: Optional[int] = None,
+    routing: Optional[str] = None,
+    chunk_size: int = 1000,
+) -> Tuple[List[dict], bool]:
+    """Re-partition the source and target topics of a running topology.
+
+    Partitions can not be added to the topics in place, the account ID to
+    partition mapping of the joins would break. Instead the connectors are
+    paused, the KSQL tables and their topics are dropped and created again
+    with the new partition count, and the topics are refilled: the targets
+    from a snapshot taken before the drop and the accounts from the source
+    database. Target writes are refused from the snapshot until the
+    migration ends. The source connector resumes from its stored offset so
+    changes made while paused are not lost, rows it sends again are
+    idempotent upserts downstream. The sinks, those of the registered tables
+    included, are then fed again from the start.
+
+    Args:
+        db: The source database session.
+        partitions: The new partition count of the source and target topics.
+        tasks_max: The new number of tasks of every sink connector, by
+            default they are left unchanged.
+        routing: The sink routing mode to recreate the sinks with.
+        chunk_size: The number of accounts read from the database at once.
+
+    Returns:
+        The outcome of every step and whether the migration completed.
+
+    Raises:
+        TopologyConflict: Source shards feed the source topic, the topic can
+            only be refilled from this database.
+    """
+    results = []
+    state = await topology.get_state(kafka)
+
+    shards = sorted(name for name in state.connectors
+        if name.startswith(sources.SHARD_PREFIX))
+    if shards:
+        raise topology.TopologyConflict(F'the source topic is shared with '
+            F'the shard connectors {", ".join(shards)}, their rows would be '
+            F'lost')
+    routing = routing or settings.SINK_ROUTING
+    dbs = sink_dbs(state)
+
+    try:
+        await run_phase(results, 'pause', {
+            name: kafka.connect.pause_connector(name)
+            for name in state.connectors
+        })
+
+        # waits for the target writes in flight, later writes are refused
+        # until the migration ends so the snapshot misses none
+        await accounts.lock_targets(db, exclusive=True)
+
+        try:
+            trgs = await accounts.get_trgs(kafka, strict=True)
+        except Exception as e:
+            results.append({ 'step': 'snapshot/targets', 'outcome': 'failed',
+                'reason': str(e) })
+            raise MigrationFailed('snapshot')
+        results.append({ 'step': 'snapshot/targets', 'outcome': 'applied',
+            'count': len(trgs) })
+
+        drop_sinks = {
+            name: kafka.ksql.execute(F'DROP TABLE "{name}" DELETE TOPIC;')
+            for name in state.ktables if name.startswith(sinks.NAME_PREFIX)
+        }
+        if targets.KTABLE_QUERYABLE_NAME in state.ktables:
+            drop_sinks[targets.KTABLE_QUERYABLE_NAME] = \
+                targets.delete_ktable_queryable(kafka)
+        await run_phase(results, 'drop', drop_sinks)
+
+        # the sink tables of the shared routing mode read the routing table,
+        # ksqlDB refuses to drop it before them
+        if sinks.ROUTING_KTABLE_NAME in state.ktables:
+            await run_phase(results, 'drop', {
+                sinks.ROUTING_KTABLE_NAME: kafka.ksql.execute(
+                    F'DROP TABLE "{sinks.ROUTING_KTABLE_NAME}" DELETE TOPIC;'),
+            })
+
+        await run_phase(results, 'drop', {
+            name: kafka.ksql.execute(F'DROP TABLE "{name}" DELETE TOPIC;')
+            for name in (sources.KTABLE_NAME, targets.KTABLE_NAME)
+            if name in state.ktables
+        })
+        await wait_topics_deleted(kafka, [sources.TOPIC,
+            settings.TARGET_TOPIC])
+
+        # dropping the source topic deleted its value subject, register the
+        # non null schema again before ksqlDB registers a nullable one
+        await run_phase(results, 'create', {
+            sources.SCHEMA_SUBJECT: sources.create_schema(kafka),
+        })
+
+        await run_phase(results, 'create', {
+            sources.KTABLE_NAME: sources.create_ktable(kafka, partitions),
+            targets.KTABLE_NAME: targets.create_ktable(kafka, partitions),
+        })
+
+        if routing == sinks.ROUTING_SHARED:
+            await run_phase(results, 'create', {
+                sinks.ROUTING_KTABLE_NAME: sinks.create_routing_ktable(kafka),
+            })
+
+        create_sinks = {
+            targets.KTABLE_QUERYABLE_NAME:
+                targets.create_ktable_queryable(kafka),
+        }
+        for sink in dbs:
+            if sink['table'] == sources.ACCOUNT_TABLE:
+                create_sinks[sink['name']] = sinks.create_ktable(kafka,
+                    sink['db_hostname'], sink['db_name'], sink['db_table'],
+                    routing=routing)
+            elif sink['table'] is not None:
+                create_sinks[sink['name']] = sinks.create_table_ktable(kafka,
+                    sink['db_hostname'], sink['db_name'], sink['table'])
+        await run_phase(results, 'create', create_sinks)
+
+        # the producers cached the schema IDs of the dropped subjects
+        await asyncio.get_running_loop().run_in_executor(None,
+            close_producers)
+
+        # refill the target topic
+        target_producer = get_target_producer(kafka)
+        await asyncio.gather(*[target_producer.produce(acct_id,
+            accounts.target_value(trg)) for acct_id, trg in trgs.items()])
+        results.append({ 'step': 'refill/targets', 'outcome': 'applied',
+            'count': len(trgs) })
+
+        # refill the source topic
+        account_producer = get_account_producer(kafka)
+        after_id, count = 0, 0
+
+        while True:
+            chunk = await accounts.list_accounts_after(db, after_id,
+                chunk_size)
+
+            await asyncio.gather(*[account_producer.produce(acct.id, {
+                'acct_id': acct.id,
+                'name': acct.name,
+                'last_change_id': acct.last_change_id,
+                'last_modified': acct.last_modified,
+            }) for acct in chunk])
+            count += len(chunk)
+
+            if len(chunk) < chunk_size:
+                break
+            after_id = chunk[-1].id
+        results.append({ 'step': 'refill/accounts', 'outcome': 'applied',
+            'count': count })
+
+        if tasks_max:
+            await run_phase(results, 'tasks', {
+                sink['name']: kafka.connect.put_connector_config(sink['name'],
+                    {**sink['config'], 'tasks.max': str(tasks_max)})
+                for sink in dbs
+            })
+
+        # the sinks of unregistered tables lost their KSQL table, they stay
+        # paused until the topology is reconciled
+        orphans = {sink['name'] for sink in dbs if sink['table'] is None}
+        for name in sorted(orphans):
+            results.append({ 'step': F'resume/{name}', 'outcome': 'skipped',
+                'reason': 'the table is no longer registered, reconcile the '
+                    'topology' })
+
+        await run_phase(results, 'resume', {
+            name: kafka.connect.resume_connector(name)
+            for name in state.connectors if name not in orphans
+        })
+    except MigrationFailed as e:
+        logger.error('partition migration failed', extra={ 'phase': str(e) })
+        return results, False
+    except KafkaException as e:
+        logger.error('partition migration failed', exc_info=True)
+        results.append({ 'step': 'refill', 'outcome': 'failed',
+            'reason': str(e) })
+        return results, False
+    finally:
+        await accounts.unlock_targets(db)
+
+    return results, True
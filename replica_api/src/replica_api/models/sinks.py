@@ -1,26 +1,136 @@
-from requests import Response
-from st1_kafka_api import KafkaAPI
+import json
+from typing import Optional
+from django.conf import settings
+from httpx import Response
+from replica_api.kafka_api import KafkaAPI
+from replica_api.models.sources import ACCOUNT_TABLE, SourceTable
+
+
+NAME_PREFIX = 'replica_snk_'
+ROUTING_KTABLE_NAME = 'replica_route_account'
+
+# one join per sink, or one join shared by every sink
+ROUTING_JOIN = 'join'
+ROUTING_SHARED = 'shared'
+ROUTING_MODES = (ROUTING_JOIN, ROUTING_SHARED)
+
+# Tuning profiles of the sink connectors, switching profiles drops every
+# key of the other profiles first. The consumer overrides need the
+# connector.client.config.override.policy of the Connect workers to allow
+# them, the default profile sets none so it runs on any Connect cluster.
+PROFILE_LOW_LATENCY = 'low-latency'
+PROFILE_BALANCED = 'balanced'
+PROFILE_BULK = 'bulk'
+PROFILES = {
+    # write every record as soon as it is fetched
+    PROFILE_LOW_LATENCY: {
+        'batch.size': '500',
+        'consumer.override.max.poll.records': '500',
+        'consumer.override.fetch.min.bytes': '1',
+        'consumer.override.fetch.max.wait.ms': '10',
+        'consumer.override.max.partition.fetch.bytes': '1048576',
+    },
+    # the connector and client defaults
+    PROFILE_BALANCED: {
+        'batch.size': '3000',
+    },
+    # large fetches written in large batches, for backfills
+    PROFILE_BULK: {
+        'batch.size': '10000',
+        'consumer.override.max.poll.records': '10000',
+        'consumer.override.fetch.min.bytes': '1048576',
+        'consumer.override.fetch.max.wait.ms': '1000',
+        'consumer.override.max.partition.fetch.bytes': '10485760',
+    },
+}
+PROFILE_KEYS = {key for profile in PROFILES.values() for key in profile}
+
+
+def sink_name(db_hostname: str, db_name: str, db_table: str) -> str:
+    """The name shared by the sink KSQL table, topic and connector."""
+    return F'{NAME_PREFIX}{db_hostname}_{db_name}_{db_table}'
+
+
+def sink_label(db_hostname: str, db_name: str) -> str:
+    """The target name of the sink database, also its continuum label."""
+    return F'{db_hostname}/{db_name}'
 
 
 # KSQL Table
+async def create_routing_ktable(
+    kafka: KafkaAPI,
+) -> Response:
+    """Create the KSQL table joining every account with its targets once.
+
+    Used by the "shared" routing mode, sink KSQL tables then only filter it.
+
+    Returns:
+        Response from the KSQL API.
+    """
+    return await kafka.ksql.execute(
+        F'CREATE TABLE "{ROUTING_KTABLE_NAME}" AS ' +
+        'SELECT ' +
+            'a."id" AS KEY,' +
+            'AS_VALUE(a."acct_id") AS "acct_id",' +
+            'a."name" AS "name",' +
+            'a."last_change_id" AS "last_change_id",' +
+            'a."last_modified" AS "last_modified",' +
+            't."targets" AS "targets" ' +
+        'FROM "replica_trg_tbl" AS t ' +
+        'INNER JOIN "replica_src_account" AS a ON a."id" = t."acct_id";')
+
+
+async def delete_routing_ktable(
+    kafka: KafkaAPI,
+) -> Response:
+    """Delete the KSQL table joining every account with its targets.
+
+    Returns:
+        Response from the KSQL API.
+    """
+    return await kafka.ksql.execute(F'DROP TABLE "{ROUTING_KTABLE_NAME}";')
+
+
 async def create_ktable(
     kafka: KafkaAPI,
     db_hostname: str,
     db_name: str,
     db_table: str,
+    routing: Optional[str] = None,
 ) -> Response:
     """Create the database sink KSQL table.
 
+    In the "join" routing mode every sink table runs its own join of the
+    targets with the accounts. In the "shared" routing mode the sink table
+    filters the routing table, so the join runs once however many sinks
+    there are.
+
     Args:
         db_hostname: The sink database hostname.
         db_name: The sink database name.
         db_table: The sink database table.
+        routing: The routing mode, defaults to the SINK_ROUTING setting.
 
     Returns:
         Response from the KSQL API.
     """
+    routing = routing or settings.SINK_ROUTING
+
+    if routing == ROUTING_SHARED:
+        return await kafka.ksql.execute(
+            F'CREATE TABLE "{sink_name(db_hostname, db_name, db_table)}" AS ' +
+            'SELECT ' +
+                'KEY,' +
+                '"acct_id",' +
+                '"name",' +
+                '"last_change_id",' +
+                '"last_modified" ' +
+            F'FROM "{ROUTING_KTABLE_NAME}" ' +
+            'WHERE ' +
+                F'ARRAY_CONTAINS("targets", \'{sink_label(db_hostname, db_name)}\');')
+
     return await kafka.ksql.execute(
-        F'CREATE TABLE "replica_snk_{db_hostname}_{db_name}_{db_table}" AS ' +
+        F'CREATE TABLE "{sink_name(db_hostname, db_name, db_table)}" AS ' +
         'SELECT ' +
             'a."id" AS KEY,' +
             'AS_VALUE(a."acct_id") AS "acct_id",' +
@@ -30,7 +140,36 @@ async def create_ktable(
         'FROM "replica_trg_tbl" AS t ' +
         'INNER JOIN "replica_src_account" AS a ON a."id" = t."acct_id" ' +
         'WHERE ' +
-            F'ARRAY_CONTAINS(t."targets", \'{db_hostname}/{db_name}\');')
+            F'ARRAY_CONTAINS(t."targets", \'{sink_label(db_hostname, db_name)}\');')
+
+
+async def create_table_ktable(
+    kafka: KafkaAPI,
+    db_hostname: str,
+    db_name: str,
+    table: SourceTable,
+) -> Response:
+    """Create the sink KSQL table of a registered table.
+
+    The rows follow the targets of their account through a foreign key
+    join of the table with the targets, whatever the routing mode.
+
+    Args:
+        db_hostname: The sink database hostname.
+        db_name: The sink database name.
+        table: The registered table, the sink table has the same name.
+
+    Returns:
+        Response from the KSQL API.
+    """
+    return await kafka.ksql.execute(
+        F'CREATE TABLE "{sink_name(db_hostname, db_name, table.name)}" AS ' +
+        'SELECT r.* ' +
+        F'FROM "{table.topic}" AS r ' +
+        'INNER JOIN "replica_trg_tbl" AS t ' +
+            F'ON r."{table.account_column}" = t."acct_id" ' +
+        'WHERE ' +
+            F'ARRAY_CONTAINS(t."targets", \'{sink_label(db_hostname, db_name)}\');')
 
 
 async def delete_ktable(
@@ -44,12 +183,12 @@ async def delete_ktable(
     Returns:
         Response from the KSQL API.
     """
-    return await kafka.ksql.execute(F'DROP TABLE "replica_snk_{db_hostname}_' +
-        F'{db_name}_{db_table}";')
+    return await kafka.ksql.execute(
+        F'DROP TABLE "{sink_name(db_hostname, db_name, db_table)}";')
 
 
 # Connect
-async def create_connector(
+def connector_config(
     kafka: KafkaAPI,
     db_hostname: str,
     db_port: int,
@@ -57,8 +196,11 @@ async def create_connector(
     db_table: str,
     db_user: str,
     db_password: str,
-) -> Response:
-    """Create the database sink connector.
+    tasks_max: Optional[int] = None,
+    profile: Optional[str] = None,
+    table: SourceTable = ACCOUNT_TABLE,
+) -> dict:
+    """Build the database sink connector configuration.
 
     Args:
         db_hostname: The sink database hostname.
@@ -67,14 +209,21 @@ async def create_connector(
         db_table: The sink database table.
         db_user: The sink database username.
         db_password: The sink database password.
+        tasks_max: The number of tasks writing to the sink database, at
+            most one per partition is useful. Defaults to the SINK_TASKS_MAX
+            setting.
+        profile: The tuning profile, defaults to the SINK_PROFILE setting.
+        table: The registered table written, the accounts by default.
 
     Returns:
-        Response from the Kafka connect API.
+        The Kafka connect connector configuration.
     """
-    return await kafka.connect.create_connector(
-        F'replica_snk_{db_hostname}_{db_name}_{db_table}', {
+    tasks_max = tasks_max or settings.SINK_TASKS_MAX
+    profile = profile or settings.SINK_PROFILE
+
+    return {
         'connector.class': 'io.confluent.connect.jdbc.JdbcSinkConnector',
-        'topics': F'replica_snk_{db_hostname}_{db_name}_{db_table}',
+        'topics': sink_name(db_hostname, db_name, db_table),
         'connection.url': F'jdbc:postgresql://{db_hostname}:{db_port}/{db_name}',
         'connection.user': db_user,
         'connection.password': db_password,
@@ -82,20 +231,91 @@ async def create_connector(
         'value.converter': 'io.confluent.connect.avro.AvroConverter',
         'value.converter.schemas.enabled': True,
         'value.converter.schema.registry.url': kafka.schema_registry.url,
-        'tasks.max': '1',
+        'tasks.max': str(tasks_max),
         'auto.create': True,
         'auto.evolve': True,
         'delete.enabled': True,
         'insert.mode': 'upsert',
         'pk.mode': 'record_key',
-        'pk.fields': 'acct_id',
+        'pk.fields': table.key_column,
         'continuum.topic': 'replica_status',
         'continuum.bootstrap.servers': kafka.bootstrap_servers,
         'continuum.schema.registry.url': kafka.schema_registry.url,
-        'continuum.label': F'{db_hostname}/{db_name}',
-        'continuum.version.column.name': 'last_change_id',
-        'continuum.updatedOn.column.name': 'last_modified',
+        'continuum.label': table.label(sink_label(db_hostname, db_name)),
+        'continuum.version.column.name': table.version_column,
+        'continuum.updatedOn.column.name': table.timestamp_column,
         'table.name.format': db_table,
+        **PROFILES[profile],
+    }
+
+
+async def create_connector(
+    kafka: KafkaAPI,
+    db_hostname: str,
+    db_port: int,
+    db_name: str,
+    db_table: str,
+    db_user: str,
+    db_password: str,
+    tasks_max: Optional[int] = None,
+    profile: Optional[str] = None,
+) -> Response:
+    """Create the database sink connector.
+
+    Args:
+        db_hostname: The sink database hostname.
+        db_port: The sink database port.
+        db_name: The sink database name.
+        db_table: The sink database table.
+        db_user: The sink database username.
+        db_password: The sink database password.
+        tasks_max: The number of tasks writing to the sink database.
+        profile: The tuning profile.
+
+    Returns:
+        Response from the Kafka connect API.
+    """
+    return await kafka.connect.create_connector(
+        sink_name(db_hostname, db_name, db_table),
+        connector_config(kafka, db_hostname, db_port, db_name, db_table,
+            db_user, db_password, tasks_max, profile))
+
+
+async def set_profile(
+    kafka: KafkaAPI,
+    db_hostname: str,
+    db_name: str,
+    db_table: str,
+    profile: str,
+) -> Response:
+    """Switch a running sink connector to another tuning profile.
+
+    The rest of the configuration is left as is, the connector tasks are
+    restarted with the new settings from their committed offsets.
+
+    Args:
+        db_hostname: The sink database hostname.
+        db_name: The sink database name.
+        db_table: The sink database table.
+        profile: The tuning profile.
+
+    Returns:
+        Response from the Kafka connect API.
+    """
+    name = sink_name(db_hostname, db_name, db_table)
+    resp = await kafka.connect.get_connector_config(name)
+
+    if resp.status_code != 200:
+        return resp
+
+    config = {
+        key: value for key, value in json.loads(resp.content).items()
+        if key not in PROFILE_KEYS
+    }
+
+    return await kafka.connect.put_connector_config(name, {
+        **config,
+        **PROFILES[profile],
     })
 
 
@@ -116,7 +336,7 @@ async def delete_connector(
         Response from the Kafka connect API.
     """
     return await kafka.connect.delete_connector(
-        F'replica_snk_{db_hostname}_{db_name}_{db_table}')
+        sink_name(db_hostname, db_name, db_table))
 
 
 async def pause_connector(
@@ -136,7 +356,7 @@ async def pause_connector(
         Response from the Kafka connect API.
     """
     return await kafka.connect.pause_connector(
-        F'replica_snk_{db_hostname}_{db_name}_{db_table}')
+        sink_name(db_hostname, db_name, db_table))
 
 
 async def resume_connector(
@@ -156,7 +376,7 @@ async def resume_connector(
         Response from the Kafka connect API.
     """
     return await kafka.connect.resume_connector(
-        F'replica_snk_{db_hostname}_{db_name}_{db_table}')
+        sink_name(db_hostname, db_name, db_table))
 
 
 async def restart_connector(
@@ -176,5 +396,5 @@ async def restart_connector(
         Response from the Kafka connect API.
     """
     return await kafka.connect.restart_connector(
-        F'replica_snk_{db_hostname}_{db_name}_{db_table}')
+        sink_name(db_hostname, db_name, db_table))
 
@@ -1,5 +1,156 @@
-from requests import Response
-from st1_kafka_api import KafkaAPI
+from typing import List, NamedTuple, Optional
+from django.conf import settings
+from httpx import Response
+from voluptuous import Schema, Required, All, Invalid, Length, Match
+from replica_api.kafka_api import KafkaAPI
+
+
+CONNECTOR_NAME = 'replica_src'
+# source shards each poll their own database with their own connector
+SHARD_PREFIX = 'replica_src_shard_'
+# the registered tables next to the accounts share a second connector, its
+# continuum events are kept apart from those of the accounts
+TABLES_SUFFIX = '_tables'
+KTABLE_NAME = 'replica_src_account'
+SCHEMA_SUBJECT = 'replica_src_account-value'
+TOPIC = 'replica_src_account'
+
+# changes polled by the source connector, published from the outbox or
+# streamed from logical replication
+MODE_CONNECTOR = 'connector'
+MODE_OUTBOX = 'outbox'
+MODE_LOGICAL = 'logical'
+MODES = (MODE_CONNECTOR, MODE_OUTBOX, MODE_LOGICAL)
+
+
+# Value schema of the account records written by the source connector
+account_schema = {
+    'type': 'record',
+    'name': 'account',
+    'fields': [
+        {
+            'name': 'acct_id',
+            'type': 'int'
+        },
+        {
+            'name': 'name',
+            'type': [
+                'null',
+                'string'
+            ],
+            'default': None
+        },
+        {
+            'name': 'last_change_id',
+            'type': 'long'
+        },
+        {
+            'name': 'last_modified',
+            'type': {
+                'type': 'long',
+                'connect.version': 1,
+                'connect.name': 'org.apache.kafka.connect.data.Timestamp',
+                'logicalType': 'timestamp-millis'
+            }
+        }
+    ],
+    'connect.name': 'account',
+}
+
+
+# Tables
+# separates the account label from the table in the continuum labels
+LABEL_SEPARATOR = ':'
+
+
+def is_account_label(label: str) -> bool:
+    """Whether a continuum label reports on the accounts."""
+    return LABEL_SEPARATOR not in label
+
+
+class SourceTable(NamedTuple):
+    """A table replicated by the source connector."""
+    name: str
+    key_column: str
+    version_column: str
+    timestamp_column: str
+    # the account whose targets the rows of the table follow
+    account_column: str
+
+    @property
+    def topic(self) -> str:
+        """The topic of the table, also the name of its KSQL table."""
+        return F'replica_src_{self.name}'
+
+    def label(self, label: str) -> str:
+        """The continuum label of the table, given the one of the accounts.
+
+        Continuum events are keyed by the row ID, the tables other than the
+        accounts are labelled apart so their rows are never read as
+        accounts.
+        """
+        if self.name == ACCOUNT_TABLE.name:
+            return label
+
+        return F'{label}{LABEL_SEPARATOR}{self.name}'
+
+
+ACCOUNT_TABLE = SourceTable(
+    name='account',
+    key_column='acct_id',
+    version_column='last_change_id',
+    timestamp_column='last_modified',
+    account_column='acct_id')
+
+
+column_field = All(str, Match(r'^[a-z_][a-z0-9_]{0,62}$'))
+
+
+def shared_columns(tables: List[dict]) -> List[dict]:
+    """The version and timestamp columns are set once per connector."""
+    for table in tables:
+        for column in ('version_column', 'timestamp_column'):
+            if table[column] != getattr(ACCOUNT_TABLE, column):
+                raise Invalid(F'{column} of table {table["name"]} must be '
+                    F'{getattr(ACCOUNT_TABLE, column)}, it is shared by '
+                    'every table of the source connector')
+
+    return tables
+
+
+tables_schema = Schema(All([{
+    Required('name'): column_field,
+    Required('key_column'): column_field,
+    Required('version_column', default=ACCOUNT_TABLE.version_column):
+        column_field,
+    Required('timestamp_column', default=ACCOUNT_TABLE.timestamp_column):
+        column_field,
+    Required('account_column', default=ACCOUNT_TABLE.account_column):
+        column_field,
+}], shared_columns, Length(max=100)))
+
+
+def get_tables() -> List[SourceTable]:
+    """The table registry: the accounts and the SOURCE_TABLES setting."""
+    return [ACCOUNT_TABLE] + [SourceTable(**table)
+        for table in tables_schema(settings.SOURCE_TABLES)
+        if table['name'] != ACCOUNT_TABLE.name]
+
+
+def connector_name(shard: Optional[str] = None, tables: bool = False) -> str:
+    """The name of the source connector of a shard.
+
+    The unsharded source keeps the name of the single source connector.
+    """
+    name = F'{SHARD_PREFIX}{shard}' if shard else CONNECTOR_NAME
+
+    return name + TABLES_SUFFIX if tables else name
+
+
+def is_connector(name: str) -> bool:
+    """Whether a connector is a source connector, sharded or not."""
+    return name in (CONNECTOR_NAME, CONNECTOR_NAME + TABLES_SUFFIX) or \
+        name.startswith(SHARD_PREFIX)
 
 
 # Schema Registery
@@ -11,63 +162,74 @@ async def create_schema(
     Returns:
         Response from the Kafka Confluent Schema Registry API.
     """
-    return await kafka.schema_registry.create_schema('replica_src_account-value', {
-        'type': 'record',
-        'name': 'account',
-        'fields': [
-            {
-                'name': 'acct_id',
-                'type': 'int'
-            },
-            {
-                'name': 'name',
-                'type': [
-                    'null',
-                    'string'
-                ],
-                'default': None
-            },
-            {
-                'name': 'last_change_id',
-                'type': 'long'
-            },
-            {
-                'name': 'last_modified',
-                'type': {
-                    'type': 'long',
-                    'connect.version': 1,
-                    'connect.name': 'org.apache.kafka.connect.data.Timestamp',
-                    'logicalType': 'timestamp-millis'
-                }
-            }
-        ],
-        'connect.name': 'account',
-    })
+    return await kafka.schema_registry.create_schema(SCHEMA_SUBJECT,
+        account_schema)
 
 
 # KSQL Table
 async def create_ktable(
     kafka: KafkaAPI,
+    partitions: Optional[int] = None,
 ) -> Response:
     """Create the database source KSQL table.
 
+    The source and the target topics are joined on the account ID, they
+    must be created with the same number of partitions.
+
+    Args:
+        partitions: The number of partitions of the source topic, defaults
+            to the TOPOLOGY_PARTITIONS setting.
+
     Returns:
         Response from the KSQL API.
     """
+    partitions = partitions or settings.TOPOLOGY_PARTITIONS
+
     # add NON NULL to columns once 
     #   https://github.com/confluentinc/ksql/issues/4436
     #   released and remove createSchema step
 
     return await kafka.ksql.execute(
-        'CREATE TABLE "replica_src_account" ('
+        F'CREATE TABLE "{KTABLE_NAME}" ('
             '"id" INT PRIMARY KEY,'
             '"acct_id" INT,' # NON NULL
             '"name" STRING,'
             '"last_change_id" BIGINT,' # NON NULL
             '"last_modified" TIMESTAMP' # NON NULL
         ') WITH ('
-            'KAFKA_TOPIC=\'replica_src_account\','
-            'PARTITIONS=1,'
+            F'KAFKA_TOPIC=\'{TOPIC}\','
+            F'PARTITIONS={partitions},'
+            'KEY_FORMAT=\'KAFKA\','
+            'VALUE_FORMAT=\'AVRO\''
+        ');')
+
+
+async def create_table_ktable(
+    kafka: KafkaAPI,
+    table: SourceTable,
+    partitions: Optional[int] = None,
+) -> Response:
+    """Create the KSQL table of a registered table.
+
+    Only the key is declared, the value columns are read from the schema
+    the source connector registers with the first rows of the table.
+
+    Args:
+        table: The registered table.
+        partitions: The number of partitions of the table topic, defaults
+            to the TOPOLOGY_PARTITIONS setting.
+
+    Returns:
+        Response from the KSQL API.
+    """
+    partitions = partitions or settings.TOPOLOGY_PARTITIONS
+
+    return await kafka.ksql.execute(
+        F'CREATE TABLE "{table.topic}" ('
+            '"id" INT PRIMARY KEY'
+        ') WITH ('
+            F'KAFKA_TOPIC=\'{table.topic}\','
+            F'PARTITIONS={partitions},'
             'KEY_FORMAT=\'KAFKA\','
             'VALUE_FORMAT=\'AVRO\''
         ');')
@@ -81,20 +243,37 @@ async def delete_ktable(
     Returns:
         Response from the KSQL API.
     """
-    return await kafka.ksql.execute('DROP TABLE "replica_src_account";')
+    return await kafka.ksql.execute(F'DROP TABLE "{KTABLE_NAME}";')
 
 
 # Connect
-async def create_connector(
+def connector_config(
     kafka: KafkaAPI,
     db_hostname: str,
     db_port: int,
-    db_name: str, 
+    db_name: str,
     db_user: str,
     db_password: str,
-    poll_interval: int
-) -> Response:
-    """Create the database source connector.
+    poll_interval: int,
+    shard: Optional[str] = None,
+    tables: bool = False,
+) -> dict:
+    """Build the database source connector configuration.
+
+    Every shard writes to the same source topic, the account IDs of the
+    shards must not overlap so its keys stay unique, the topology refuses
+    overlapping ID ranges. A shard adds a
+    connector, with its own polling task and offsets, and nothing else.
+
+    The accounts have a connector of their own, its continuum events are
+    read as the versions of the accounts. A single second connector polls
+    every other table of the registry, a table adds a task and a topic.
+    The continuum label is set once per connector, the events of the tables
+    carry the account label with a suffix. The key of every table is
+    extracted by transforms applied to its topic only. The incrementing
+    column is set when every table shares the name of its key column,
+    otherwise the connector detects the auto-incremented column of each
+    table.
 
     Args:
         db_hostname: The source database hostname.
@@ -102,80 +281,179 @@ async def create_connector(
         db_name: The source database name.
         db_user: The source database username.
         db_password: The source database password.
-        topic_prefix: The topic prefix to associate the source database table to.
         poll_interval: The frequency of when the SQL server is queried for changes.
+        shard: The name of the source shard, None when unsharded.
+        tables: Whether to poll the registered tables rather than the
+            accounts.
 
     Returns:
-        Response from the Kafka connect API.
+        The Kafka connect connector configuration.
     """
-    return await kafka.connect.create_connector('replica_src', {
+    if tables:
+        polled = [table for table in get_tables() if table != ACCOUNT_TABLE]
+        label = F'{settings.SOURCE_LABEL}{LABEL_SEPARATOR}tables'
+    else:
+        polled = [ACCOUNT_TABLE]
+        label = settings.SOURCE_LABEL
+
+    keys = {table.key_column for table in polled}
+
+    if len(keys) == 1:
+        key = keys.pop()
+        transforms = {
+            'transforms': 'createKey,extractInt',
+            'transforms.createKey.type': 'org.apache.kafka.connect.transforms.ValueToKey',
+            'transforms.createKey.fields': key,
+            'transforms.extractInt.type': 'org.apache.kafka.connect.transforms.ExtractField$Key',
+            'transforms.extractInt.field': key,
+        }
+    else:
+        key = ''
+        transforms = {
+            'transforms': ','.join(F'createKey_{table.name},extractInt_{table.name}'
+                for table in polled),
+            'predicates': ','.join(F'is_{table.name}' for table in polled),
+        }
+
+        for table in polled:
+            transforms.update({
+                F'transforms.createKey_{table.name}.type': 'org.apache.kafka.connect.transforms.ValueToKey',
+                F'transforms.createKey_{table.name}.fields': table.key_column,
+                F'transforms.createKey_{table.name}.predicate': F'is_{table.name}',
+                F'transforms.extractInt_{table.name}.type': 'org.apache.kafka.connect.transforms.ExtractField$Key',
+                F'transforms.extractInt_{table.name}.field': table.key_column,
+                F'transforms.extractInt_{table.name}.predicate': F'is_{table.name}',
+                F'predicates.is_{table.name}.type': 'org.apache.kafka.connect.transforms.predicates.TopicNameMatches',
+                F'predicates.is_{table.name}.pattern': table.topic,
+            })
+
+    return {
         'connector.class': 'io.confluent.connect.jdbc.JdbcSourceConnector',
         'connection.url': F'jdbc:postgresql://{db_hostname}:{db_port}/{db_name}',
         'connection.user': db_user,
         'connection.password': db_password,
+        # the topic is named after the table, shared by every shard
         'topic.prefix': 'replica_src_',
-        'table.whitelist': 'public.account',
+        'table.whitelist': ','.join(F'public.{table.name}'
+            for table in polled),
+        'tasks.max': str(len(polled)),
         'mode': 'timestamp+incrementing',
-        'timestamp.column.name': 'last_modified',
-        'incrementing.column.name': 'acct_id',
-        'transforms': 'createKey,extractInt',
-        'transforms.createKey.type': 'org.apache.kafka.connect.transforms.ValueToKey',
-        'transforms.createKey.fields': 'acct_id',
-        'transforms.extractInt.type': 'org.apache.kafka.connect.transforms.ExtractField$Key',
-        'transforms.extractInt.field': 'acct_id',
+        'timestamp.column.name': ACCOUNT_TABLE.timestamp_column,
+        'incrementing.column.name': key,
+        **transforms,
         'key.converter': 'org.apache.kafka.connect.converters.IntegerConverter',
         'value.converter': 'io.confluent.connect.avro.AvroConverter',
         'value.converter.schema.registry.url': kafka.schema_registry.url,
         'continuum.topic': 'replica_status',
         'continuum.bootstrap.servers': kafka.bootstrap_servers,
         'continuum.schema.registry.url': kafka.schema_registry.url,
-        'continuum.label': 'replica_src',
-        'continuum.version.column.name': 'last_change_id',
-        'continuum.updatedOn.column.name': 'last_modified',
+        'continuum.label': label,
+        'continuum.version.column.name': ACCOUNT_TABLE.version_column,
+        'continuum.updatedOn.column.name': ACCOUNT_TABLE.timestamp_column,
         'poll.interval.ms': poll_interval,
-    })
+    }
+
+
+async def create_connector(
+    kafka: KafkaAPI,
+    db_hostname: str,
+    db_port: int,
+    db_name: str, 
+    db_user: str,
+    db_password: str,
+    poll_interval: int,
+    shard: Optional[str] = None,
+    tables: bool = False,
+) -> Response:
+    """Create the database source connector.
+
+    Args:
+        db_hostname: The source database hostname.
+        db_port: The source database port.
+        db_name: The source database name.
+        db_user: The source database username.
+        db_password: The source database password.
+        poll_interval: The frequency of when the SQL server is queried for changes.
+        shard: The name of the source shard, None when unsharded.
+        tables: Whether to create the connector of the registered tables.
+
+    Returns:
+        Response from the Kafka connect API.
+    """
+    return await kafka.connect.create_connector(
+        connector_name(shard, tables),
+        connector_config(kafka, db_hostname, db_port, db_name, db_user,
+            db_password, poll_interval, shard, tables))
 
 
 async def delete_connector(
     kafka: KafkaAPI,
+    shard: Optional[str] = None,
+    tables: bool = False,
 ) -> Response:
     """Delete the database source connector.
 
+    Args:
+        shard: The name of the source shard, None when unsharded.
+        tables: Whether to delete the connector of the registered tables.
+
     Returns:
         Response from the Kafka connect API.
     """
-    return await kafka.connect.delete_connector('replica_src')
+    return await kafka.connect.delete_connector(
+        connector_name(shard, tables))
 
 
 async def pause_connector(
     kafka: KafkaAPI,
+    shard: Optional[str] = None,
+    tables: bool = False,
 ) -> Response:
     """Pause the database source connector.
 
+    Args:
+        shard: The name of the source shard, None when unsharded.
+        tables: Whether to pause the connector of the registered tables.
+
     Returns:
         Response from the Kafka connect API.
     """
-    return await kafka.connect.pause_connector('replica_src')
+    return await kafka.connect.pause_connector(
+        connector_name(shard, tables))
 
 
 async def resume_connector(
     kafka: KafkaAPI,
+    shard: Optional[str] = None,
+    tables: bool = False,
 ) -> Response:
-    """Resume the database sink connector.
+    """Resume the database source connector.
+
+    Args:
+        shard: The name of the source shard, None when unsharded.
+        tables: Whether to resume the connector of the registered tables.
 
     Returns:
         Response from the Kafka connect API.
     """
-    return await kafka.connect.resume_connector('replica_src')
+    return await kafka.connect.resume_connector(
+        connector_name(shard, tables))
 
 
 async def restart_connector(
     kafka: KafkaAPI,
+    shard: Optional[str] = None,
+    tables: bool = False,
 ) -> Response:
-    """Restart the database sink connector.
+    """Restart the database source connector.
+
+    Args:
+        shard: The name of the source shard, None when unsharded.
+        tables: Whether to restart the connector of the registered tables.
 
     Returns:
         Response from the Kafka connect API.
     """
-    return await kafka.connect.restart_connector('replica_src')
+    return await kafka.connect.restart_connector(
+        connector_name(shard, tables))
 
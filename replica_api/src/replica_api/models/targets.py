@@ -1,23 +1,39 @@
-from requests import Response
-from st1_kafka_api import KafkaAPI
+from typing import Optional
+from django.conf import settings
+from httpx import Response
+from replica_api.kafka_api import KafkaAPI
+
+
+KTABLE_NAME = 'replica_trg_tbl'
+KTABLE_QUERYABLE_NAME = 'replica_trg_qtbl'
 
 
 # KSQL Table
 async def create_ktable(
     kafka: KafkaAPI,
+    partitions: Optional[int] = None,
 ) -> Response:
     """Create the data target KSQL table.
 
+    The target and the source topics are joined on the account ID, they
+    must be created with the same number of partitions.
+
+    Args:
+        partitions: The number of partitions of the target topic, defaults
+            to the TOPOLOGY_PARTITIONS setting.
+
     Returns:
         Response from the KSQL API.
     """
+    partitions = partitions or settings.TOPOLOGY_PARTITIONS
+
     return await kafka.ksql.execute(
-        'CREATE TABLE "replica_trg_tbl" (' +
+        F'CREATE TABLE "{KTABLE_NAME}" (' +
             '"acct_id" INT PRIMARY KEY,' +
             '"targets" ARRAY<VARCHAR>' +
         ') WITH (' +
-            'PARTITIONS=1,' +
-            'KAFKA_TOPIC=\'replica_trg\',' +
+            F'PARTITIONS={partitions},' +
+            F'KAFKA_TOPIC=\'{settings.TARGET_TOPIC}\',' +
             'KEY_FORMAT=\'KAFKA\',' +
             'VALUE_FORMAT=\'AVRO\'' +
         ');')
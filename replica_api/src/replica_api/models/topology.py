@@ -0,0 +1,470 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, \
+    Set, Tuple
+from httpx import Response
+from voluptuous import Schema, Required, All, Any, Invalid, Length, Match, \
+    Range, ALLOW_EXTRA
+from django.conf import settings
+from replica_api.kafka_api import KafkaAPI
+from replica_api.models import sources, sinks, targets
+
+
+logger = logging.getLogger(__name__)
+
+
+# Validators
+hostname_field = All(str, Length(min=1, max=255))
+
+
+def ordered_range(value: dict) -> dict:
+    if value['min'] > value['max']:
+        raise Invalid('min must not be greater than max')
+
+    return value
+
+
+# the account IDs a source database allocates, e.g. the bounds of its
+# sequence, every shard writes its rows to the same source topic keyed by ID
+id_range_schema = All({
+    Required('min'): All(int, Range(min=1)),
+    Required('max'): All(int, Range(min=1)),
+}, ordered_range)
+
+
+source_schema = Schema({
+    Required('db_hostname'): hostname_field,
+    Required('db_port'): All(int, Range(min=1, max=65535)),
+    Required('db_name'): hostname_field,
+    Required('db_user'): str,
+    Required('db_password'): str,
+    Required('poll_interval'): All(int, Range(min=1)),
+    # required alongside shards
+    'ids': id_range_schema,
+})
+
+
+shard_schema = source_schema.extend({
+    Required('shard'): All(str, Match(r'^[a-z0-9_]{1,64}$')),
+    Required('ids'): id_range_schema,
+})
+
+
+def disjoint_id_ranges(value: dict) -> dict:
+    """Refuse shards whose account IDs may collide in the source topic."""
+    if not value['shards']:
+        return value
+
+    sources_ = list(value['shards'])
+
+    if 'source' in value:
+        if 'ids' not in value['source']:
+            raise Invalid('the source needs an ids range alongside shards',
+                path=['source', 'ids'])
+        sources_.append(value['source'])
+
+    ranges = sorted((source['ids']['min'], source['ids']['max'])
+        for source in sources_)
+
+    for (_, previous_max), (next_min, _) in zip(ranges, ranges[1:]):
+        if next_min <= previous_max:
+            raise Invalid('the ids ranges of the sources overlap',
+                path=['shards'])
+
+    return value
+
+
+sink_schema = Schema({
+    Required('db_hostname'): hostname_field,
+    Required('db_port'): All(int, Range(min=1, max=65535)),
+    Required('db_name'): hostname_field,
+    Required('db_table'): hostname_field,
+    Required('db_user'): str,
+    Required('db_password'): str,
+    'tasks_max': All(int, Range(min=1)),
+    'profile': Any(*sinks.PROFILES),
+})
+
+
+sink_profile_schema = Schema({
+    Required('db_hostname'): hostname_field,
+    Required('db_name'): hostname_field,
+    Required('db_table'): hostname_field,
+    Required('profile'): Any(*sinks.PROFILES),
+}, extra=ALLOW_EXTRA)
+
+
+topology_schema = All(Schema({
+    # the unsharded source and the source shards, all feeding the source
+    # topic
+    'source': source_schema,
+    Required('shards', default=[]): [shard_schema],
+    Required('sinks', default=[]): [sink_schema],
+    'routing': Any(*sinks.ROUTING_MODES),
+    # partitions of the source and target topics
+    'partitions': All(int, Range(min=1)),
+    # delete sinks which are not part of the topology
+    Required('prune', default=False): bool,
+    Required('dry_run', default=False): bool,
+}, extra=ALLOW_EXTRA), disjoint_id_ranges)
+
+
+# Data
+class ClusterState(NamedTuple):
+    """The replication objects currently present in the cluster."""
+    subjects: Set[str]
+    ktables: Set[str]
+    connectors: Dict[str, dict]
+    # topic name -> partition count
+    topics: Dict[str, int]
+
+
+class TopologyConflict(Exception):
+    """The cluster can not be brought to the topology by reconciling."""
+
+
+class Step(NamedTuple):
+    """A single change to apply to the cluster."""
+    name: str
+    action: str
+    run: Callable[[], Awaitable[Response]]
+    requires: Tuple[str, ...] = ()
+
+
+# Logic
+def normalize_config(config: dict) -> Dict[str, str]:
+    """Render connector configuration values the way Connect stores them."""
+    return {
+        key: str(value).lower() if isinstance(value, bool) else str(value)
+        for key, value in config.items()
+    }
+
+
+def config_differs(desired: dict, current: dict) -> bool:
+    current = normalize_config(current)
+
+    return any(current.get(key) != value
+        for key, value in normalize_config(desired).items())
+
+
+async def get_state(kafka: KafkaAPI) -> ClusterState:
+    """Read the schemas, KSQL tables and connectors present in the cluster.
+
+    The three services are queried concurrently, so are the configurations
+    of the replication connectors.
+    """
+    subjects_resp, ktables_resp, topics_resp, connectors_resp = \
+        await asyncio.gather(
+            kafka.schema_registry.get_subjects(),
+            kafka.ksql.execute('SHOW TABLES;'),
+            kafka.ksql.execute('SHOW TOPICS;'),
+            kafka.connect.get_connectors())
+
+    for resp in (subjects_resp, ktables_resp, topics_resp, connectors_resp):
+        resp.raise_for_status()
+
+    topics = {}
+    for entry in json.loads(topics_resp.content):
+        topics.update((topic['name'], len(topic['replicaInfo']))
+            for topic in entry.get('topics', []))
+
+    ktables = set()
+    for entry in json.loads(ktables_resp.content):
+        ktables.update(table['name'] for table in entry.get('tables', []))
+
+    names = [name for name in json.loads(connectors_resp.content)
+        if sources.is_connector(name)
+            or name.startswith(sinks.NAME_PREFIX)]
+
+    configs = await asyncio.gather(*[kafka.connect.get_connector_config(name)
+        for name in names])
+
+    return ClusterState(
+        subjects=set(json.loads(subjects_resp.content)),
+        ktables=ktables,
+        connectors={
+            name: json.loads(resp.content)
+            for name, resp in zip(names, configs) if resp.status_code == 200
+        },
+        topics=topics)
+
+
+def check_partitions(state: ClusterState, partitions: int):
+    """Ensure the source and target topics are co-partitioned.
+
+    Raises:
+        TopologyConflict: An existing topic has another partition count,
+            the topology must be migrated instead.
+    """
+    for topic in (sources.TOPIC, settings.TARGET_TOPIC):
+        current = state.topics.get(topic)
+
+        if current is not None and current != partitions:
+            raise TopologyConflict(F'topic {topic} has {current} partitions '
+                F'instead of {partitions}, migrate it through '
+                'v1/cluster/topology/partitions/')
+
+
+def plan(kafka: KafkaAPI, state: ClusterState, source_dbs: List[dict],
+    sink_dbs: List[dict], prune: bool = False,
+    routing: Optional[str] = None,
+    partitions: Optional[int] = None) -> List[Step]:
+    """Compute the steps bringing the cluster to the desired topology.
+
+    Objects which already exist are left untouched, connectors whose
+    configuration drifted are updated in place.
+
+    Every table of the registry gets a source KSQL table, and a sink KSQL
+    table and connector in every sink database. The tables other than the
+    accounts share a second source connector per source database.
+
+    Args:
+        state: The current state of the cluster.
+        source_dbs: The source database connections, the unsharded source
+            and the shards.
+        sink_dbs: The sink database connections.
+        prune: Whether to delete sinks absent from ``sink_dbs``, source
+            connectors absent from ``source_dbs`` and every source
+            connector when another source mode is used.
+        routing: The sink routing mode, defaults to the SINK_ROUTING
+            setting. Changing the mode of existing sinks is not planned.
+        partitions: The partitions of the source and target topics,
+            defaults to the TOPOLOGY_PARTITIONS setting.
+
+    Returns:
+        The steps to apply, each one naming the steps it depends on.
+
+    Raises:
+        TopologyConflict: The existing topics have another partition count.
+    """
+    routing = routing or settings.SINK_ROUTING
+    partitions = partitions or settings.TOPOLOGY_PARTITIONS
+    check_partitions(state, partitions)
+    steps = []
+
+    if sources.SCHEMA_SUBJECT not in state.subjects:
+        steps.append(Step('src/schema-registry', 'create',
+            lambda: sources.create_schema(kafka)))
+
+    if sources.KTABLE_NAME not in state.ktables:
+        steps.append(Step('src/ktable', 'create',
+            lambda: sources.create_ktable(kafka, partitions),
+            requires=('src/schema-registry',)))
+
+    tables = [table for table in sources.get_tables()
+        if table != sources.ACCOUNT_TABLE]
+
+    # the value columns are read from the schema the source connector
+    # registers with the first rows, until then the step fails
+    for table in tables:
+        if table.topic not in state.ktables:
+            steps.append(Step(F'src/ktable/{table.name}', 'create',
+                lambda table=table: sources.create_table_ktable(kafka,
+                    table, partitions)))
+
+    # the outbox relay or the logical replication source publishes the
+    # changes, polling would duplicate them
+    polling = settings.SOURCE_MODE == sources.MODE_CONNECTOR
+    desired = set()
+
+    # the accounts and the other registered tables have a connector each
+    for source in source_dbs if polling else []:
+        for polls_tables in (False, True) if tables else (False,):
+            name = sources.connector_name(source.get('shard'), polls_tables)
+            desired.add(name)
+
+            # the ID range is only validated, the connector does not use it
+            src_config = sources.connector_config(kafka, **{key: value
+                for key, value in source.items() if key != 'ids'},
+                tables=polls_tables)
+            current = state.connectors.get(name)
+
+            if current is None or config_differs(src_config, current):
+                steps.append(Step(F'src/connector/{name}',
+                    'create' if current is None else 'update',
+                    lambda name=name, src_config=src_config:
+                        kafka.connect.put_connector_config(name, src_config),
+                    requires=() if polls_tables else ('src/ktable',)))
+
+    if prune:
+        for name in state.connectors:
+            if sources.is_connector(name) and name not in desired:
+                steps.append(Step(F'src/connector/{name}', 'delete',
+                    lambda name=name: kafka.connect.delete_connector(name)))
+
+    if targets.KTABLE_NAME not in state.ktables:
+        steps.append(Step('trg/ktable', 'create',
+            lambda: targets.create_ktable(kafka, partitions)))
+
+    if targets.KTABLE_QUERYABLE_NAME not in state.ktables:
+        steps.append(Step('trg/ktable-queryable', 'create',
+            lambda: targets.create_ktable_queryable(kafka),
+            requires=('trg/ktable',)))
+
+    if routing == sinks.ROUTING_SHARED:
+        sink_requires = ('snk/routing-ktable',)
+
+        if sinks.ROUTING_KTABLE_NAME not in state.ktables:
+            steps.append(Step('snk/routing-ktable', 'create',
+                lambda: sinks.create_routing_ktable(kafka),
+                requires=('src/ktable', 'trg/ktable')))
+    else:
+        sink_requires = ('src/ktable', 'trg/ktable')
+
+    desired = set()
+
+    for sink in sink_dbs:
+        name = sinks.sink_name(sink['db_hostname'], sink['db_name'],
+            sink['db_table'])
+        desired.add(name)
+
+        if name not in state.ktables:
+            steps.append(Step(F'snk/ktable/{name}', 'create',
+                lambda sink=sink: sinks.create_ktable(kafka,
+                    db_hostname=sink['db_hostname'],
+                    db_name=sink['db_name'],
+                    db_table=sink['db_table'],
+                    routing=routing),
+                requires=sink_requires))
+
+        snk_config = sinks.connector_config(kafka, **sink)
+        current = state.connectors.get(name)
+
+        if current is None or config_differs(snk_config, current):
+            steps.append(Step(F'snk/connector/{name}',
+                'create' if current is None else 'update',
+                lambda name=name, snk_config=snk_config:
+                    kafka.connect.put_connector_config(name, snk_config),
+                requires=(F'snk/ktable/{name}',)))
+
+        # the registered tables next to the accounts in the sink database
+        for table in tables:
+            name = sinks.sink_name(sink['db_hostname'], sink['db_name'],
+                table.name)
+            desired.add(name)
+
+            if name not in state.ktables:
+                steps.append(Step(F'snk/ktable/{name}', 'create',
+                    lambda sink=sink, table=table: sinks.create_table_ktable(
+                        kafka, sink['db_hostname'], sink['db_name'], table),
+                    requires=(F'src/ktable/{table.name}', 'trg/ktable')))
+
+            snk_config = sinks.connector_config(kafka,
+                **{ **sink, 'db_table': table.name }, table=table)
+            current = state.connectors.get(name)
+
+            if current is None or config_differs(snk_config, current):
+                steps.append(Step(F'snk/connector/{name}',
+                    'create' if current is None else 'update',
+                    lambda name=name, snk_config=snk_config:
+                        kafka.connect.put_connector_config(name, snk_config),
+                    requires=(F'snk/ktable/{name}',)))
+
+    if prune:
+        for name in state.connectors:
+            if name.startswith(sinks.NAME_PREFIX) and name not in desired:
+                steps.append(Step(F'snk/connector/{name}', 'delete',
+                    lambda name=name: kafka.connect.delete_connector(name)))
+
+        for name in state.ktables:
+            if name.startswith(sinks.NAME_PREFIX) and name not in desired:
+                steps.append(Step(F'snk/ktable/{name}', 'delete',
+                    lambda name=name: kafka.ksql.execute(
+                        F'DROP TABLE "{name}";'),
+                    requires=(F'snk/connector/{name}',)))
+
+    return steps
+
+
+async def apply(steps: List[Step]) -> List[dict]:
+    """Apply steps concurrently, each one once the steps it requires are done.
+
+    Requirements which are not part of the steps are already satisfied. A
+    step is skipped when one of its requirements failed.
+
+    Returns:
+        The outcome of every step.
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+    results: Dict[str, dict] = {}
+
+    async def run(step: Step) -> bool:
+        for required in step.requires:
+            if required in tasks and not await tasks[required]:
+                results[step.name] = {
+                    'step': step.name,
+                    'action': step.action,
+                    'outcome': 'skipped',
+                    'reason': F'{required} failed',
+                }
+                return False
+
+        try:
+            resp = await step.run()
+        except Exception as e:
+            logger.error('topology step failed', exc_info=True, extra={
+                'step': step.name })
+            results[step.name] = {
+                'step': step.name,
+                'action': step.action,
+                'outcome': 'failed',
+                'reason': str(e),
+            }
+            return False
+
+        ok = resp.status_code < 300
+        results[step.name] = {
+            'step': step.name,
+            'action': step.action,
+            'outcome': 'applied' if ok else 'failed',
+            'status': resp.status_code,
+        }
+        if not ok:
+            results[step.name]['reason'] = resp.text
+
+        return ok
+
+    # every task is registered before any of them starts running
+    for step in steps:
+        tasks[step.name] = asyncio.ensure_future(run(step))
+
+    await asyncio.gather(*tasks.values())
+
+    return [results[step.name] for step in steps]
+
+
+async def reconcile(kafka: KafkaAPI, source_dbs: List[dict],
+    sink_dbs: List[dict],
+    prune: bool = False, dry_run: bool = False,
+    routing: Optional[str] = None,
+    partitions: Optional[int] = None) -> Tuple[List[dict], bool]:
+    """Bring the cluster to the desired topology.
+
+    Args:
+        source_dbs: The source database connections, the unsharded source
+            and the shards.
+        sink_dbs: The sink database connections.
+        prune: Whether to delete sources and sinks absent from the
+            topology.
+        dry_run: Only compute the steps.
+        routing: The sink routing mode.
+        partitions: The partitions of the source and target topics.
+
+    Returns:
+        The outcome of every step and whether all of them succeeded.
+    """
+    state = await get_state(kafka)
+    steps = plan(kafka, state, source_dbs, sink_dbs, prune=prune,
+        routing=routing, partitions=partitions)
+
+    if dry_run:
+        return [{
+            'step': step.name,
+            'action': step.action,
+            'outcome': 'planned',
+        } for step in steps], True
+
+    results = await apply(steps)
+
+    return results, all(result['outcome'] == 'applied' for result in results)
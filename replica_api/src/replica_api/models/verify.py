@@ -0,0 +1,305 @@
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import psycopg2
+import sqlalchemy as orm
+from asgiref.sync import sync_to_async
+from confluent_kafka import KafkaException
+from sqlalchemy.ext.asyncio import AsyncSession
+from voluptuous import Schema, Required, All, Range, Length, ALLOW_EXTRA
+from replica_api.kafka_api import KafkaAPI
+from replica_api.kafka_producer import get_account_producer
+from replica_api.models import accounts, sinks, topology
+
+
+logger = logging.getLogger(__name__)
+
+
+# Validators
+verify_schema = Schema({
+    Required('sinks'): All([topology.sink_schema], Length(min=1)),
+    # re-emit the accounts which differ from the source
+    Required('repair', default=False): bool,
+    Required('fanout', default=16): All(int, Range(min=2, max=1024)),
+    Required('leaf_size', default=256): All(int, Range(min=1)),
+}, extra=ALLOW_EXTRA)
+
+
+# The hash of a row, the timestamps are truncated to the millisecond
+# precision of the Avro records the sinks are written from
+ROW_HASH = ("('x' || substr(md5(concat_ws('|', \"acct_id\", \"name\", "
+    "\"last_change_id\", date_trunc('milliseconds', \"last_modified\"))), "
+    "1, 16))::bit(64)::bigint")
+
+# Order independent digest of the rows of a range
+RANGE_SQL = ('SELECT ("acct_id" - {lo}) / {step} AS bucket, count(*), '
+    F'sum({ROW_HASH}::numeric) '
+    'FROM {table} '
+    'WHERE "acct_id" BETWEEN {lo} AND {hi} '
+    'GROUP BY bucket')
+
+ROWS_SQL = (F'SELECT "acct_id", {ROW_HASH} '
+    'FROM {table} '
+    'WHERE "acct_id" BETWEEN {lo} AND {hi}')
+
+# only the accounts targeting the sink are expected in it
+SOURCE_TABLE = '"account" JOIN "replica_verify_ids" USING ("acct_id")'
+
+# bucket -> (count, digest)
+Digests = Dict[int, Tuple[int, int]]
+
+
+class Mismatches(NamedTuple):
+    missing: List[int]
+    extra: List[int]
+    changed: List[int]
+
+
+# Source side
+@sync_to_async
+def begin_source(db: AsyncSession, acct_ids: List[int],
+    chunk_size: int = 10000) -> Optional[Tuple[int, int]]:
+    """Load the accounts targeting a sink in a temporary table.
+
+    Opens a transaction ended by ``end_source``.
+
+    Returns:
+        The lowest and highest account IDs, None when there is none.
+    """
+    db.begin()
+    db.execute(orm.text('CREATE TEMP TABLE "replica_verify_ids" '
+        '("acct_id" INT PRIMARY KEY) ON COMMIT DROP'))
+
+    for i in range(0, len(acct_ids), chunk_size):
+        db.execute(orm.text('INSERT INTO "replica_verify_ids" '
+            'SELECT unnest(:ids)'),
+            { 'ids': acct_ids[i:i + chunk_size] })
+
+    if not acct_ids:
+        return None
+
+    # the targets may name accounts which do not exist
+    lo, hi = db.execute(orm.text('SELECT min("acct_id"), max("acct_id") '
+        F'FROM {SOURCE_TABLE}')).one()
+    return (lo, hi) if lo is not None else None
+
+
+@sync_to_async
+def end_source(db: AsyncSession):
+    db.rollback()
+
+
+@sync_to_async
+def source_digests(db: AsyncSession, lo: int, hi: int, step: int) -> Digests:
+    return {
+        bucket: (count, int(digest))
+        for bucket, count, digest in db.execute(orm.text(RANGE_SQL.format(
+            table=SOURCE_TABLE, lo=':lo', hi=':hi', step=':step')),
+            { 'lo': lo, 'hi': hi, 'step': step })
+    }
+
+
+@sync_to_async
+def source_rows(db: AsyncSession, lo: int, hi: int) -> Dict[int, int]:
+    return dict(db.execute(orm.text(ROWS_SQL.format(table=SOURCE_TABLE,
+        lo=':lo', hi=':hi')), { 'lo': lo, 'hi': hi }).all())
+
+
+# Sink side
+class SinkSide:
+    """Run the digest queries on a sink database."""
+
+    def __init__(self, dsn: dict, table: str):
+        self.conn = psycopg2.connect(**dsn)
+        self.conn.set_session(readonly=True, autocommit=True)
+        self.table = F'"{table}"'
+
+    def bounds(self) -> Optional[Tuple[int, int]]:
+        with self.conn.cursor() as cur:
+            cur.execute(F'SELECT min("acct_id"), max("acct_id") '
+                F'FROM {self.table}')
+            lo, hi = cur.fetchone()
+            return (lo, hi) if lo is not None else None
+
+    def digests(self, lo: int, hi: int, step: int) -> Digests:
+        with self.conn.cursor() as cur:
+            cur.execute(RANGE_SQL.format(table=self.table, lo='%(lo)s',
+                hi='%(hi)s', step='%(step)s'),
+                { 'lo': lo, 'hi': hi, 'step': step })
+            return {
+                bucket: (count, int(digest))
+                for bucket, count, digest in cur.fetchall()
+            }
+
+    def rows(self, lo: int, hi: int) -> Dict[int, int]:
+        with self.conn.cursor() as cur:
+            cur.execute(ROWS_SQL.format(table=self.table, lo='%(lo)s',
+                hi='%(hi)s'), { 'lo': lo, 'hi': hi })
+            return dict(cur.fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+# Logic
+async def compare(db: AsyncSession, sink: SinkSide, lo: int, hi: int,
+    fanout: int, leaf_size: int, stats: dict) -> Mismatches:
+    """Find the accounts of a range which differ between both sides.
+
+    The range is split in ``fanout`` buckets digested on both sides with a
+    single query each, only the buckets whose digests differ are compared
+    further. Ranges of at most ``leaf_size`` accounts are compared row by
+    row.
+    """
+    loop = asyncio.get_running_loop()
+
+    if hi - lo + 1 <= leaf_size:
+        stats['queries'] += 2
+        src_rows, snk_rows = await asyncio.gather(
+            source_rows(db, lo, hi),
+            loop.run_in_executor(None, sink.rows, lo, hi))
+
+        return Mismatches(
+            missing=sorted(set(src_rows) - set(snk_rows)),
+            extra=sorted(set(snk_rows) - set(src_rows)),
+            changed=sorted(acct_id for acct_id, digest in src_rows.items()
+                if acct_id in snk_rows and snk_rows[acct_id] != digest))
+
+    step = -(-(hi - lo + 1) // fanout)
+    stats['queries'] += 2
+    src, snk = await asyncio.gather(
+        source_digests(db, lo, hi, step),
+        loop.run_in_executor(None, sink.digests, lo, hi, step))
+
+    mismatches = Mismatches([], [], [])
+
+    # the source session runs a single query at a time, recurse in order
+    for bucket in sorted(set(src) | set(snk)):
+        if src.get(bucket) == snk.get(bucket):
+            continue
+
+        bucket_lo = lo + bucket * step
+        found = await compare(db, sink, bucket_lo,
+            min(hi, bucket_lo + step - 1), fanout, leaf_size, stats)
+
+        for into, values in zip(mismatches, found):
+            into.extend(values)
+
+    return mismatches
+
+
+async def verify_sink(
+    kafka: KafkaAPI,
+    db: AsyncSession,
+    acct_ids: List[int],
+    db_hostname: str,
+    db_port: int,
+    db_name: str,
+    db_table: str,
+    db_user: str,
+    db_password: str,
+    fanout: int = 16,
+    leaf_size: int = 256,
+    repair: bool = False,
+    **kwargs,
+) -> dict:
+    """Compare the accounts targeting a sink with its table.
+
+    Args:
+        db: The source database session.
+        acct_ids: The accounts targeting the sink.
+        fanout: The number of buckets a differing range is split in.
+        leaf_size: The size of the ranges compared row by row.
+        repair: Re-emit the missing and changed accounts through the
+            source topic so the sink converges.
+
+    Returns:
+        The accounts missing from, extra in and changed in the sink.
+    """
+    stats = { 'queries': 0 }
+    sink = await asyncio.get_running_loop().run_in_executor(None, SinkSide, {
+        'host': db_hostname,
+        'port': db_port,
+        'dbname': db_name,
+        'user': db_user,
+        'password': db_password,
+    }, db_table)
+
+    try:
+        src_bounds, snk_bounds = await asyncio.gather(
+            begin_source(db, acct_ids),
+            asyncio.get_running_loop().run_in_executor(None, sink.bounds))
+        bounds = [b for b in (src_bounds, snk_bounds) if b is not None]
+
+        if bounds:
+            mismatches = await compare(db, sink,
+                min(b[0] for b in bounds), max(b[1] for b in bounds),
+                fanout, leaf_size, stats)
+        else:
+            mismatches = Mismatches([], [], [])
+    finally:
+        await end_source(db)
+        sink.close()
+
+    result = {
+        'sink': sinks.sink_name(db_hostname, db_name, db_table),
+        'label': sinks.sink_label(db_hostname, db_name),
+        'accounts': len(acct_ids),
+        'queries': stats['queries'],
+        'in_sync': not any(mismatches),
+        **mismatches._asdict(),
+    }
+
+    if repair and (mismatches.missing or mismatches.changed):
+        result['repaired'] = await reemit(kafka, db,
+            mismatches.missing + mismatches.changed)
+
+    return result
+
+
+async def reemit(kafka: KafkaAPI, db: AsyncSession, acct_ids: List[int]) \
+    -> int:
+    """Produce the current state of accounts to the source topic again."""
+    producer = get_account_producer(kafka)
+    accts = await accounts.get_accounts(db, acct_ids)
+
+    await asyncio.gather(*[producer.produce(acct.id, {
+        'acct_id': acct.id,
+        'name': acct.name,
+        'last_change_id': acct.last_change_id,
+        'last_modified': acct.last_modified,
+    }) for acct in accts])
+
+    return len(accts)
+
+
+async def verify(kafka: KafkaAPI, db: AsyncSession, sink_dbs: List[dict],
+    repair: bool = False, fanout: int = 16, leaf_size: int = 256) \
+    -> List[dict]:
+    """Compare the source accounts with every sink table.
+
+    Returns:
+        The comparison of every sink.
+    """
+    trgs = await accounts.get_trgs(kafka, strict=True)
+    results = []
+
+    for sink in sink_dbs:
+        label = sinks.sink_label(sink['db_hostname'], sink['db_name'])
+        acct_ids = sorted(acct_id for acct_id, targets in trgs.items()
+            if label in targets)
+
+        try:
+            results.append(await verify_sink(kafka, db, acct_ids,
+                fanout=fanout, leaf_size=leaf_size, repair=repair, **sink))
+        except (psycopg2.Error, KafkaException) as e:
+            logger.error('sink verification failed', exc_info=True, extra={
+                'label': label })
+            results.append({
+                'sink': sinks.sink_name(sink['db_hostname'], sink['db_name'],
+                    sink['db_table']),
+                'label': label,
+                'error': str(e),
+            })
+
+    return results
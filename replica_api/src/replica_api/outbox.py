@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from threading import Event, Lock, Thread
+from typing import Optional
+from django.conf import settings
+from replica_api.kafka_consumer import OUTCOME_SUCCESS
+from replica_api.models import sources
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """Publish the account changes of the outbox to the source topic.
+
+    Runs its own event loop on a background thread. It is woken up as soon
+    as a change is committed by this process and otherwise checks the outbox
+    every idle interval. Every change is published as the current state of
+    its account along with a replica status event, the same records the
+    source connector writes.
+    """
+
+    def __init__(self, batch_size: int = 500, idle_interval: float = 0.5):
+        """
+        Args:
+            batch_size: The maximum number of changes published at once.
+            idle_interval: The seconds between two checks of the outbox
+                when nothing was committed by this process.
+        """
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+
+        self._wake = Event()
+        self._lock = Lock()
+
+        self.stats = {
+            'batches': 0,
+            'records': 0,
+            'errors': 0,
+            'lock_busy': 0,
+            'last_batch_size': 0,
+            'last_batch_seconds': None,
+            # seconds between the oldest commit of the batch and its delivery
+            'last_lag_seconds': None,
+            'last_published': None,
+        }
+
+    def notify(self):
+        """Wake the relay up, a change was committed."""
+        self._wake.set()
+
+    def metrics(self) -> dict:
+        """Throughput and lag counters of the relay."""
+        with self._lock:
+            stats = dict(self.stats)
+
+        seconds = stats['last_batch_seconds']
+        stats['last_batch_rate'] = stats['last_batch_size'] / seconds \
+            if seconds else None
+
+        return stats
+
+    async def publish_batch(self) -> Optional[int]:
+        """Publish the oldest changes of the outbox.
+
+        Returns:
+            The number of changes published, None when another relay is
+            publishing.
+        """
+        from replica_api.kafka_producer import get_account_producer, \
+            get_status_producer
+        from replica_api.models import accounts
+
+        kafka = settings.KAFKA_API
+        started = time.monotonic()
+
+        async with settings.SQLALCHEMY_DATABASES.db_context() as db:
+            claimed = await accounts.claim_outbox(db, self.batch_size)
+
+            if claimed is None:
+                with self._lock:
+                    self.stats['lock_busy'] += 1
+                return None
+            if not claimed:
+                await accounts.release_outbox(db, [])
+                return 0
+
+            # the current state of the account covers all its changes
+            records = {}
+            for _, _, record in claimed:
+                if record is not None:
+                    records[record.id] = record
+
+            try:
+                account_producer = get_account_producer(kafka)
+                await asyncio.gather(*[account_producer.produce(record.id, {
+                    'acct_id': record.id,
+                    'name': record.name,
+                    'last_change_id': record.last_change_id,
+                    'last_modified': record.last_modified,
+                }) for record in records.values()])
+
+                status_producer = get_status_producer(kafka)
+                await asyncio.gather(*[status_producer.produce(record.id, {
+                    'label': settings.SOURCE_LABEL,
+                    'outcome': OUTCOME_SUCCESS,
+                    'version': str(record.last_change_id),
+                    'updatedOn': record.last_modified,
+                }) for record in records.values()])
+            except Exception:
+                await accounts.release_outbox(db, None)
+                raise
+
+            await accounts.release_outbox(db,
+                [outbox_id for outbox_id, _, _ in claimed])
+
+        oldest = min(created_on for _, created_on, _ in claimed)
+
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['records'] += len(claimed)
+            self.stats['last_batch_size'] = len(claimed)
+            self.stats['last_batch_seconds'] = time.monotonic() - started
+            self.stats['last_lag_seconds'] = \
+                (datetime.utcnow() - oldest).total_seconds() \
+                if oldest else None
+            self.stats['last_published'] = datetime.utcnow().isoformat()
+
+        return len(claimed)
+
+    async def run(self):
+        timeout = self.idle_interval
+
+        while True:
+            await asyncio.get_running_loop().run_in_executor(None,
+                self._wake.wait, timeout)
+            self._wake.clear()
+            timeout = self.idle_interval
+
+            try:
+                while True:
+                    published = await self.publish_batch()
+
+                    if published is None:
+                        # another process is publishing, check back soon
+                        # in case it finished before our change committed
+                        timeout = 0.05
+                        break
+                    if published < self.batch_size:
+                        break
+            except Exception:
+                logger.error('outbox relay batch failed', exc_info=True)
+                with self._lock:
+                    self.stats['errors'] += 1
+
+    def start(self):
+        logger.info('Starting outbox relay')
+        Thread(target=asyncio.run, args=(self.run(),), daemon=True,
+            name='outbox_relay').start()
+
+
+relay = OutboxRelay(**settings.OUTBOX_RELAY)
+_started = False
+_start_lock = Lock()
+
+
+def notify_relay():
+    """Wake the relay up after committing a change to the outbox."""
+    if _started:
+        relay.notify()
+
+
+def start_relay():
+    """Start publishing the outbox, at most once per process."""
+    global _started
+
+    with _start_lock:
+        if _started or settings.SOURCE_MODE != sources.MODE_OUTBOX:
+            return
+        _started = True
+
+    relay.start()
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import time
+from threading import Lock, Thread
+from typing import Optional
+import httpx
+from django.conf import settings
+from replica_api.kafka_api import Connect
+from replica_api.models import sources
+
+
+logger = logging.getLogger(__name__)
+
+
+class PollController:
+    """Adapt the poll interval of the source connector to the change rate.
+
+    The source events of the status stream are counted and smoothed into a
+    change rate every tick. The interval aimed for lets about
+    ``target_changes`` changes accumulate between two polls, bounded by the
+    minimum and maximum intervals: the connector polls often under load and
+    rarely when idle. Every config update restarts the connector tasks, so
+    the interval is only changed once the aimed interval differs from the
+    current one by the ``hysteresis`` factor, and at most once per
+    ``cooldown``.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        min_interval_ms: int = 200,
+        max_interval_ms: int = 60000,
+        target_changes: float = 1.0,
+        hysteresis: float = 2.0,
+        cooldown: float = 60.0,
+        tick: float = 5.0,
+        alpha: float = 0.3,
+    ):
+        """
+        Args:
+            enabled: Whether the controller runs.
+            min_interval_ms: The shortest poll interval.
+            max_interval_ms: The longest poll interval.
+            target_changes: The changes let accumulate between two polls.
+            hysteresis: The factor between the aimed and the current
+                interval needed to change it.
+            cooldown: The minimum seconds between two changes.
+            tick: The seconds between two rate samples.
+            alpha: The weight of the last sample in the smoothed rate.
+        """
+        self.enabled = enabled
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.target_changes = target_changes
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.tick = tick
+        self.alpha = alpha
+
+        self._lock = Lock()
+        self._events = 0
+        self._rate: Optional[float] = None
+        self._interval_ms: Optional[int] = None
+        self._changed: Optional[float] = None
+
+        self.stats = {
+            'adjustments': 0,
+            'errors': 0,
+        }
+
+    def on_status(self, acct_id: int, status: dict):
+        """Count a source event, registered as a status listener."""
+        if status['label'] == settings.SOURCE_LABEL:
+            with self._lock:
+                self._events += 1
+
+    def aimed_interval(self, rate: float) -> int:
+        """The poll interval letting the target changes accumulate."""
+        if rate <= 0:
+            return self.max_interval_ms
+
+        return int(min(self.max_interval_ms, max(self.min_interval_ms,
+            1000 * self.target_changes / rate)))
+
+    def decide(self, rate: float, now: float) -> Optional[int]:
+        """The interval to switch to, None to keep the current one."""
+        aimed = self.aimed_interval(rate)
+        current = self._interval_ms
+
+        if current is None:
+            return aimed
+        if self._changed is not None and now - self._changed < self.cooldown:
+            return None
+        if max(aimed, current) < self.hysteresis * min(aimed, current):
+            return None
+
+        return aimed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'rate': round(self._rate, 3) if self._rate is not None
+                    else None,
+                'interval_ms': self._interval_ms,
+                'aimed_interval_ms': self.aimed_interval(self._rate)
+                    if self._rate is not None else None,
+                **self.stats,
+            }
+
+    async def apply(self, connect: Connect, interval_ms: int) -> bool:
+        """Set the poll interval of every source connector, shards included.
+
+        Returns:
+            Whether there is a source connector.
+        """
+        resp = await connect.get_connectors()
+        resp.raise_for_status()
+
+        names = [name for name in json.loads(resp.content)
+            if sources.is_connector(name)]
+
+        for name in names:
+            resp = await connect.get_connector_config(name)
+
+            # deleted in the meantime
+            if resp.status_code == 404:
+                continue
+            resp.raise_for_status()
+
+            config = json.loads(resp.content)
+
+            if str(config.get('poll.interval.ms')) != str(interval_ms):
+                config['poll.interval.ms'] = interval_ms
+
+                resp = await connect.put_connector_config(name, config)
+                resp.raise_for_status()
+
+                logger.info('source poll interval changed', extra={
+                    'connector': name, 'interval_ms': interval_ms,
+                    'rate': self._rate })
+
+        return bool(names)
+
+    async def run(self):
+        connect = Connect(settings.KAFKA_API.connect.url,
+            **settings.KAFKA_API_TRANSPORT)
+        sampled = time.monotonic()
+
+        while True:
+            await asyncio.sleep(self.tick)
+
+            now = time.monotonic()
+
+            with self._lock:
+                sample = self._events / (now - sampled)
+                self._events = 0
+                self._rate = sample if self._rate is None else \
+                    self.alpha * sample + (1 - self.alpha) * self._rate
+                interval_ms = self.decide(self._rate, now)
+
+            sampled = now
+
+            if interval_ms is None:
+                continue
+
+            try:
+                if await self.apply(connect, interval_ms):
+                    with self._lock:
+                        self._interval_ms = interval_ms
+                        self._changed = now
+                        self.stats['adjustments'] += 1
+            except httpx.HTTPError:
+                logger.error('source poll interval change failed',
+                    exc_info=True)
+                with self._lock:
+                    self.stats['errors'] += 1
+
+    def start(self):
+        logger.info('Starting source poll controller')
+        Thread(target=asyncio.run, args=(self.run(),), daemon=True,
+            name='poll_controller').start()
+
+
+poll_controller = PollController(**settings.POLL_CONTROLLER)
+_started = False
+_start_lock = Lock()
+
+
+def start_poll_controller():
+    """Start adapting the source poll interval, at most once per process."""
+    global _started
+
+    with _start_lock:
+        if _started or not poll_controller.enabled or \
+            settings.SOURCE_MODE != sources.MODE_CONNECTOR:
+            return
+        _started = True
+
+    poll_controller.start()
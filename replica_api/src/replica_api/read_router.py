@@ -0,0 +1,117 @@
+import itertools
+import logging
+from threading import Lock
+from typing import Dict, List, Optional
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from replica_api.cache import AccountRecord
+from replica_api.lag import lag_index
+from replica_api.models.sinks import sink_label
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReadRouter:
+    """Route account reads to the sink replicas fresh enough to serve them.
+
+    The lag index tells which targets of an account applied which version,
+    a read goes to one of the replicas which applied at least the version
+    the caller needs, in turns. Without a version the replica must have
+    applied the latest version seen on the source. The row read is checked
+    again, so a read never returns an older version than asked for; when no
+    replica qualifies the caller falls back to the source database.
+    """
+
+    def __init__(self, replicas: List[dict], pool_size: int = 4):
+        self._replicas = {
+            sink_label(replica['db_hostname'], replica['db_name']): replica
+            for replica in replicas
+        }
+        self._pool_size = pool_size
+        self._pools: Dict[str, ThreadedConnectionPool] = {}
+        self._lock = Lock()
+        self._turn = itertools.count()
+
+        self.reads: Dict[str, int] = { label: 0 for label in self._replicas }
+        self.fallbacks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._replicas)
+
+    def _pool(self, label: str) -> ThreadedConnectionPool:
+        with self._lock:
+            pool = self._pools.get(label)
+
+            if pool is None:
+                replica = self._replicas[label]
+                pool = self._pools[label] = ThreadedConnectionPool(1,
+                    self._pool_size,
+                    host=replica['db_hostname'],
+                    port=replica['db_port'],
+                    dbname=replica['db_name'],
+                    user=replica['db_user'],
+                    password=replica['db_password'])
+
+            return pool
+
+    def _read(self, label: str, acct_id: int) -> Optional[AccountRecord]:
+        pool = self._pool(label)
+        conn = pool.getconn()
+
+        try:
+            conn.set_session(readonly=True, autocommit=True)
+
+            with conn.cursor() as cur:
+                cur.execute('SELECT "acct_id", "name", "last_change_id", '
+                    '"last_modified" '
+                    F'FROM "{self._replicas[label]["db_table"]}" '
+                    'WHERE "acct_id" = %s', (acct_id,))
+                row = cur.fetchone()
+        except psycopg2.Error:
+            pool.putconn(conn, close=True)
+            raise
+
+        pool.putconn(conn)
+
+        return AccountRecord(*row) if row else None
+
+    def get_account(self, acct_id: int, min_version: Optional[int] = None) \
+        -> Optional[AccountRecord]:
+        """Read an account from a fresh replica.
+
+        Args:
+            acct_id: The account ID.
+            min_version: The last change ID the caller needs, e.g. the one
+                returned by its own write.
+
+        Returns:
+            The account, None when no replica can serve the read.
+        """
+        labels = [label for label in lag_index.fresh_targets(acct_id,
+            min_version) if label in self._replicas]
+
+        if labels:
+            label = labels[next(self._turn) % len(labels)]
+
+            try:
+                record = self._read(label, acct_id)
+            except psycopg2.Error:
+                logger.warning('replica read failed', exc_info=True, extra={
+                    'label': label, 'acct_id': acct_id })
+                record = None
+
+            if record is not None and (min_version is None or
+                record.last_change_id >= min_version):
+                self.reads[label] += 1
+                return record
+
+        self.fallbacks += 1
+        return None
+
+    def metrics(self) -> dict:
+        return {
+            'reads': dict(self.reads),
+            'fallbacks': self.fallbacks,
+        }
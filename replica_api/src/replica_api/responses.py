@@ -0,0 +1,32 @@
+from typing import Any
+import orjson
+from django.http.response import HttpResponse
+
+
+# datetime columns are naive UTC, they are written as ISO 8601 with a Z
+# suffix; account IDs may key the objects
+JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | \
+    orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data: Any) -> bytes:
+    """Encode JSON straight to bytes, datetimes included."""
+    return orjson.dumps(data, option=JSON_OPTIONS)
+
+
+class JsonResponse(HttpResponse):
+    """A JSON response encoded with orjson.
+
+    A drop in for the Django ``JsonResponse``, several times faster on large
+    lists and without the trip through ``str``.
+    """
+
+    def __init__(self, data: Any, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def json_bytes(content: bytes, status: int) -> HttpResponse:
+    """Pass an upstream JSON body through without decoding it."""
+    return HttpResponse(content, status=status,
+        content_type='application/json')
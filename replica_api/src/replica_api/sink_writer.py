@@ -0,0 +1,339 @@
+import asyncio
+import io
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import psycopg2
+from confluent_kafka import Consumer, KafkaError, KafkaException, Message
+from confluent_kafka.schema_registry import SchemaRegistryClient
+from confluent_kafka.schema_registry.avro import AvroDeserializer
+from confluent_kafka.serialization import IntegerDeserializer, \
+    MessageField, SerializationContext
+from replica_api.kafka_api import KafkaAPI
+from replica_api.kafka_consumer import OUTCOME_FAILURE, OUTCOME_SUCCESS
+from replica_api.kafka_producer import get_status_producer
+from replica_api.models import sinks
+
+
+logger = logging.getLogger(__name__)
+
+
+# Value schema ksqlDB registers for the sink KSQL tables
+sink_schema_str = json.dumps({
+    'type': 'record',
+    'name': 'KsqlDataSourceSchema',
+    'namespace': 'io.confluent.ksql.avro_schemas',
+    'fields': [
+        {
+            'name': 'acct_id',
+            'type': [
+                'null',
+                'int'
+            ],
+            'default': None
+        },
+        {
+            'name': 'name',
+            'type': [
+                'null',
+                'string'
+            ],
+            'default': None
+        },
+        {
+            'name': 'last_change_id',
+            'type': [
+                'null',
+                'long'
+            ],
+            'default': None
+        },
+        {
+            'name': 'last_modified',
+            'type': [
+                'null',
+                {
+                    'type': 'long',
+                    'logicalType': 'timestamp-millis'
+                }
+            ],
+            'default': None
+        }
+    ],
+})
+
+COLUMNS = ('acct_id', 'name', 'last_change_id', 'last_modified')
+
+
+def copy_value(value) -> str:
+    """Render a value in the COPY text format."""
+    if value is None:
+        return '\\N'
+
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat(sep=' ')
+
+    return str(value) \
+        .replace('\\', '\\\\') \
+        .replace('\t', '\\t') \
+        .replace('\n', '\\n') \
+        .replace('\r', '\\r')
+
+
+class SinkTable:
+    """Write batches of account records to a sink database table.
+
+    Upserts are copied into a temporary staging table then merged into the
+    table with a single ``INSERT ... ON CONFLICT``, deletes are a single
+    ``DELETE``, all within one transaction.
+    """
+
+    def __init__(self, dsn: dict, table: str):
+        """
+        Args:
+            dsn: The connection parameters of the sink database.
+            table: The sink database table, created when missing the way
+                the JDBC sink connector would.
+        """
+        self.dsn = dsn
+        self.table = table
+        self.conn = None
+
+    def connect(self):
+        self.conn = psycopg2.connect(**self.dsn)
+
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute(
+                F'CREATE TABLE IF NOT EXISTS "{self.table}" ('
+                    '"acct_id" INT NOT NULL PRIMARY KEY,'
+                    '"name" TEXT,'
+                    '"last_change_id" BIGINT,'
+                    '"last_modified" TIMESTAMP'
+                ')')
+            cur.execute(
+                F'CREATE TEMP TABLE IF NOT EXISTS "{self.table}_stage" '
+                F'(LIKE "{self.table}" INCLUDING DEFAULTS) '
+                'ON COMMIT DELETE ROWS')
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def write(self, upserts: List[dict], deletes: List[int]):
+        """Apply a batch in a single transaction.
+
+        Args:
+            upserts: The records to insert or update.
+            deletes: The account IDs to delete.
+        """
+        if self.conn is None:
+            self.connect()
+
+        columns = ','.join(F'"{column}"' for column in COLUMNS)
+
+        try:
+            with self.conn, self.conn.cursor() as cur:
+                if upserts:
+                    buffer = io.StringIO()
+                    for record in upserts:
+                        buffer.write('\t'.join(copy_value(record[column])
+                            for column in COLUMNS))
+                        buffer.write('\n')
+                    buffer.seek(0)
+
+                    cur.copy_expert(F'COPY "{self.table}_stage" ({columns}) '
+                        'FROM STDIN', buffer)
+                    cur.execute(
+                        F'INSERT INTO "{self.table}" ({columns}) '
+                        F'SELECT {columns} FROM "{self.table}_stage" '
+                        'ON CONFLICT ("acct_id") DO UPDATE SET ' +
+                        ','.join(F'"{column}" = EXCLUDED."{column}"'
+                            for column in COLUMNS[1:]))
+
+                if deletes:
+                    cur.execute(F'DELETE FROM "{self.table}" '
+                        'WHERE "acct_id" = ANY(%s)', (deletes,))
+        except psycopg2.OperationalError:
+            # the connection is gone, reconnect on the next batch
+            self.close()
+            raise
+
+
+class SinkWriter:
+    """Consume a sink topic and write it to the sink database in batches.
+
+    An alternative to the JDBC sink connector for large backfills. Records
+    are consumed in large batches, only the latest record of an account is
+    written and the offsets are committed once the batch is written. Every
+    record written is reported on the replica status topic with the sink
+    label, as the connector does.
+    """
+
+    def __init__(
+        self,
+        kafka: KafkaAPI,
+        db_hostname: str,
+        db_port: int,
+        db_name: str,
+        db_table: str,
+        db_user: str,
+        db_password: str,
+        batch_size: int = 10000,
+        batch_timeout: float = 1.0,
+    ):
+        """
+        Args:
+            db_hostname: The sink database hostname.
+            db_port: The sink database port.
+            db_name: The sink database name.
+            db_table: The sink database table.
+            db_user: The sink database username.
+            db_password: The sink database password.
+            batch_size: The maximum number of records written at once.
+            batch_timeout: The seconds waited for a batch to fill.
+        """
+        self.kafka = kafka
+        self.topic = sinks.sink_name(db_hostname, db_name, db_table)
+        self.label = sinks.sink_label(db_hostname, db_name)
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+
+        self.table = SinkTable({
+            'host': db_hostname,
+            'port': db_port,
+            'dbname': db_name,
+            'user': db_user,
+            'password': db_password,
+        }, db_table)
+
+        self.stats = {
+            'batches': 0,
+            'records': 0,
+            'upserts': 0,
+            'deletes': 0,
+            'seconds': 0.0,
+        }
+
+        self.key_deserializer = IntegerDeserializer()
+        self.value_deserializer = AvroDeserializer(SchemaRegistryClient({
+            'url': kafka.schema_registry.url,
+        }), sink_schema_str)
+
+    def create_consumer(self) -> Consumer:
+        # a plain consumer fetches whole batches, the deserializing consumer
+        # only polls one message at a time
+        return Consumer({
+            'bootstrap.servers': self.kafka.bootstrap_servers,
+            # the group is named after the sink so the worker takes over
+            # from where it stopped, separately from the connector group
+            'group.id': F'{self.topic}_writer',
+            'auto.offset.reset': 'earliest',
+            'enable.auto.commit': False,
+        })
+
+    def collect(self, msgs: List[Message]) \
+        -> Tuple[Dict[int, Optional[dict]], int]:
+        """The latest record of every account of a batch, None for deletes.
+
+        Returns:
+            The records keyed by account ID and the number of messages.
+        """
+        latest = {}
+        count = 0
+
+        for msg in msgs:
+            if msg.error():
+                if msg.error().code() == KafkaError._PARTITION_EOF:
+                    continue
+                raise KafkaException(msg.error())
+
+            acct_id = self.key_deserializer(msg.key(), SerializationContext(
+                msg.topic(), MessageField.KEY, msg.headers()))
+            latest[acct_id] = self.value_deserializer(msg.value(),
+                SerializationContext(msg.topic(), MessageField.VALUE,
+                msg.headers()))
+            count += 1
+
+        return latest, count
+
+    async def report(self, records: Dict[int, Optional[dict]], outcome: int):
+        """Produce the replica status events of a batch."""
+        producer = get_status_producer(self.kafka)
+
+        await asyncio.gather(*[producer.produce(acct_id, {
+            'label': self.label,
+            'outcome': outcome,
+            'version': str(value['last_change_id'])
+                if value and value['last_change_id'] is not None else None,
+            'updatedOn': value['last_modified'] if value else None,
+        }) for acct_id, value in records.items()])
+
+    async def write_batch(self, consumer: Consumer,
+        msgs: List[Message]):
+        records, count = self.collect(msgs)
+
+        if not records:
+            return
+
+        upserts = [{**value, 'acct_id': acct_id}
+            for acct_id, value in records.items() if value is not None]
+        deletes = [acct_id for acct_id, value in records.items()
+            if value is None]
+
+        started = time.monotonic()
+
+        try:
+            self.table.write(upserts, deletes)
+        except Exception:
+            await self.report(records, OUTCOME_FAILURE)
+            raise
+
+        consumer.commit(asynchronous=False)
+        await self.report(records, OUTCOME_SUCCESS)
+
+        self.stats['batches'] += 1
+        self.stats['records'] += count
+        self.stats['upserts'] += len(upserts)
+        self.stats['deletes'] += len(deletes)
+        self.stats['seconds'] += time.monotonic() - started
+
+        logger.info('sink batch written', extra={
+            'topic': self.topic,
+            'records': count,
+            'upserts': len(upserts),
+            'deletes': len(deletes),
+            'seconds': time.monotonic() - started })
+
+    async def run(self, idle_exit: Optional[float] = None):
+        """Write the sink topic until stopped.
+
+        Args:
+            idle_exit: Stop once no record was received for this many
+                seconds, e.g. when a backfill is caught up.
+        """
+        loop = asyncio.get_running_loop()
+        consumer = self.create_consumer()
+        idle_since = time.monotonic()
+
+        try:
+            consumer.subscribe([self.topic])
+
+            while True:
+                msgs = await loop.run_in_executor(None, consumer.consume,
+                    self.batch_size, self.batch_timeout)
+
+                if msgs:
+                    idle_since = time.monotonic()
+                    await self.write_batch(consumer, msgs)
+                elif idle_exit is not None and \
+                    time.monotonic() - idle_since >= idle_exit:
+                    break
+        finally:
+            consumer.close()
+            self.table.close()
+            get_status_producer(self.kafka).flush()
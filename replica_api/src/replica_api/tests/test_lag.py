@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from django.conf import settings
+from django.test import SimpleTestCase
+from replica_api.kafka_consumer import OUTCOME_FAILURE, OUTCOME_SUCCESS
+from replica_api.lag import LagIndex
+
+
+def status(label: str, version: int, updated_on: float,
+    outcome: int = OUTCOME_SUCCESS) -> dict:
+    return {
+        'label': label,
+        'outcome': outcome,
+        'version': str(version),
+        'updatedOn': datetime.fromtimestamp(updated_on, timezone.utc),
+    }
+
+
+class LagIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = LagIndex()
+
+    def source(self, acct_id: int, version: int, updated_on: float):
+        self.index.on_status(acct_id, status(settings.SOURCE_LABEL, version,
+            updated_on))
+
+    def sink(self, acct_id: int, label: str, version: int,
+        outcome: int = OUTCOME_SUCCESS):
+        self.index.on_status(acct_id, status(label, version, 0, outcome))
+
+    def lagging(self, limit: int = 10):
+        return [(found['acct_id'], found['label'])
+            for found in self.index.most_lagging(limit)]
+
+    def test_targets_catch_up(self):
+        self.index.set_targets(1, ['a', 'b'])
+        self.source(1, 3, 100)
+
+        self.assertEqual(self.lagging(), [(1, 'a'), (1, 'b')])
+
+        self.sink(1, 'a', 3)
+        self.assertEqual(self.lagging(), [(1, 'b')])
+
+        self.sink(1, 'b', 2)
+        self.assertEqual(self.lagging(), [(1, 'b')])
+        self.assertEqual(self.index.account(1)['targets'][1]
+            ['versions_behind'], 1)
+
+        self.sink(1, 'b', 3)
+        self.assertEqual(self.lagging(), [])
+        self.assertEqual(self.index.metrics()['behind'], 0)
+
+    def test_failed_outcome_keeps_target_behind(self):
+        self.index.set_targets(1, ['a'])
+        self.source(1, 2, 100)
+        self.sink(1, 'a', 2, OUTCOME_FAILURE)
+
+        self.assertEqual(self.lagging(), [(1, 'a')])
+        self.assertTrue(self.index.account(1)['targets'][0]['failed'])
+
+    def test_most_lagging_oldest_first(self):
+        for acct_id, updated_on in ((1, 300), (2, 100), (3, 400), (4, 200)):
+            self.index.set_targets(acct_id, ['a'])
+            self.source(acct_id, 1, updated_on)
+
+        self.assertEqual(self.lagging(), [(2, 'a'), (4, 'a'), (1, 'a'),
+            (3, 'a')])
+        self.assertEqual(self.lagging(2), [(2, 'a'), (4, 'a')])
+
+    def test_stale_entries_skipped(self):
+        self.index.set_targets(1, ['a'])
+        self.index.set_targets(2, ['a'])
+        self.source(1, 1, 100)
+        self.source(2, 1, 200)
+
+        # account 1 catches up then falls behind again, its first heap
+        # entry is stale
+        self.sink(1, 'a', 1)
+        self.source(1, 2, 300)
+
+        found = self.index.most_lagging()
+
+        self.assertEqual([(f['acct_id'], f['label']) for f in found],
+            [(2, 'a'), (1, 'a')])
+        self.assertEqual(found[1]['versions_behind'], 1)
+
+    def test_reassigned_target_listed_once(self):
+        self.index.set_targets(1, ['a'])
+        self.source(1, 1, 100)
+
+        # removing and assigning again pushes a second entry with the same
+        # time it fell behind
+        self.index.set_targets(1, [])
+        self.index.set_targets(1, ['a'])
+
+        self.assertEqual(self.lagging(), [(1, 'a')])
+
+    def test_compaction(self):
+        for acct_id in range(1, 1201):
+            self.index.set_targets(acct_id, ['a'])
+            self.source(acct_id, 1, acct_id)
+
+        for acct_id in range(1, 1200):
+            self.sink(acct_id, 'a', 1)
+
+        # every entry but one is stale, the next push compacts the heap
+        self.index.set_targets(5000, ['a'])
+        self.source(5000, 1, 50)
+
+        self.assertEqual(len(self.index._heap), 2)
+        self.assertEqual(self.lagging(), [(5000, 'a'), (1200, 'a')])
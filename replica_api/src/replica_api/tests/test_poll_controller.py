@@ -0,0 +1,37 @@
+from django.test import SimpleTestCase
+from replica_api.poll_controller import PollController
+
+
+class PollControllerTest(SimpleTestCase):
+    def setUp(self):
+        self.controller = PollController(min_interval_ms=200,
+            max_interval_ms=60000, target_changes=1.0, hysteresis=2.0,
+            cooldown=60.0)
+
+    def switched(self, interval_ms: int, now: float):
+        self.controller._interval_ms = interval_ms
+        self.controller._changed = now
+
+    def test_aimed_interval_bounds(self):
+        self.assertEqual(self.controller.aimed_interval(0), 60000)
+        self.assertEqual(self.controller.aimed_interval(0.001), 60000)
+        self.assertEqual(self.controller.aimed_interval(0.5), 2000)
+        self.assertEqual(self.controller.aimed_interval(100), 200)
+
+    def test_first_decision_applies_aimed(self):
+        self.assertEqual(self.controller.decide(0.5, 0), 2000)
+
+    def test_cooldown(self):
+        self.switched(2000, 0)
+
+        self.assertIsNone(self.controller.decide(100, 30))
+        self.assertEqual(self.controller.decide(100, 61), 200)
+
+    def test_hysteresis(self):
+        self.switched(2000, 0)
+
+        # 3000ms and 1250ms are within a factor 2 of the current interval
+        self.assertIsNone(self.controller.decide(1 / 3, 100))
+        self.assertIsNone(self.controller.decide(0.8, 100))
+        self.assertEqual(self.controller.decide(0.2, 100), 5000)
+        self.assertEqual(self.controller.decide(5, 100), 200)
@@ -0,0 +1,56 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from replica_api.models import verify
+
+
+class FakeSession:
+    """A source session on which the targeted accounts do not exist."""
+
+    def begin(self):
+        pass
+
+    def execute(self, *args, **kwargs):
+        result = mock.Mock()
+        result.one.return_value = (None, None)
+        result.all.return_value = []
+        return result
+
+    def rollback(self):
+        pass
+
+
+class FakeSink:
+    def __init__(self, rows: dict):
+        self._rows = rows
+
+    def bounds(self):
+        return (min(self._rows), max(self._rows)) if self._rows else None
+
+    def rows(self, lo: int, hi: int):
+        return { acct_id: digest for acct_id, digest in self._rows.items()
+            if lo <= acct_id <= hi }
+
+    def close(self):
+        pass
+
+
+class VerifySinkTest(SimpleTestCase):
+    async def verify_sink(self, sink_rows: dict) -> dict:
+        with mock.patch.object(verify, 'SinkSide',
+            lambda dsn, table: FakeSink(sink_rows)):
+            return await verify.verify_sink(None, FakeSession(), [5, 6],
+                db_hostname='replica', db_port=5432, db_name='replica',
+                db_table='account', db_user='replica', db_password='replica')
+
+    async def test_targeted_accounts_missing_everywhere(self):
+        result = await self.verify_sink({})
+
+        self.assertTrue(result['in_sync'])
+        self.assertEqual(result['queries'], 0)
+
+    async def test_targeted_accounts_missing_from_source(self):
+        result = await self.verify_sink({ 5: 1, 6: 2 })
+
+        self.assertFalse(result['in_sync'])
+        self.assertEqual(result['extra'], [5, 6])
+        self.assertEqual(result['missing'], [])
@@ -16,10 +16,14 @@ Including another URLconf
 from django.urls import path, include
 from .views import accounts 
 from .views import cluster
+from .views import health
+from .views import metrics
 
 
 urlpatterns = [
     path('v1/accounts/', include(accounts.v1)),
     path('v1/cluster/', include(cluster.v1)),
+    path('health/', include(health.v1)),
+    path('metrics/', include(metrics.v1)),
 ]
 
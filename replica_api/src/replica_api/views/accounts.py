@@ -1,9 +1,15 @@
+import asyncio
 from django.http import HttpRequest
-from django.http.response import HttpResponse, JsonResponse
+from django.http.response import HttpResponse
 from django.urls import path
 from django.conf import settings
+from confluent_kafka import KafkaException
+from voluptuous import Invalid
 from st1_django.utils import AsyncView, json_deserialize
+from replica_api import conditional
+from replica_api.lag import lag_index
 from replica_api.models import accounts
+from replica_api.responses import JsonResponse
 from logging import Logger
 logger = Logger(__name__)
 
@@ -47,18 +53,83 @@ class Accts(AsyncView):
              A JSON HTTP response with a list of accounts.
         """
         async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+            if conditional.has_validators(request):
+                count, last_change_id, last_modified = \
+                    await accounts.get_accounts_version(db_session)
+                etag = conditional.accounts_etag(count, last_change_id)
+
+                not_modified = conditional.not_modified(request, etag,
+                    last_modified)
+                if not_modified:
+                    return conditional.set_validators(not_modified, etag,
+                        last_modified)
+
             accts = await accounts.list_accounts(db_session)
-            
-        return JsonResponse({
-            'accounts': [{
-                'id': acct.id,
-                'name': acct.name,
-                'lastChange': {
-                    'id': acct.last_change_id,
-                    'on': f'{acct.last_modified}Z',
-                },
-            } for acct in accts]
-        })
+
+        etag = conditional.accounts_etag(len(accts),
+            max((acct.last_change_id for acct in accts), default=None))
+        last_modified = max((acct.last_modified for acct in accts),
+            default=None)
+
+        return conditional.set_validators(JsonResponse({
+            'accounts': [accounts.account_json(acct) for acct in accts]
+        }), etag, last_modified)
+
+
+class AcctsBatch(AsyncView):
+    """Handle reading many accounts at once."""
+
+    # noinspection PyMethodMayBeStatic
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get many accounts with their targets.
+
+        The database and the target lookups each run once for the whole
+        batch and concurrently with one another.
+
+        Args:
+            request: The Django web request, the ``ids`` query parameter is a
+                comma separated list of account IDs.
+
+        Returns:
+             A JSON HTTP response with the accounts keyed by ID, accounts
+             which do not exist are omitted.
+        """
+        try:
+            acct_ids = accounts.get_accounts_schema(list(dict.fromkeys(
+                int(acct_id) for acct_id in request.GET.get('ids', '').split(',')
+                if acct_id)))
+        except (ValueError, Invalid):
+            return JsonResponse({
+                'error': F'ids must be a comma separated list of 1 to '
+                    F'{accounts.MAX_BATCH_ACCOUNTS} account IDs',
+            }, status=400)
+
+        async def get_accounts():
+            async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+                return await accounts.get_accounts(db_session, acct_ids)
+
+        accts, trgs = await asyncio.gather(get_accounts(),
+            accounts.get_trgs(settings.KAFKA_API, acct_ids))
+
+        etag = conditional.accounts_etag(len(accts),
+            max((acct.last_change_id for acct in accts), default=None),
+            [F'{acct_id}:{"|".join(trgs[acct_id])}' for acct_id in sorted(trgs)])
+        last_modified = max((acct.last_modified for acct in accts),
+            default=None)
+
+        not_modified = conditional.not_modified(request, etag, last_modified)
+        if not_modified:
+            return conditional.set_validators(not_modified, etag,
+                last_modified)
+
+        return conditional.set_validators(JsonResponse({
+            'accounts': {
+                acct.id: {
+                    'account': accounts.account_json(acct),
+                    'targets': trgs.get(acct.id, []),
+                } for acct in accts
+            },
+        }), etag, last_modified)
 
 
 class Acct(AsyncView):
@@ -69,28 +140,61 @@ class Acct(AsyncView):
         """Get an account.
 
         Args:
-            request: The Django web request.
+            request: The Django web request, the ``min_change_id`` query
+                parameter is the last change ID the read must include, e.g.
+                the one returned by a write.
             acct_id: The account ID.
 
         Returns:
              A JSON HTTP response with the account information.
         """
-        async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
-            acct = await accounts.get_account(db_session, acct_id)
+        try:
+            min_change_id = accounts.min_change_id_schema(
+                int(request.GET['min_change_id'])) \
+                if 'min_change_id' in request.GET else None
+        except (ValueError, Invalid):
+            return JsonResponse({
+                'error': 'min_change_id must be a change ID',
+            }, status=400)
 
-        trgs = await accounts.get_trg(settings.KAFKA_API, acct_id)
-        
-        return JsonResponse({
-            'account': {
-                'id': acct.id,
-                'name': acct.name,
-                'lastChange': {
-                    'id': acct.last_change_id,
-                    'on': F'{acct.last_modified}Z',
-                },
-            },
+        async def get_account():
+            acct = await accounts.get_replica_account(acct_id, min_change_id)
+
+            if acct is not None:
+                return acct
+
+            async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+                return await accounts.get_account(db_session, acct_id)
+
+        async def get_account_version():
+            async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+                return await accounts.get_account_version(db_session, acct_id)
+
+        if conditional.has_validators(request):
+            version, trgs = await asyncio.gather(get_account_version(),
+                accounts.get_trg(settings.KAFKA_API, acct_id))
+
+            if version:
+                last_change_id, last_modified = version
+                etag = conditional.account_etag(acct_id, last_change_id, trgs)
+
+                not_modified = conditional.not_modified(request, etag,
+                    last_modified)
+                if not_modified:
+                    return conditional.set_validators(not_modified, etag,
+                        last_modified)
+
+            acct = await get_account()
+        else:
+            acct, trgs = await asyncio.gather(get_account(),
+                accounts.get_trg(settings.KAFKA_API, acct_id))
+
+        etag = conditional.account_etag(acct.id, acct.last_change_id, trgs)
+
+        return conditional.set_validators(JsonResponse({
+            'account': accounts.account_json(acct),
             "targets": trgs,
-        })
+        }), etag, acct.last_modified)
 
     # noinspection PyMethodMayBeStatic
     async def patch(self, request: HttpRequest, acct_id: int) -> HttpResponse:
@@ -116,29 +220,191 @@ class Acct(AsyncView):
             },
             "change": {
                 'id': acct.last_change_id,
-                'on': f'{acct.last_modified}Z',
+                'on': acct.last_modified,
             },
         })
 
 
+class AcctsCache(AsyncView):
+    """Handle reporting on the account cache."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the account cache hit, miss and invalidation counters.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the cache metrics.
+        """
+        return JsonResponse({
+            'cache': accounts.account_cache.metrics(),
+        })
+
+
+class AcctsLag(AsyncView):
+    """Handle reporting on the replication lag of many accounts."""
+
+    # noinspection PyMethodMayBeStatic
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the targets which are behind their account for the longest.
+
+        Args:
+            request: The Django web request, the ``limit`` query parameter
+                is the number of targets returned.
+
+        Returns:
+             A JSON HTTP response with the most lagging targets, the lag
+             index and the read replica metrics.
+        """
+        try:
+            limit = accounts.lag_limit_schema(int(request.GET.get('limit',
+                10)))
+        except (ValueError, Invalid):
+            return JsonResponse({
+                'error': F'limit must be between 1 and '
+                    F'{accounts.MAX_LAG_LIMIT}',
+            }, status=400)
+
+        return JsonResponse({
+            'lagging': lag_index.most_lagging(limit),
+            'index': lag_index.metrics(),
+            'replicas': accounts.read_router.metrics(),
+        })
+
+
+class AcctLag(AsyncView):
+    """Handle reporting on the replication lag of a single account."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest, acct_id: int) -> HttpResponse:
+        """Get how far behind every target of an account is.
+
+        Args:
+            request: The Django web request.
+            acct_id: The account ID.
+
+        Returns:
+             A JSON HTTP response with the version of the account and the
+             lag of every target, 404 when no status of the account was
+             seen yet.
+        """
+        lag = lag_index.account(acct_id)
+
+        if lag is None:
+            return JsonResponse({
+                'account': {
+                    'id': acct_id,
+                },
+                'error': 'no replica status seen for the account',
+            }, status=404)
+
+        return JsonResponse(lag)
+
+
 # Data Targets #####
+class AcctsTarget(AsyncView):
+    """Handle producing data targets of many accounts."""
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        """Set the data targets of many accounts.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the outcome of each account.
+        """
+        data = accounts.set_many_targets_schema(
+            json_deserialize(request.body))['accounts']
+
+        assignments = {acct['id']: acct['targets'] for acct in data}
+
+        try:
+            async with settings.SQLALCHEMY_DATABASES.db_context() \
+                as db_session:
+                reports = await accounts.set_trgs(settings.KAFKA_API,
+                    db_session, assignments)
+        except accounts.TargetsLocked as e:
+            return JsonResponse({
+                'error': str(e),
+            }, status=409)
+
+        results = []
+        failed = False
+
+        for (acct_id, trgs), report in zip(assignments.items(), reports):
+            if isinstance(report, Exception):
+                failed = True
+                results.append({
+                    'id': acct_id,
+                    'targets': trgs,
+                    'error': str(report),
+                })
+            else:
+                results.append({
+                    'id': acct_id,
+                    'targets': trgs,
+                })
+
+        return JsonResponse({
+            'accounts': results,
+        }, status=502 if failed else 200)
+
+
 class AcctTarget(AsyncView):
-    """Handle insert data into the target ktable."""
+    """Handle producing data targets of a single account."""
 
     async def post(self, request: HttpRequest, acct_id: int) -> HttpResponse:
+        """Set the data targets of an account.
+
+        Args:
+            request: The Django web request.
+            acct_id: The account ID.
+
+        Returns:
+             A JSON HTTP response with the account targets.
+        """
         targets = accounts.set_targets_schema(json_deserialize(request.body))['targets']
 
-        resp = await accounts.set_trg(settings.KAFKA_API, acct_id=acct_id,
-            targets=targets)
+        try:
+            async with settings.SQLALCHEMY_DATABASES.db_context() \
+                as db_session:
+                await accounts.set_trg(settings.KAFKA_API, db_session,
+                    acct_id=acct_id, targets=targets)
+        except accounts.TargetsLocked as e:
+            return JsonResponse({
+                'account': {
+                    'id': acct_id,
+                },
+                'error': str(e),
+            }, status=409)
+        except KafkaException as e:
+            return JsonResponse({
+                'account': {
+                    'id': acct_id,
+                },
+                'error': str(e),
+            }, status=502)
 
-        return HttpResponse(resp.content.decode('UTF-8'),
-            status=resp.status_code, content_type='application/json')
+        return JsonResponse({
+            'account': {
+                'id': acct_id,
+            },
+            'targets': targets,
+        })
 
 
 # URLs #################################
 v1 = [
     path('', Accts.as_view()),
+    path('batch/', AcctsBatch.as_view()),
+    path('cache/', AcctsCache.as_view()),
+    path('lag/', AcctsLag.as_view()),
+    path('trg/', AcctsTarget.as_view()),
     path('<int:acct_id>/', Acct.as_view()),
     path('<int:acct_id>/trg/', AcctTarget.as_view()),
+    path('<int:acct_id>/lag/', AcctLag.as_view()),
 ]
 
@@ -1,14 +1,15 @@
 from django.http import HttpRequest
-from django.http.response import HttpResponse, JsonResponse
+from django.http.response import HttpResponse
 from django.urls import path
 from django.conf import settings
 from st1_django.utils import AsyncView, json_deserialize
-from replica_api.models import sources, sinks, targets
-
-
-def json_bytes(content: bytes, status: int) -> HttpResponse:
-    return HttpResponse(content.decode('UTF-8'), status=status,
-        content_type='application/json')
+from replica_api.models import accounts, bootstrap, sources, sinks, targets, \
+    topology, partitions, verify
+from replica_api.connector_status import connector_status
+from replica_api.logical_source import source
+from replica_api.outbox import relay
+from replica_api.poll_controller import poll_controller
+from replica_api.responses import JsonResponse, json_bytes
 
 
 # APIs ###################################
@@ -22,6 +23,89 @@ class Connectors(AsyncView):
         return json_bytes(resp.content, status=resp.status_code)
 
 
+class ConnectorsStatus(AsyncView):
+    """Handle reporting on the state of the connectors and their tasks."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the last snapshot of the connector and task states.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the state of every connector and
+             task, the failed tasks and the age of the snapshot.
+        """
+        return JsonResponse(connector_status.snapshot())
+
+
+class Topology(AsyncView):
+    """Handle reconciling the cluster with a desired topology."""
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        """Create or update whatever is missing from the desired topology.
+
+        Args:
+            request: The Django web request, the body holds the source and
+                sink database connections.
+
+        Returns:
+             A JSON HTTP response with the outcome of every step applied.
+        """
+        data = topology.topology_schema(json_deserialize(request.body))
+
+        try:
+            steps, ok = await topology.reconcile(settings.KAFKA_API,
+                ([data['source']] if 'source' in data else [])
+                    + data['shards'], data['sinks'], prune=data['prune'],
+                dry_run=data['dry_run'], routing=data.get('routing'),
+                partitions=data.get('partitions'))
+        except topology.TopologyConflict as e:
+            return JsonResponse({
+                'error': str(e),
+            }, status=409)
+
+        return JsonResponse({
+            'steps': steps,
+        }, status=200 if ok else 502)
+
+
+class TopologyPartitions(AsyncView):
+    """Handle re-partitioning the source and target topics."""
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        """Migrate the topology to another partition count.
+
+        Replication is paused for the duration of the migration.
+
+        Args:
+            request: The Django web request, the body holds the partition
+                count and optionally the sink connector task count.
+
+        Returns:
+             A JSON HTTP response with the outcome of every step applied.
+        """
+        data = partitions.migrate_partitions_schema(
+            json_deserialize(request.body))
+
+        try:
+            async with settings.SQLALCHEMY_DATABASES.db_context() \
+                as db_session:
+                steps, ok = await partitions.migrate(settings.KAFKA_API,
+                    db_session, data['partitions'],
+                    tasks_max=data.get('tasks_max'),
+                    routing=data.get('routing'))
+        except topology.TopologyConflict as e:
+            return JsonResponse({
+                'error': str(e),
+            }, status=409)
+
+        return JsonResponse({
+            'steps': steps,
+        }, status=200 if ok else 502)
+
+
 # Source ###########
 class SourceSchemaRegistry(AsyncView):
     """Handle configuring the source connector and source ktable."""
@@ -36,7 +120,9 @@ class SourceKTable(AsyncView):
     """Handle configuring the source connector and source ktable."""
 
     async def post(self, request: HttpRequest) -> HttpResponse:
-        resp = await sources.create_ktable(settings.KAFKA_API)
+        data = json_deserialize(request.body) if request.body else {}
+
+        resp = await sources.create_ktable(settings.KAFKA_API, **data)
         
         return json_bytes(resp.content, status=resp.status_code)
 
@@ -57,7 +143,9 @@ class SourceConnector(AsyncView):
         return json_bytes(resp.content, status=resp.status_code)
 
     async def delete(self, request: HttpRequest) -> HttpResponse:
-        resp = await sources.delete_connector(settings.KAFKA_API)
+        data = json_deserialize(request.body) if request.body else {}
+
+        resp = await sources.delete_connector(settings.KAFKA_API, **data)
         
         return json_bytes(resp.content, status=resp.status_code)
 
@@ -66,7 +154,9 @@ class SourceConnectorPause(AsyncView):
     """Handle pausing the source connector."""
 
     async def put(self, request: HttpRequest) -> HttpResponse:
-        resp = await sources.pause_connector(settings.KAFKA_API)
+        data = json_deserialize(request.body) if request.body else {}
+
+        resp = await sources.pause_connector(settings.KAFKA_API, **data)
         
         return json_bytes(resp.content, status=resp.status_code)
 
@@ -75,21 +165,174 @@ class SourceConnectorResume(AsyncView):
     """Handle resuming the source connector."""
 
     async def put(self, request: HttpRequest) -> HttpResponse:
-        resp = await sources.resume_connector(settings.KAFKA_API)
+        data = json_deserialize(request.body) if request.body else {}
+
+        resp = await sources.resume_connector(settings.KAFKA_API, **data)
         
         return json_bytes(resp.content, status=resp.status_code)
 
 
 class SourceConnectorRestart(AsyncView):
-    """Handle restarting the sink connector."""
+    """Handle restarting the source connector."""
 
     async def put(self, request: HttpRequest) -> HttpResponse:
-        resp = await sources.restart_connector(settings.KAFKA_API)
+        data = json_deserialize(request.body) if request.body else {}
+
+        resp = await sources.restart_connector(settings.KAFKA_API, **data)
         
         return json_bytes(resp.content, status=resp.status_code)
 
 
+class SourceTables(AsyncView):
+    """Handle inspecting the table registry."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the tables replicated by the source connector.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the registered tables and their
+             topics.
+        """
+        return JsonResponse({
+            'tables': [{
+                **table._asdict(),
+                'topic': table.topic,
+            } for table in sources.get_tables()],
+        })
+
+
+class SourcePollInterval(AsyncView):
+    """Handle inspecting the source poll interval controller."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the change rate and the poll interval of the source connector.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the controller metrics of this
+             process.
+        """
+        return JsonResponse({
+            'mode': settings.SOURCE_MODE,
+            'controller': poll_controller.metrics(),
+        })
+
+
+class SourceOutbox(AsyncView):
+    """Handle inspecting the outbox relay."""
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the pending changes and the throughput of the outbox relay.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the outbox backlog and the relay
+             metrics of this process.
+        """
+        async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+            pending, oldest = await accounts.count_outbox(db_session)
+
+        return JsonResponse({
+            'mode': settings.SOURCE_MODE,
+            'pending': pending,
+            'oldest': oldest.isoformat() if oldest else None,
+            'relay': relay.metrics(),
+        })
+
+
+class SourceLogical(AsyncView):
+    """Handle inspecting the logical replication source."""
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the throughput, lag and checkpoint of the logical source.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the metrics of this process.
+        """
+        return JsonResponse({
+            'mode': settings.SOURCE_MODE,
+            'slot': source.slot_name,
+            'source': source.metrics(),
+        })
+
+
 # Sink #############
+class SinkRoutingKTable(AsyncView):
+    """Handle configuring the routing ktable shared by the sink ktables."""
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        resp = await sinks.create_routing_ktable(settings.KAFKA_API)
+
+        return json_bytes(resp.content, status=resp.status_code)
+
+    async def delete(self, request: HttpRequest) -> HttpResponse:
+        resp = await sinks.delete_routing_ktable(settings.KAFKA_API)
+
+        return json_bytes(resp.content, status=resp.status_code)
+
+
+class SinkBootstrap(AsyncView):
+    """Handle provisioning a new sink from a snapshot."""
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        """Bulk load the accounts targeting a new sink, then stream it.
+
+        Args:
+            request: The Django web request, the body holds the sink
+                database connection.
+
+        Returns:
+             A JSON HTTP response with the outcome of every step applied.
+        """
+        data = bootstrap.bootstrap_schema(json_deserialize(request.body))
+
+        async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+            steps, ok = await bootstrap.bootstrap(settings.KAFKA_API,
+                db_session, **data)
+
+        return JsonResponse({
+            'steps': steps,
+        }, status=200 if ok else 502)
+
+
+class SinkVerify(AsyncView):
+    """Handle verifying the sink tables match the source."""
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        """Compare the source accounts with sink tables by range checksums.
+
+        Args:
+            request: The Django web request, the body holds the sink
+                database connections and whether to repair the differences.
+
+        Returns:
+             A JSON HTTP response with the differences found in every sink.
+        """
+        data = verify.verify_schema(json_deserialize(request.body))
+
+        async with settings.SQLALCHEMY_DATABASES.db_context() as db_session:
+            results = await verify.verify(settings.KAFKA_API, db_session,
+                data['sinks'], repair=data['repair'], fanout=data['fanout'],
+                leaf_size=data['leaf_size'])
+
+        return JsonResponse({
+            'sinks': results,
+        }, status=200 if all('error' not in result for result in results)
+            else 502)
+
+
 class SinkKTables(AsyncView):
     """Handle configuring the source connector and source ktable."""
 
@@ -159,12 +402,36 @@ class SinkConnectorRestart(AsyncView):
         return json_bytes(resp.content, status=resp.status_code)
 
 
+class SinkConnectorProfile(AsyncView):
+    """Handle switching the tuning profile of a sink connector."""
+
+    async def put(self, request: HttpRequest) -> HttpResponse:
+        """Switch a running sink connector to another tuning profile.
+
+        Args:
+            request: The Django web request, the body holds the sink
+                database, table and profile.
+
+        Returns:
+             Response from the Kafka connect API.
+        """
+        data = topology.sink_profile_schema(json_deserialize(request.body))
+
+        resp = await sinks.set_profile(settings.KAFKA_API,
+            data['db_hostname'], data['db_name'], data['db_table'],
+            data['profile'])
+
+        return json_bytes(resp.content, status=resp.status_code)
+
+
 # Targets ##########
 class TargetKTable(AsyncView):
     """Handle configuring the source connector and source ktable."""
 
     async def post(self, request: HttpRequest) -> HttpResponse:
-        resp = await targets.create_ktable(settings.KAFKA_API)
+        data = json_deserialize(request.body) if request.body else {}
+
+        resp = await targets.create_ktable(settings.KAFKA_API, **data)
         
         return json_bytes(resp.content, status=resp.status_code)
 
@@ -191,17 +458,28 @@ class TargetKTableQueryable(AsyncView):
 # URLs #################################
 v1 = [
     path('connectors/', Connectors.as_view()),
+    path('connectors/status/', ConnectorsStatus.as_view()),
+    path('topology/', Topology.as_view()),
+    path('topology/partitions/', TopologyPartitions.as_view()),
     path('src/schema-registry/', SourceSchemaRegistry.as_view()),
     path('src/ktable/', SourceKTable.as_view()),
     path('src/connector/', SourceConnector.as_view()),
     path('src/connectors/pause/', SourceConnectorPause.as_view()),
     path('src/connectors/resume/', SourceConnectorResume.as_view()),
     path('src/connectors/restart/', SourceConnectorRestart.as_view()),
+    path('src/poll-interval/', SourcePollInterval.as_view()),
+    path('src/tables/', SourceTables.as_view()),
+    path('src/outbox/', SourceOutbox.as_view()),
+    path('src/logical/', SourceLogical.as_view()),
+    path('snk/routing-ktable/', SinkRoutingKTable.as_view()),
+    path('snk/bootstrap/', SinkBootstrap.as_view()),
+    path('snk/verify/', SinkVerify.as_view()),
     path('snk/ktables/', SinkKTables.as_view()),
     path('snk/connectors/', SinkConnectors.as_view()),
     path('snk/connectors/pause/', SinkConnectorPause.as_view()),
     path('snk/connectors/resume/', SinkConnectorResume.as_view()),
     path('snk/connectors/restart/', SinkConnectorRestart.as_view()),
+    path('snk/connectors/profile/', SinkConnectorProfile.as_view()),
     path('trg/ktable/', TargetKTable.as_view()),
     path('trg/ktable-queryable/', TargetKTableQueryable.as_view()),
 ]
@@ -0,0 +1,48 @@
+from django.http import HttpRequest
+from django.http.response import HttpResponse
+from django.urls import path
+from st1_django.utils import AsyncView
+from replica_api.health import readiness
+from replica_api.responses import JsonResponse
+
+
+# APIs ###################################
+class Live(AsyncView):
+    """Handle the liveness probe."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Report the process is serving requests.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response, always successful.
+        """
+        return JsonResponse({ 'live': True })
+
+
+class Ready(AsyncView):
+    """Handle the readiness probe."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Report whether the process should be sent traffic.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             A JSON HTTP response with the outcome of the warm up checks,
+             a 503 while warming up or draining.
+        """
+        status = readiness.status()
+
+        return JsonResponse(status, status=200 if status['ready'] else 503)
+
+
+v1 = [
+    path('live/', Live.as_view()),
+    path('ready/', Ready.as_view()),
+]
@@ -0,0 +1,29 @@
+from django.http import HttpRequest
+from django.http.response import HttpResponse
+from django.urls import path
+from prometheus_client import CONTENT_TYPE_LATEST
+from st1_django.utils import AsyncView
+from replica_api import metrics
+
+
+# APIs ###################################
+class Metrics(AsyncView):
+    """Handle the Prometheus scrapes."""
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        """Get the metrics in the Prometheus text format.
+
+        Args:
+            request: The Django web request.
+
+        Returns:
+             The request, database pool, upstream and thread pool metrics.
+        """
+        return HttpResponse(metrics.latest(),
+            content_type=CONTENT_TYPE_LATEST)
+
+
+v1 = [
+    path('', Metrics.as_view()),
+]
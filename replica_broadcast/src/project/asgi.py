@@ -13,17 +13,18 @@ from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 from replica_broadcast.routing import websocket_urlpatterns
-from replica_broadcast.kafka_consumer import start_consumer
+from replica_broadcast.kafka_consumer import start_consumers, \
+    stop_consumers
+from replica_broadcast.lifespan import Lifespan
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
-start_consumer()
-
-application = ProtocolTypeRouter({
+# the Kafka consumers start once the server is up, not on import
+application = Lifespan(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+}), startup=[start_consumers], shutdown=[stop_consumers])
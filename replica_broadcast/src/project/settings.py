@@ -86,6 +86,10 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Dashboard
+# seconds between the aggregate pushes to dashboard websockets
+DASHBOARD_TICK = float(os.getenv('DASHBOARD_TICK', '1.0'))
+
 # Kafka
 KAFKA_API = KafkaAPI(
     bootstrap_servers=os.getenv('KAFKA_BOOTSTRAP_SERVERS'),
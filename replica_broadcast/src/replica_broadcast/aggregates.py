@@ -0,0 +1,64 @@
+from threading import Lock
+from typing import Dict, Set, Tuple
+
+
+# outcomes of the replica status continuum
+OUTCOMES = {
+    0: 'failure',
+    1: 'success',
+}
+
+
+class StatusAggregates:
+    """Counts of accounts by outcome per label, kept from the status stream.
+
+    The last outcome of every account and label is remembered so an event
+    moves its account from the previous outcome to the new one, every event
+    is applied in O(1) and a summary costs O(labels).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # (acct_id, label) -> last outcome
+        self._outcomes: Dict[Tuple[str, str], int] = {}
+        # label -> outcome -> accounts
+        self._counts: Dict[str, Dict[int, int]] = {}
+        self._accounts: Set[str] = set()
+        # bumped on every change, lets readers skip unchanged summaries
+        self.sequence = 0
+
+    def on_status(self, acct_id: str, label: str, outcome: int):
+        key = (acct_id, label)
+
+        with self._lock:
+            previous = self._outcomes.get(key)
+
+            if previous == outcome:
+                return
+
+            counts = self._counts.setdefault(label, {})
+
+            if previous is not None:
+                counts[previous] -= 1
+
+            counts[outcome] = counts.get(outcome, 0) + 1
+            self._outcomes[key] = outcome
+            self._accounts.add(acct_id)
+            self.sequence += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'sequence': self.sequence,
+                'accounts': len(self._accounts),
+                'labels': {
+                    label: {
+                        OUTCOMES.get(outcome, str(outcome)): count
+                        for outcome, count in counts.items()
+                    }
+                    for label, counts in self._counts.items()
+                },
+            }
+
+
+aggregates = StatusAggregates()
@@ -1,6 +1,9 @@
+import asyncio
 import json
 from logging import Logger
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from replica_broadcast.aggregates import aggregates
 
 
 logger = Logger(__name__)
@@ -45,3 +48,25 @@ class BroadcastConsumer(AsyncWebsocketConsumer):
             'outcome': outcome
         }))
 
+
+class DashboardConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+
+        self.ticker = asyncio.create_task(self.tick())
+
+    async def disconnect(self, close_code):
+        self.ticker.cancel()
+
+    # push the aggregates at a fixed tick, only when they changed
+    async def tick(self):
+        sequence = None
+
+        while True:
+            if aggregates.sequence != sequence:
+                summary = aggregates.summary()
+                sequence = summary['sequence']
+
+                await self.send(text_data=json.dumps(summary))
+
+            await asyncio.sleep(settings.DASHBOARD_TICK)
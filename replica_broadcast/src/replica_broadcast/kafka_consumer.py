@@ -1,6 +1,9 @@
 import json
+import os
+import socket
 from logging import Logger
-from threading import Thread
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from confluent_kafka import KafkaError, KafkaException, Message
@@ -10,14 +13,12 @@ from confluent_kafka.schema_registry import SchemaRegistryClient
 from confluent_kafka.schema_registry.avro import AvroDeserializer
 from confluent_kafka.serialization import StringDeserializer
 from django.conf import settings
+from replica_broadcast.aggregates import aggregates
 
 
 logger = Logger(__name__)
 
 
-schema_registry_client = SchemaRegistryClient({
-    'url': settings.KAFKA_API.schema_registry.url,
-})
 schema_str = json.dumps({
     'type': 'record',
     'name': 'replica_status_continuum',
@@ -52,23 +53,83 @@ schema_str = json.dumps({
         }
     ]
 })
-avro_deserializer = AvroDeserializer(schema_registry_client, schema_str)
-string_deserializer = StringDeserializer('utf_8')
-consumer = DeserializingConsumer({
-    'bootstrap.servers': settings.KAFKA_API.bootstrap_servers,
-    'group.id': "replica_broadcast",
-    'auto.offset.reset': 'earliest',
-    'key.deserializer': string_deserializer,
-    'value.deserializer': avro_deserializer,
-})
+_avro_deserializer: Optional[AvroDeserializer] = None
+_deserializer_lock = Lock()
+
+
+def is_account_label(label: str) -> bool:
+    """Whether a status event reports on an account.
+
+    The other tables replicated next to the accounts label their events
+    ``<label>:<table>``, their keys are row IDs of those tables.
+    """
+    return ':' not in label
+
+
+def get_avro_deserializer() -> AvroDeserializer:
+    """Get the status value deserializer, creating it on first use."""
+    global _avro_deserializer
+
+    if _avro_deserializer is None:
+        with _deserializer_lock:
+            if _avro_deserializer is None:
+                _avro_deserializer = AvroDeserializer(SchemaRegistryClient({
+                    'url': settings.KAFKA_API.schema_registry.url,
+                }), schema_str)
+
+    return _avro_deserializer
+
+
+def create_consumer(config: dict) -> DeserializingConsumer:
+    return DeserializingConsumer({
+        **config,
+        'bootstrap.servers': settings.KAFKA_API.bootstrap_servers,
+        'key.deserializer': StringDeserializer('utf_8'),
+        'value.deserializer': get_avro_deserializer(),
+    })
+
+
+def broadcast_consumer() -> DeserializingConsumer:
+    return create_consumer({
+        'group.id': "replica_broadcast",
+        'auto.offset.reset': 'earliest',
+    })
+
+
+def aggregate_consumer() -> DeserializingConsumer:
+    # every process replays the whole status topic into its aggregates, the
+    # group is unique and never commits so it always starts from the
+    # beginning
+    return create_consumer({
+        'group.id': F'replica_broadcast_dashboard_{socket.gethostname()}_'
+            F'{os.getpid()}',
+        'auto.offset.reset': 'earliest',
+        'enable.auto.commit': False,
+    })
+
+
+# consumers are only created by their threads, once the server started, so
+# importing this module never connects to Kafka or the schema registry
+_stopping = Event()
+_threads: List[Thread] = []
+_assigned: Dict[str, bool] = {}
+_started = False
+_start_lock = Lock()
+
+
+def on_assign(name: str):
+    def assigned(consumer, partitions):
+        _assigned[name] = True
+
+    return assigned
 
 
 def consume_loop(consumer, topics):
     try:
-        consumer.subscribe(topics)
+        consumer.subscribe(topics, on_assign=on_assign('broadcast'))
         channel_layer = get_channel_layer()
 
-        while True:
+        while not _stopping.is_set():
             try:
                 msg: Message = consumer.poll(timeout=1.0)
             except ValueDeserializationError:
@@ -95,6 +156,9 @@ def consume_loop(consumer, topics):
 
                     value = msg.value()                    
 
+                    if not is_account_label(value['label']):
+                        continue
+
                     last_modified = None
                     
                     if value['updatedOn']:
@@ -123,5 +187,77 @@ def consume_loop(consumer, topics):
 
 def start_consumer():
     logger.info('Starting consumer')
-    Thread(target=consume_loop, args=(consumer, ["replica_status"])).start()
+    _assigned['broadcast'] = False
+    thread = Thread(target=lambda: consume_loop(broadcast_consumer(),
+        ["replica_status"]), name='broadcast_consumer')
+    _threads.append(thread)
+    thread.start()
+
+
+def aggregate_loop(consumer, topics):
+    try:
+        consumer.subscribe(topics, on_assign=on_assign('aggregator'))
+
+        while not _stopping.is_set():
+            try:
+                msg: Message = consumer.poll(timeout=1.0)
+            except ValueDeserializationError:
+                logger.warning("Message deserialization failed")
+                continue
+
+            if msg is None:
+                continue
+
+            if msg.error():
+                if msg.error().code() != KafkaError._PARTITION_EOF:
+                    raise KafkaException(msg.error())
+            else:
+                value = msg.value()
+
+                if is_account_label(value['label']):
+                    aggregates.on_status(msg.key(), value['label'],
+                        value['outcome'])
+    except Exception:
+        logger.fatal('Kafka aggregate loop exiting unexpectedly!!',
+            exc_info=True)
+    finally:
+        consumer.close()
+
+
+def start_aggregator():
+    logger.info('Starting aggregator')
+    _assigned['aggregator'] = False
+    thread = Thread(target=lambda: aggregate_loop(aggregate_consumer(),
+        ["replica_status"]), daemon=True, name='aggregate_consumer')
+    _threads.append(thread)
+    thread.start()
+
+
+def start_consumers():
+    """Start the consumer threads, at most once per process."""
+    global _started
+
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    start_consumer()
+    start_aggregator()
+
+
+def stop_consumers(timeout: float = 10.0):
+    """Stop the consumer threads, committing the broadcast offsets."""
+    _stopping.set()
+
+    for thread in _threads:
+        thread.join(timeout)
+
 
+def readiness() -> dict:
+    """Whether every consumer was assigned its partitions."""
+    return {
+        'ready': _started and not _stopping.is_set() and
+            all(_assigned.values()),
+        'consumers': dict(_assigned),
+    }
@@ -0,0 +1,58 @@
+import asyncio
+from logging import Logger
+from typing import Callable, List
+
+
+logger = Logger(__name__)
+
+
+class Lifespan:
+    """Run startup and shutdown hooks on the ASGI lifespan events.
+
+    The hooks are blocking callables run in the default executor. Servers
+    that do not send lifespan events (the channels runserver) get the
+    startup hooks run on their first connection instead.
+    """
+
+    def __init__(self, app, startup: List[Callable[[], None]] = (),
+        shutdown: List[Callable[[], None]] = ()):
+        self.app = app
+        self.startup = list(startup)
+        self.shutdown = list(shutdown)
+        self._started = False
+
+    async def run(self, hooks: List[Callable[[], None]]):
+        loop = asyncio.get_running_loop()
+
+        for hook in hooks:
+            await loop.run_in_executor(None, hook)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            if not self._started:
+                self._started = True
+                await self.run(self.startup)
+
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                self._started = True
+
+                try:
+                    await self.run(self.startup)
+                except Exception as e:
+                    logger.fatal('startup failed', exc_info=True)
+                    await send({ 'type': 'lifespan.startup.failed',
+                        'message': str(e) })
+                    return
+                await send({ 'type': 'lifespan.startup.complete' })
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self.run(self.shutdown)
+                except Exception:
+                    logger.error('shutdown failed', exc_info=True)
+                await send({ 'type': 'lifespan.shutdown.complete' })
+                return
@@ -1,7 +1,8 @@
 from django.urls import re_path
 
-from .consumers import BroadcastConsumer
+from .consumers import BroadcastConsumer, DashboardConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/broadcast/(?P<acct_id>\d+)/$', BroadcastConsumer.as_asgi()),
+    re_path(r'ws/broadcast/dashboard/$', DashboardConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -1,3 +1,37 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from replica_broadcast.aggregates import StatusAggregates
 
-# Create your tests here.
+
+class StatusAggregatesTest(SimpleTestCase):
+    def setUp(self):
+        self.aggregates = StatusAggregates()
+
+    def test_outcomes_move_between_counts(self):
+        self.aggregates.on_status('1', 'replica_src', 1)
+        self.aggregates.on_status('2', 'replica_src', 1)
+        self.aggregates.on_status('1', 'sink/db', 0)
+
+        summary = self.aggregates.summary()
+        self.assertEqual(summary['accounts'], 2)
+        self.assertEqual(summary['labels'], {
+            'replica_src': { 'success': 2 },
+            'sink/db': { 'failure': 1 },
+        })
+
+        self.aggregates.on_status('1', 'sink/db', 1)
+
+        self.assertEqual(self.aggregates.summary()['labels']['sink/db'], {
+            'failure': 0,
+            'success': 1,
+        })
+
+    def test_repeated_outcome_keeps_sequence(self):
+        self.aggregates.on_status('1', 'replica_src', 1)
+        sequence = self.aggregates.sequence
+
+        self.aggregates.on_status('1', 'replica_src', 1)
+        self.assertEqual(self.aggregates.sequence, sequence)
+
+        self.aggregates.on_status('1', 'replica_src', 0)
+        self.assertEqual(self.aggregates.sequence, sequence + 1)
+        self.assertEqual(self.aggregates.summary()['sequence'], sequence + 1)
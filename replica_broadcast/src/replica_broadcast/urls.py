@@ -14,9 +14,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path
-from .views import index, room
+from .views import index, live, ready, room, summary
 
 urlpatterns = [
     path('', index, name='index'),
+    path('summary/', summary, name='summary'),
+    path('health/live/', live, name='live'),
+    path('health/ready/', ready, name='ready'),
     path('<int:room_name>/', room, name='room'),
 ]
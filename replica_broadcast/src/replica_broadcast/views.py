@@ -1,4 +1,7 @@
+from django.http import JsonResponse
 from django.shortcuts import render
+from replica_broadcast.aggregates import aggregates
+from replica_broadcast.kafka_consumer import readiness
 
 def index(request):
     return render(request, 'index.html', {})
@@ -7,3 +10,13 @@ def room(request, room_name):
     return render(request, 'room.html', {
         'room_name': room_name
     })
+
+def summary(request):
+    return JsonResponse(aggregates.summary())
+
+def live(request):
+    return JsonResponse({ 'live': True })
+
+def ready(request):
+    status = readiness()
+    return JsonResponse(status, status=200 if status['ready'] else 503)